@@ -0,0 +1,187 @@
+import argparse
+import sqlite3
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import db
+import dose_schedule
+from reminders import OVERDUE_AFTER_DAYS
+
+# Triggers from migration 9 keep hospital_coverage current on every write, and those
+# from migration 10 keep vaccine_coverage current on every change to due_doses. What
+# they cannot see is the calendar: as days pass, appointments and doses fall overdue
+# and catch-up windows close. roll_over() applies just that change.
+
+
+@dataclass(frozen=True)
+class CoverageRow:
+    vaccine_id: int
+    vaccine_name: str
+    scheduled: int
+    administered: int
+    cancelled: int
+    paid: int
+    overdue_appointments: int
+    overdue_children: int
+
+
+HOSPITAL_COUNTS_SQL = """
+    SELECT vr.hospital_id, vr.vaccine_id,
+           SUM(vr.status IS 'Scheduled'), SUM(vr.status IS 'Administered'), SUM(vr.status IS 'Cancelled'),
+           SUM(IFNULL(p.status IN ('Paid', 'Settled'), 0)), SUM(IFNULL(vr.status IS 'Scheduled' AND vr.date_administered < ?, 0))
+    FROM vaccine_records vr
+    LEFT JOIN payments p ON p.vaccine_record_id = vr.id
+    GROUP BY vr.hospital_id, vr.vaccine_id
+"""
+
+# A child is overdue for the next unbooked dose of each series (see dose_schedule.due_dates)
+# from OVERDUE_AFTER_DAYS past its due date until its catch-up window closes
+DUE_COUNTS_SQL = """
+    SELECT vaccine_id, COUNT(*) FROM due_doses
+    WHERE due_date <= ? AND (expires IS NULL OR expires >= ?)
+    GROUP BY vaccine_id
+"""
+
+# Per vaccine, overdue now minus overdue then, over the doses whose due date or expiry
+# lies between the two clocks; every other dose is on the same side of both
+DUE_CHANGES_SQL = """
+    SELECT vaccine_id, SUM(due_date <= ? AND IFNULL(expires >= ?, 1)) - SUM(due_date <= ? AND IFNULL(expires >= ?, 1))
+    FROM due_doses
+    WHERE due_date > ? AND due_date <= ? OR expires >= ? AND expires < ?
+    GROUP BY vaccine_id
+"""
+
+
+def _today():
+    return datetime.now().date()
+
+
+def due_by(today):
+    return (today - timedelta(days=OVERDUE_AFTER_DAYS)).isoformat()
+
+
+def rebuild_hospitals(conn, today=None):
+    # Migration 9 step: vaccine_coverage is fed by due_doses, which migration 10 adds
+    today = today or _today()
+    as_of = today.isoformat()
+    conn.execute("INSERT INTO coverage_clock (id, as_of) VALUES (1, ?) ON CONFLICT(id) DO UPDATE SET as_of = excluded.as_of",
+                 (as_of,))
+    conn.execute("DELETE FROM hospital_coverage")
+    conn.execute("INSERT INTO hospital_coverage (hospital_id, vaccine_id, scheduled, administered, cancelled, paid, overdue) "
+                 + HOSPITAL_COUNTS_SQL, (as_of,))
+
+
+def rebuild(conn, today=None):
+    """Recompute every counter from scratch; used by the migration and to repair drift."""
+    today = today or _today()
+    rebuild_hospitals(conn, today)
+    conn.execute("UPDATE coverage_clock SET due_by = ? WHERE id = 1", (due_by(today),))
+    conn.execute("DELETE FROM vaccine_coverage")
+    conn.execute("INSERT INTO vaccine_coverage (vaccine_id, overdue) " + DUE_COUNTS_SQL, (due_by(today), today.isoformat()))
+
+
+def _roll_over(cursor, today):
+    cursor.execute("SELECT as_of, due_by FROM coverage_clock WHERE id = 1")
+    row = cursor.fetchone()
+    as_of = today.isoformat()
+    if row is None:
+        rebuild(cursor.connection, today)
+        return True
+    # Scheduled appointments dated between the old and new clock change overdue state
+    low, high, op = (row[0], as_of, "+") if row[0] < as_of else (as_of, row[0], "-")
+    cursor.execute(f"""
+        UPDATE hospital_coverage SET overdue = overdue {op} d.n
+        FROM (
+            SELECT hospital_id, vaccine_id, COUNT(*) AS n FROM vaccine_records
+            WHERE status = 'Scheduled' AND date_administered >= ? AND date_administered < ?
+            GROUP BY hospital_id, vaccine_id
+        ) d
+        WHERE hospital_coverage.hospital_id = d.hospital_id AND hospital_coverage.vaccine_id = d.vaccine_id
+    """, (low, high))
+    old_as_of, old_by, new_by = row[0], row[1], due_by(today)
+    cursor.execute(DUE_CHANGES_SQL, (new_by, as_of, old_by, old_as_of, min(old_by, new_by), max(old_by, new_by),
+                                     min(old_as_of, as_of), max(old_as_of, as_of)))
+    changes = [change for change in cursor.fetchall() if change[1]]
+    cursor.executemany("""
+        INSERT INTO vaccine_coverage (vaccine_id, overdue) VALUES (?, ?)
+        ON CONFLICT(vaccine_id) DO UPDATE SET overdue = overdue + excluded.overdue
+    """, changes)
+    cursor.execute("UPDATE coverage_clock SET as_of = ?, due_by = ? WHERE id = 1", (as_of, new_by))
+    return True
+
+
+def roll_over(today=None):
+    """Advance the counters to today. Cheap and idempotent: a no-op once already run today."""
+    today = today or _today()
+    # vaccine_coverage follows due_doses, which only catches up with recent writes here
+    dose_schedule.flush()
+    row = db.query_one("SELECT as_of FROM coverage_clock WHERE id = 1")
+    if row is not None and row[0] == today.isoformat():
+        return False
+    with db.immediate() as cursor:
+        return _roll_over(cursor, today)
+
+
+def hospital_summary(hospital_id):
+    return [CoverageRow(*row) for row in db.query_all("""
+        SELECT v.id, v.name, IFNULL(h.scheduled, 0), IFNULL(h.administered, 0), IFNULL(h.cancelled, 0),
+               IFNULL(h.paid, 0), IFNULL(h.overdue, 0), IFNULL(vc.overdue, 0)
+        FROM vaccines v
+        LEFT JOIN hospital_coverage h ON h.vaccine_id = v.id AND h.hospital_id = ?
+        LEFT JOIN vaccine_coverage vc ON vc.vaccine_id = v.id
+        ORDER BY v.age_months, v.id
+    """, (hospital_id,))]
+
+
+def verify(conn):
+    """Return the (table, key, stored, expected) rows where the counters disagree with a full recount."""
+    as_of, cutoff = conn.execute("SELECT as_of, due_by FROM coverage_clock WHERE id = 1").fetchone()
+    expected = {(h, v): tuple(counts) for h, v, *counts in conn.execute(HOSPITAL_COUNTS_SQL, (as_of,))}
+    stored = {(h, v): tuple(counts) for h, v, *counts in conn.execute(
+        "SELECT hospital_id, vaccine_id, scheduled, administered, cancelled, paid, overdue FROM hospital_coverage")}
+    zero = (0, 0, 0, 0, 0)
+    problems = [("hospital_coverage", key, stored.get(key, zero), expected.get(key, zero))
+                for key in expected.keys() | stored.keys() if stored.get(key, zero) != expected.get(key, zero)]
+    expected = dict(conn.execute(DUE_COUNTS_SQL, (cutoff, as_of)).fetchall())
+    stored = dict(conn.execute("SELECT vaccine_id, overdue FROM vaccine_coverage").fetchall())
+    problems.extend(("vaccine_coverage", key, stored.get(key, 0), expected.get(key, 0))
+                    for key in expected.keys() | stored.keys() if stored.get(key, 0) != expected.get(key, 0))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the trigger-fed coverage counters.")
+    parser.add_argument("command", choices=("roll-over", "rebuild", "verify"),
+                        help="roll-over: advance to today (run daily); rebuild: recount everything; "
+                             "verify: compare the counters with a full recount")
+    parser.add_argument("--db", default=db.DB_PATH, help="database file")
+    args = parser.parse_args(argv)
+
+    import migrations
+
+    db.configure(args.db)
+    try:
+        migrations.migrate()
+        if args.command == "roll-over":
+            print("Rolled over" if roll_over() else "Already current")
+        elif args.command == "rebuild":
+            with db.immediate() as cursor:
+                rebuild(cursor.connection)
+            print("Rebuilt")
+        else:
+            problems = verify(db.connection())
+            for problem in problems:
+                print("%s %s: stored %s, expected %s" % problem)
+            print(f"{len(problems)} mismatches")
+            return 1 if problems else 0
+    except sqlite3.Error as e:
+        print(f"Coverage maintenance failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
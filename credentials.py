@@ -0,0 +1,205 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import repository
+
+# Work factors for new hashes; hashes made with other settings are upgraded on the next login
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600000
+ALGORITHM = "scrypt" if hasattr(hashlib, "scrypt") else "pbkdf2_sha256"
+
+SESSION_TTL_SECONDS = 8 * 60 * 60
+SESSION_CACHE_SIZE = 256
+# Accounts hashed per transaction when upgrading plaintext passwords in the background
+REHASH_BATCH_SIZE = 20
+
+
+def configure(algorithm=None, scrypt_n=None, pbkdf2_iterations=None):
+    global ALGORITHM, SCRYPT_N, PBKDF2_ITERATIONS
+    if algorithm is not None:
+        ALGORITHM = algorithm
+    if scrypt_n is not None:
+        SCRYPT_N = scrypt_n
+    if pbkdf2_iterations is not None:
+        PBKDF2_ITERATIONS = pbkdf2_iterations
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 2 ** 20, dklen=32)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+
+
+def hash_password(password):
+    salt = os.urandom(16)
+    if ALGORITHM == "scrypt":
+        digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+    digest = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+
+
+def is_hashed(stored):
+    return isinstance(stored, str) and stored.startswith(("scrypt$", "pbkdf2_sha256$"))
+
+
+def verify_password(password, stored):
+    """Return (matches, needs_rehash) for a stored hash or a legacy plaintext value."""
+    if stored is None:
+        return False, False
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode("utf-8"), str(stored).encode("utf-8")), True
+    parts = stored.split("$")
+    try:
+        if parts[0] == "scrypt":
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            salt, expected = base64.b64decode(parts[4]), base64.b64decode(parts[5])
+            matches = hmac.compare_digest(_scrypt(password, salt, n, r, p), expected)
+            current = ALGORITHM == "scrypt" and (n, r, p) == (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        else:
+            iterations = int(parts[1])
+            salt, expected = base64.b64decode(parts[2]), base64.b64decode(parts[3])
+            matches = hmac.compare_digest(_pbkdf2(password, salt, iterations), expected)
+            current = ALGORITHM == "pbkdf2_sha256" and iterations == PBKDF2_ITERATIONS
+    except (IndexError, ValueError):
+        return False, False
+    return matches, matches and not current
+
+
+class SessionCache:
+    """Remembers recently verified logins so a shift's re-logins skip the KDF.
+
+    Entries hold a keyed HMAC of the password, never the password itself,
+    and expire after ``ttl`` seconds; the least recently used entry is
+    dropped once ``max_size`` is reached.
+    """
+
+    def __init__(self, ttl=SESSION_TTL_SECONDS, max_size=SESSION_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.key = os.urandom(32)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _digest(self, password):
+        return hmac.new(self.key, password.encode("utf-8"), hashlib.sha256).digest()
+
+    def get(self, role, username, password):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get((role, username))
+            if entry is not None and entry[2] <= now:
+                del self.entries[(role, username)]
+                entry = None
+            if entry is None or not hmac.compare_digest(entry[0], self._digest(password)):
+                self.misses += 1
+                return None
+            self.entries.move_to_end((role, username))
+            self.hits += 1
+            return entry[1]
+
+    def put(self, role, username, password, user):
+        with self.lock:
+            self.entries[(role, username)] = (self._digest(password), user, time.monotonic() + self.ttl)
+            self.entries.move_to_end((role, username))
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, role=None, username=None):
+        with self.lock:
+            if role is None:
+                self.entries.clear()
+            else:
+                self.entries.pop((role, username), None)
+
+
+sessions = SessionCache()
+
+
+def authenticate(role, username, password):
+    user = sessions.get(role, username, password)
+    if user is not None:
+        return user
+    user = repository.find_user(role, username)
+    if user is None:
+        return None
+    matches, needs_rehash = verify_password(password, user[repository.PASSWORD_COLUMNS[role]])
+    if not matches:
+        return None
+    if needs_rehash:
+        repository.update_password(role, user[0], hash_password(password))
+        user = repository.find_user(role, username)
+    sessions.put(role, username, password, user)
+    return user
+
+
+def hash_plaintext_passwords(batch_size=REHASH_BATCH_SIZE):
+    """Hash passwords stored before hashing was introduced; returns how many were upgraded.
+
+    Each batch is hashed outside any transaction and written in a short one, so this
+    can run on a background thread next to the app (authenticate() also upgrades an
+    account when it logs in first).
+    """
+    upgraded = 0
+    for role in repository.USER_TABLES:
+        after_id = 0
+        while True:
+            rows = repository.plaintext_passwords(role, after_id, batch_size)
+            if not rows:
+                break
+            repository.replace_plaintext_passwords(
+                role, [(hash_password(password), user_id, password) for user_id, password in rows])
+            upgraded += len(rows)
+            after_id = rows[-1][0]
+    return upgraded
+
+
+def benchmark(rounds=5):
+    settings = [("scrypt", {"scrypt_n": n}) for n in (2 ** 12, 2 ** 13, 2 ** 14, 2 ** 15)]
+    settings += [("pbkdf2_sha256", {"pbkdf2_iterations": i}) for i in (100000, 300000, 600000)]
+    saved = (ALGORITHM, SCRYPT_N, PBKDF2_ITERATIONS)
+    print(f"{'algorithm':<15}{'work factor':>12}{'hash ms':>10}{'verify ms':>11}")
+    try:
+        for algorithm, factor in settings:
+            if algorithm == "scrypt" and not hasattr(hashlib, "scrypt"):
+                continue
+            configure(algorithm=algorithm, **factor)
+            started = time.perf_counter()
+            stored = [hash_password("benchmark") for _ in range(rounds)]
+            hash_ms = (time.perf_counter() - started) * 1000 / rounds
+            started = time.perf_counter()
+            for value in stored:
+                verify_password("benchmark", value)
+            verify_ms = (time.perf_counter() - started) * 1000 / rounds
+            print(f"{algorithm:<15}{list(factor.values())[0]:>12}{hash_ms:>10.1f}{verify_ms:>11.1f}")
+    finally:
+        configure(*saved)
+
+    cache = SessionCache()
+    cache.put("Parent", "benchmark", "benchmark", (1,))
+    started = time.perf_counter()
+    for _ in range(10000):
+        cache.get("Parent", "benchmark", "benchmark")
+    print(f"{'session cache hit':<27}{(time.perf_counter() - started) * 1000 / 10000:>10.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure password hashing cost per login.")
+    parser.add_argument("--rounds", type=int, default=5)
+    benchmark(parser.parse_args().rounds)
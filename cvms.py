@@ -1,94 +1,43 @@
 import sqlite3
 import tkinter as tk
 from tkinter import ttk, messagebox
-from datetime import datetime
-from PIL import Image, ImageTk
 import os
+import threading
+from datetime import datetime, timedelta
+import db
+from images import ImageCache
+import ledger
+import migrations
+import profiling
+import search
+import services
+from services import ServiceError
+from tasks import TaskRunner
+from widgets import PagedTreeview
 
 # Database Setup
 def initialize_database():
     try:
-        conn = sqlite3.connect("vaccination_system.db")
-        cursor = conn.cursor()
-        
-        # Create tables
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS parents (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE,
-                password TEXT,
-                name TEXT,
-                contact TEXT
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS children (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                parent_id INTEGER,
-                name TEXT,
-                dob TEXT,
-                FOREIGN KEY (parent_id) REFERENCES parents(id)
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS hospitals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT,
-                username TEXT UNIQUE,
-                password TEXT
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS health_workers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                hospital_id INTEGER,
-                name TEXT,
-                username TEXT UNIQUE,
-                password TEXT,
-                FOREIGN KEY (hospital_id) REFERENCES hospitals(id)
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS vaccines (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT,
-                age_months INTEGER
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS vaccine_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                child_id INTEGER,
-                vaccine_id INTEGER,
-                hospital_id INTEGER,
-                health_worker_id INTEGER,
-                date_administered TEXT,
-                status TEXT,
-                FOREIGN KEY (child_id) REFERENCES children(id),
-                FOREIGN KEY (vaccine_id) REFERENCES vaccines(id),
-                FOREIGN KEY (hospital_id) REFERENCES hospitals(id),
-                FOREIGN KEY (health_worker_id) REFERENCES health_workers(id)
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS payments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                vaccine_record_id INTEGER,
-                amount REAL,
-                status TEXT,
-                date_paid TEXT,
-                FOREIGN KEY (vaccine_record_id) REFERENCES vaccine_records(id)
-            )
-        """)
-        
-        # Insert sample vaccines
-        cursor.execute("INSERT OR IGNORE INTO vaccines (name, age_months) VALUES ('DTP', 2)")
-        cursor.execute("INSERT OR IGNORE INTO vaccines (name, age_months) VALUES ('Measles', 9)")
-        conn.commit()
+        # A single PRAGMA read once the schema is current; migrations only run on upgrade
+        conn = db.connection()
+        if not migrations.is_current(conn):
+            migrations.migrate(conn)
     except sqlite3.Error as e:
         messagebox.showerror("Database Error", f"Failed to initialize database: {str(e)}")
-    finally:
-        conn.close()
+
+BACKGROUND_IMAGE = "vaccine2.jpg"
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+RESIZE_DEBOUNCE_MS = 150
+# Search-as-you-type queries once typing pauses this long
+SEARCH_DEBOUNCE_MS = 250
+# Scanned doses are saved together once scanning pauses, or when the batch fills up
+DOSE_FLUSH_MS = 2000
+DOSE_FLUSH_SIZE = 25
+
+
+def clear_entries(*entries):
+    for entry in entries:
+        entry.delete(0, tk.END)
 
 # Main Application Class
 class VaccinationSystemApp:
@@ -103,106 +52,237 @@ class VaccinationSystemApp:
             return
         self.current_user = None
         self.user_role = None
-        self.background_image = None
+        self.tasks = TaskRunner(root)
+        self.images = ImageCache()
+        self.background_image = tk.Label(self.root)
+        self.background_image.place(x=0, y=0, relwidth=1, relheight=1)
+        self.background_path = None
+        self.photo = None
+        self.photo_size = None
+        self.resize_job = None
+        self.screens = {}
+        self.current_screen = None
+        self.transient_widgets = []
+        self.root.bind("<Configure>", self.on_resize)
+        if profiling.enabled():
+            self.root.bind("<F12>", lambda event: profiling.show_panel(self.root))
         self.show_login_screen()
+        self.root.after_idle(self.warm_up)
+
+    def warm_up(self):
+        # Queued behind the first paint of the login form; a failure here is not worth
+        # a dialog, the screen that needs the data reports it
+        self.tasks.submit(services.warm_up, on_error=lambda e: None)
+        # Minutes of KDF work on an old database; a daemon thread, so closing the app does not wait for it
+        threading.Thread(target=self.hash_plaintext_passwords, name="cvms-rehash", daemon=True).start()
+
+    @staticmethod
+    def hash_plaintext_passwords():
+        try:
+            services.hash_plaintext_passwords()
+        except ServiceError:
+            pass  # each account is still upgraded when it next logs in
+        finally:
+            db.get_pool().release()
 
     def clear_screen(self):
-        for widget in self.root.winfo_children():
+        # Results of work started for the previous screen are dropped
+        self.tasks.cancel_all()
+        for widget in self.transient_widgets:
             widget.destroy()
-        self.background_image = None
+        self.transient_widgets = []
+        if self.current_screen is not None:
+            if self.current_screen in self.screens.values():
+                self.current_screen.place_forget()
+            else:
+                self.current_screen.destroy()
+            self.current_screen = None
+
+    def open_screen(self, name=None):
+        # Named screens are built once and shown again on later visits (screen.reused);
+        # unnamed ones hold live data and are rebuilt every time
+        self.clear_screen()
+        self.set_background(BACKGROUND_IMAGE)
+        screen = self.screens.get(name)
+        if screen is None:
+            screen = tk.Frame(self.root, bg="white")
+            screen.reused = False
+            if name is not None:
+                self.screens[name] = screen
+        else:
+            screen.reused = True
+        screen.place(relx=0.5, y=0, anchor=tk.N)
+        self.current_screen = screen
+        return screen
+
+    def logout(self):
+        # Dashboards and forms carry the previous user's name and input
+        for name in [n for n in self.screens if n not in ("login", "register")]:
+            screen = self.screens.pop(name)
+            if screen is not self.current_screen:
+                screen.destroy()
+        self.current_user = None
+        self.user_role = None
+        self.show_login_screen()
+
+    def run_task(self, work, *args, on_success=None, error_message="Operation failed"):
+        loading = tk.Label(self.root, text="Loading...", fg="gray", bg="white")
+        loading.place(relx=0.5, rely=1.0, anchor=tk.S)
+        self.transient_widgets.append(loading)
+
+        def on_error(e):
+            if isinstance(e, ServiceError):
+                messagebox.showerror(e.title, e.message)
+            elif isinstance(e, sqlite3.Error):
+                messagebox.showerror("Database Error", f"{error_message}: {str(e)}")
+            else:
+                messagebox.showerror("Error", f"{error_message}: {str(e)}")
+
+        return self.tasks.submit(work, *args, on_success=on_success, on_error=on_error, on_done=loading.destroy)
+
+    def bind_search(self, entry, show_matches):
+        job = [None]
+
+        def run():
+            job[0] = None
+            if not entry.winfo_exists():
+                return
+            text = entry.get()
+            # Results for text that has changed since are dropped; a newer search is on its way
+            self.run_task(services.search_children, self.current_user, text,
+                          on_success=lambda matches: entry.winfo_exists() and entry.get() == text and show_matches(matches),
+                          error_message="Search failed")
+
+        def typed(event):
+            if job[0] is not None:
+                self.root.after_cancel(job[0])
+            job[0] = self.root.after(SEARCH_DEBOUNCE_MS, run)
+
+        entry.bind("<KeyRelease>", typed)
+
+    def window_size(self):
+        width, height = self.root.winfo_width(), self.root.winfo_height()
+        if width <= 1 or height <= 1:
+            return 800, 600
+        return width, height
 
     def set_background(self, image_name):
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        image_path = os.path.join(script_dir, "assets", image_name)
-        try:
-            img = Image.open(image_path)
-            img = img.resize((800, 600), Image.Resampling.LANCZOS)
-            self.photo = ImageTk.PhotoImage(img)
-            self.background_image = tk.Label(self.root, image=self.photo)
-            self.background_image.place(x=0, y=0, relwidth=1, relheight=1)
-        except FileNotFoundError:
-            messagebox.showerror("Error", f"Image file not found: {image_path}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load image: {str(e)}")
+        image_path = os.path.join(ASSETS_DIR, image_name)
+        size = self.window_size()
+        if image_path == self.background_path and self.photo_size == size:
+            return
+        self.background_path = image_path
+
+        photo = self.images.cached_photo(image_path, size)
+        if photo is not None:
+            self.show_background(photo, size)
+            return
+
+        def show_image(_):
+            if image_path == self.background_path:
+                self.show_background(self.images.photo(image_path, size), size)
+
+        def on_error(e):
+            self.background_path = None
+            if isinstance(e, FileNotFoundError):
+                messagebox.showerror("Error", f"Image file not found: {image_path}")
+            else:
+                messagebox.showerror("Error", f"Failed to load image: {str(e)}")
+
+        # Decode and resample off the Tk thread; only the PhotoImage is built here
+        self.tasks.submit(self.images.scaled, image_path, size, on_success=show_image, on_error=on_error)
+
+    def show_background(self, photo, size):
+        self.photo = photo
+        self.photo_size = size
+        self.background_image.configure(image=photo)
+        self.background_image.lower()
+
+    def on_resize(self, event):
+        if event.widget is not self.root:
+            return
+        if self.resize_job is not None:
+            self.root.after_cancel(self.resize_job)
+        self.resize_job = self.root.after(RESIZE_DEBOUNCE_MS, self.rescale_background)
+
+    def rescale_background(self):
+        self.resize_job = None
+        if self.background_path is not None:
+            self.set_background(os.path.basename(self.background_path))
 
     def show_login_screen(self):
-        self.clear_screen()
-        self.set_background("assets/vaccine2.jpg")
-        tk.Label(self.root, text="Child Vaccination Management System", font=("Arial", 16), bg="white").pack(pady=10)
-        tk.Label(self.root, text="Login", font=("Arial", 14), bg="white").pack(pady=10)
+        screen = self.open_screen("login")
+        if screen.reused:
+            clear_entries(self.username_entry, self.password_entry)
+            return
+        tk.Label(screen, text="Child Vaccination Management System", font=("Arial", 16), bg="white").pack(pady=10)
+        tk.Label(screen, text="Login", font=("Arial", 14), bg="white").pack(pady=10)
 
-        tk.Label(self.root, text="Role", bg="white").pack()
+        tk.Label(screen, text="Role", bg="white").pack()
         self.role_var = tk.StringVar(value="Parent")
-        tk.Radiobutton(self.root, text="Parent", variable=self.role_var, value="Parent", bg="white").pack()
-        tk.Radiobutton(self.root, text="Hospital", variable=self.role_var, value="Hospital", bg="white").pack()
-        tk.Radiobutton(self.root, text="Health Worker", variable=self.role_var, value="HealthWorker", bg="white").pack()
+        tk.Radiobutton(screen, text="Parent", variable=self.role_var, value="Parent", bg="white").pack()
+        tk.Radiobutton(screen, text="Hospital", variable=self.role_var, value="Hospital", bg="white").pack()
+        tk.Radiobutton(screen, text="Health Worker", variable=self.role_var, value="HealthWorker", bg="white").pack()
 
-        tk.Label(self.root, text="Username", bg="white").pack()
-        self.username_entry = tk.Entry(self.root)
+        tk.Label(screen, text="Username", bg="white").pack()
+        self.username_entry = tk.Entry(screen)
         self.username_entry.pack()
 
-        tk.Label(self.root, text="Password", bg="white").pack()
-        self.password_entry = tk.Entry(self.root, show="*")
+        tk.Label(screen, text="Password", bg="white").pack()
+        self.password_entry = tk.Entry(screen, show="*")
         self.password_entry.pack()
 
-        tk.Button(self.root, text="Login", command=self.login, bg="#4CAF50", fg="white").pack(pady=10)
-        tk.Button(self.root, text="Register (Parent/Hospital)", command=self.show_register_screen, bg="#4a90e2", fg="white").pack()
+        tk.Button(screen, text="Login", command=self.login, bg="#4CAF50", fg="white").pack(pady=10)
+        tk.Button(screen, text="Register (Parent/Hospital)", command=self.show_register_screen, bg="#4a90e2", fg="white").pack()
 
     def show_register_screen(self):
-        self.clear_screen()
-        self.set_background("assets/vaccine2.jpg")
-        tk.Label(self.root, text="Register", font=("Arial", 14), bg="white").pack(pady=10)
+        screen = self.open_screen("register")
+        if screen.reused:
+            clear_entries(self.reg_username_entry, self.reg_password_entry, self.reg_name_entry, self.reg_contact_entry)
+            return
+        tk.Label(screen, text="Register", font=("Arial", 14), bg="white").pack(pady=10)
 
-        tk.Label(self.root, text="Role", bg="white").pack()
+        tk.Label(screen, text="Role", bg="white").pack()
         self.reg_role_var = tk.StringVar(value="Parent")
-        tk.Radiobutton(self.root, text="Parent", variable=self.reg_role_var, value="Parent", bg="white").pack()
-        tk.Radiobutton(self.root, text="Hospital", variable=self.reg_role_var, value="Hospital", bg="white").pack()
+        tk.Radiobutton(screen, text="Parent", variable=self.reg_role_var, value="Parent", bg="white").pack()
+        tk.Radiobutton(screen, text="Hospital", variable=self.reg_role_var, value="Hospital", bg="white").pack()
 
-        tk.Label(self.root, text="Username", bg="white").pack()
-        self.reg_username_entry = tk.Entry(self.root)
+        tk.Label(screen, text="Username", bg="white").pack()
+        self.reg_username_entry = tk.Entry(screen)
         self.reg_username_entry.pack()
 
-        tk.Label(self.root, text="Password", bg="white").pack()
-        self.reg_password_entry = tk.Entry(self.root, show="*")
+        tk.Label(screen, text="Password", bg="white").pack()
+        self.reg_password_entry = tk.Entry(screen, show="*")
         self.reg_password_entry.pack()
 
-        tk.Label(self.root, text="Name", bg="white").pack()
-        self.reg_name_entry = tk.Entry(self.root)
+        tk.Label(screen, text="Name", bg="white").pack()
+        self.reg_name_entry = tk.Entry(screen)
         self.reg_name_entry.pack()
 
-        tk.Label(self.root, text="Contact (for Parents only)", bg="white").pack()
-        self.reg_contact_entry = tk.Entry(self.root)
+        tk.Label(screen, text="Contact (for Parents only)", bg="white").pack()
+        self.reg_contact_entry = tk.Entry(screen)
         self.reg_contact_entry.pack()
 
-        tk.Button(self.root, text="Register", command=self.register, bg="#4CAF50", fg="white").pack(pady=10)
-        tk.Button(self.root, text="Back to Login", command=self.show_login_screen, bg="#4a90e2", fg="white").pack()
+        tk.Button(screen, text="Register", command=self.register, bg="#4CAF50", fg="white").pack(pady=10)
+        tk.Button(screen, text="Back to Login", command=self.show_login_screen, bg="#4a90e2", fg="white").pack()
 
     def login(self):
         username = self.username_entry.get()
         password = self.password_entry.get()
         role = self.role_var.get()
 
-        try:
-            conn = sqlite3.connect("vaccination_system.db")
-            cursor = conn.cursor()
-            table = {"Parent": "parents", "Hospital": "hospitals", "HealthWorker": "health_workers"}[role]
-            cursor.execute(f"SELECT * FROM {table} WHERE username = ? AND password = ?", (username, password))
-            user = cursor.fetchone()
-            conn.close()
-
-            if user:
-                self.current_user = user
-                self.user_role = role
-                if role == "Parent":
-                    self.show_parent_dashboard()
-                elif role == "Hospital":
-                    self.show_hospital_dashboard()
-                else:
-                    self.show_health_worker_dashboard()
+        def on_user(user):
+            self.current_user = user
+            self.user_role = role
+            if role == "Parent":
+                self.show_parent_dashboard()
+            elif role == "Hospital":
+                self.show_hospital_dashboard()
             else:
-                messagebox.showerror("Error", "Invalid username or password")
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Login failed: {str(e)}")
+                self.show_health_worker_dashboard()
+
+        self.run_task(services.login, services.LoginRequest(role, username, password), on_success=on_user,
+                      error_message="Login failed")
 
     def register(self):
         role = self.reg_role_var.get()
@@ -212,112 +292,108 @@ class VaccinationSystemApp:
         contact = self.reg_contact_entry.get() if role == "Parent" else None
 
         try:
-            conn = sqlite3.connect("vaccination_system.db")
-            cursor = conn.cursor()
-            if role == "Parent":
-                cursor.execute("INSERT INTO parents (username, password, name, contact) VALUES (?, ?, ?, ?)",
-                               (username, password, name, contact))
-            else:  # Hospital
-                cursor.execute("INSERT INTO hospitals (username, password, name) VALUES (?, ?, ?)",
-                               (username, password, name))
-            conn.commit()
+            services.register(services.RegisterRequest(role, username, password, name, contact))
             messagebox.showinfo("Success", "Registration successful")
             self.show_login_screen()
-        except sqlite3.IntegrityError:
-            messagebox.showerror("Error", "Username already exists")
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Registration failed: {str(e)}")
-        finally:
-            conn.close()
+        except ServiceError as e:
+            messagebox.showerror(e.title, e.message)
 
     def show_parent_dashboard(self):
-        self.clear_screen()
-        self.set_background("assets/vaccine2.jpg")
-        tk.Label(self.root, text=f"Welcome, {self.current_user[3]} (Parent)", font=("Arial", 14), bg="white").pack(pady=10)
+        screen = self.open_screen("parent_dashboard")
+        if screen.reused:
+            return
+        tk.Label(screen, text=f"Welcome, {self.current_user.name} (Parent)", font=("Arial", 14), bg="white").pack(pady=10)
 
-        tk.Button(self.root, text="Add Child", command=self.add_child, bg="#4CAF50", fg="white").pack(pady=5)
-        tk.Button(self.root, text="View Children & Book Appointment", command=self.view_children, bg="#4CAF50", fg="white").pack(pady=5)
-        tk.Button(self.root, text="View Appointments & Pay", command=self.view_appointments, bg="#4CAF50", fg="white").pack(pady=5)
-        tk.Button(self.root, text="View Reminders", command=self.view_reminders, bg="#4CAF50", fg="white").pack(pady=5)
-        tk.Button(self.root, text="Logout", command=self.show_login_screen, bg="#4a90e2", fg="white").pack(pady=5)
+        tk.Button(screen, text="Add Child", command=self.add_child, bg="#4CAF50", fg="white").pack(pady=5)
+        tk.Button(screen, text="View Children & Book Appointment", command=self.view_children, bg="#4CAF50", fg="white").pack(pady=5)
+        tk.Button(screen, text="View Appointments & Pay", command=self.view_appointments, bg="#4CAF50", fg="white").pack(pady=5)
+        tk.Button(screen, text="View Reminders", command=self.view_reminders, bg="#4CAF50", fg="white").pack(pady=5)
+        tk.Button(screen, text="Logout", command=self.logout, bg="#4a90e2", fg="white").pack(pady=5)
 
     def add_child(self):
-        self.clear_screen()
-        self.set_background("assets/vaccine2.jpg")
-        tk.Label(self.root, text="Add Child", font=("Arial", 14), bg="white").pack(pady=10)
+        screen = self.open_screen("add_child")
+        if screen.reused:
+            clear_entries(self.child_name_entry, self.dob_entry)
+            return
+        tk.Label(screen, text="Add Child", font=("Arial", 14), bg="white").pack(pady=10)
 
-        tk.Label(self.root, text="Child Name", bg="white").pack()
-        self.child_name_entry = tk.Entry(self.root)
+        tk.Label(screen, text="Child Name", bg="white").pack()
+        self.child_name_entry = tk.Entry(screen)
         self.child_name_entry.pack()
 
-        tk.Label(self.root, text="Date of Birth (YYYY-MM-DD)", bg="white").pack()
-        self.dob_entry = tk.Entry(self.root)
+        tk.Label(screen, text="Date of Birth (YYYY-MM-DD)", bg="white").pack()
+        self.dob_entry = tk.Entry(screen)
         self.dob_entry.pack()
 
-        tk.Button(self.root, text="Add Child", command=self.save_child, bg="#4CAF50", fg="white").pack(pady=10)
-        tk.Button(self.root, text="Back", command=self.show_parent_dashboard, bg="#4a90e2", fg="white").pack()
+        tk.Button(screen, text="Add Child", command=self.save_child, bg="#4CAF50", fg="white").pack(pady=10)
+        tk.Button(screen, text="Back", command=self.show_parent_dashboard, bg="#4a90e2", fg="white").pack()
 
     def save_child(self):
         name = self.child_name_entry.get()
         dob = self.dob_entry.get()
-        parent_id = self.current_user[0]
 
         try:
-            datetime.strptime(dob, "%Y-%m-%d")
-            conn = sqlite3.connect("vaccination_system.db")
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO children (parent_id, name, dob) VALUES (?, ?, ?)",
-                           (parent_id, name, dob))
-            conn.commit()
-            conn.close()
+            services.add_child(services.AddChildRequest(self.current_user.id, name, dob))
             messagebox.showinfo("Success", "Child added successfully")
             self.show_parent_dashboard()
-        except ValueError:
-            messagebox.showerror("Error", "Invalid date format (use YYYY-MM-DD)")
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Failed to add child: {str(e)}")
+        except ServiceError as e:
+            messagebox.showerror(e.title, e.message)
 
     def view_children(self):
-        self.clear_screen()
-        self.set_background("assets/vaccine2.jpg")
-        tk.Label(self.root, text="Your Children", font=("Arial", 14), bg="white").pack(pady=10)
+        screen = self.open_screen()
+        tk.Label(screen, text="Your Children", font=("Arial", 14), bg="white").pack(pady=10)
 
         try:
-            conn = sqlite3.connect("vaccination_system.db")
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM children WHERE parent_id = ?", (self.current_user[0],))
-            children = cursor.fetchall()
+            children = services.list_children(self.current_user.id)
+            vaccines, hospitals = services.booking_options()
 
-            tree = ttk.Treeview(self.root, columns=("ID", "Name", "DOB"), show="headings")
+            tk.Label(screen, text="Search", bg="white").pack()
+            search_entry = tk.Entry(screen, width=30)
+            search_entry.pack()
+
+            tree = ttk.Treeview(screen, columns=("ID", "Name", "DOB"), show="headings")
             tree.heading("ID", text="Child ID")
             tree.heading("Name", text="Name")
             tree.heading("DOB", text="Date of Birth")
             tree.pack(pady=10)
 
-            for child in children:
-                tree.insert("", tk.END, values=child)
+            def show_children(rows):
+                tree.delete(*tree.get_children())
+                for child in rows:
+                    tree.insert("", tk.END, values=child)
+
+            def show_matches(matches):
+                if not search_entry.get().strip():
+                    show_children(children)
+                else:
+                    show_children([(m.child_id, m.child_name, m.dob) for m in matches])
+
+            def pick(event):
+                selection = tree.selection()
+                if selection:
+                    clear_entries(self.child_id_entry)
+                    self.child_id_entry.insert(0, tree.item(selection[0], "values")[0])
+
+            show_children(children)
+            self.bind_search(search_entry, show_matches)
+            tree.bind("<<TreeviewSelect>>", pick)
 
-            tk.Label(self.root, text="Enter Child ID to Book Appointment", bg="white").pack()
-            self.child_id_entry = tk.Entry(self.root)
+            tk.Label(screen, text="Enter Child ID to Book Appointment", bg="white").pack()
+            self.child_id_entry = tk.Entry(screen)
             self.child_id_entry.pack()
 
-            tk.Label(self.root, text="Select Vaccine", bg="white").pack()
-            cursor.execute("SELECT id, name FROM vaccines")
-            vaccines = cursor.fetchall()
+            tk.Label(screen, text="Select Vaccine", bg="white").pack()
             self.vaccine_var = tk.StringVar()
-            tk.OptionMenu(self.root, self.vaccine_var, *[f"{v[1]} (ID: {v[0]})" for v in vaccines]).pack()
+            tk.OptionMenu(screen, self.vaccine_var, *[f"{v.name} (ID: {v.id})" for v in vaccines]).pack()
 
-            tk.Label(self.root, text="Select Hospital", bg="white").pack()
-            cursor.execute("SELECT id, name FROM hospitals")
-            hospitals = cursor.fetchall()
+            tk.Label(screen, text="Select Hospital", bg="white").pack()
             self.hospital_var = tk.StringVar()
-            tk.OptionMenu(self.root, self.hospital_var, *[f"{h[1]} (ID: {h[0]})" for h in hospitals]).pack()
+            tk.OptionMenu(screen, self.hospital_var, *[f"{h.name} (ID: {h.id})" for h in hospitals]).pack()
 
-            tk.Button(self.root, text="Book Appointment", command=self.book_appointment, bg="#4CAF50", fg="white").pack(pady=10)
-            tk.Button(self.root, text="Back", command=self.show_parent_dashboard, bg="#4a90e2", fg="white").pack()
-            conn.close()
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Failed to load children: {str(e)}")
+            tk.Button(screen, text="Book Appointment", command=self.book_appointment, bg="#4CAF50", fg="white").pack(pady=10)
+            tk.Button(screen, text="Back", command=self.show_parent_dashboard, bg="#4a90e2", fg="white").pack()
+        except ServiceError as e:
+            messagebox.showerror(e.title, e.message)
 
     def book_appointment(self):
         child_id = self.child_id_entry.get()
@@ -327,209 +403,390 @@ class VaccinationSystemApp:
         try:
             vaccine_id = int(vaccine_selection.split("ID: ")[1].strip(")"))
             hospital_id = int(hospital_selection.split("ID: ")[1].strip(")"))
-            appointment_date = datetime.now().strftime("%Y-%m-%d")
-
-            conn = sqlite3.connect("vaccination_system.db")
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO vaccine_records (child_id, vaccine_id, hospital_id, date_administered, status) VALUES (?, ?, ?, ?, ?)",
-                           (child_id, vaccine_id, hospital_id, appointment_date, "Scheduled"))
-            conn.commit()
-            conn.close()
-            messagebox.showinfo("Success", "Appointment booked successfully")
-            self.view_appointments()
         except (ValueError, IndexError):
             messagebox.showerror("Error", "Invalid selection")
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Failed to book appointment: {str(e)}")
+            return
+
+        try:
+            child_id = services.parse_id(child_id, "Invalid Child ID")
+            booking = services.book_appointment(services.BookingRequest(self.current_user.id, child_id, vaccine_id, hospital_id))
+            when = f"{booking.appointment_date} {booking.start_time}" if booking.start_time else booking.appointment_date
+            messagebox.showinfo("Success", f"Appointment booked successfully for {when}")
+            self.view_appointments()
+        except ServiceError as e:
+            messagebox.showerror(e.title, e.message)
 
     def view_appointments(self):
-        self.clear_screen()
-        self.set_background("assets/vaccine2.jpg")
-        tk.Label(self.root, text="Your Appointments", font=("Arial", 14), bg="white").pack(pady=10)
+        screen = self.open_screen()
+        tk.Label(screen, text="Your Appointments", font=("Arial", 14), bg="white").pack(pady=10)
 
-        try:
-            conn = sqlite3.connect("vaccination_system.db")
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT vr.id, c.name, v.name, h.name, vr.date_administered, vr.status, p.amount, p.status
-                FROM vaccine_records vr
-                JOIN children c ON vr.child_id = c.id
-                JOIN vaccines v ON vr.vaccine_id = v.id
-                JOIN hospitals h ON vr.hospital_id = h.id
-                LEFT JOIN payments p ON vr.id = p.vaccine_record_id
-                WHERE c.parent_id = ?
-            """, (self.current_user[0],))
-            appointments = cursor.fetchall()
-
-            tree = ttk.Treeview(self.root, columns=("ID", "Child", "Vaccine", "Hospital", "Date", "Status", "Amount", "Payment Status"), show="headings")
-            tree.heading("ID", text="Appointment ID")
-            tree.heading("Child", text="Child")
-            tree.heading("Vaccine", text="Vaccine")
-            tree.heading("Hospital", text="Hospital")
-            tree.heading("Date", text="Date")
-            tree.heading("Status", text="Status")
-            tree.heading("Amount", text="Amount")
-            tree.heading("Payment Status", text="Payment Status")
-            tree.pack(pady=10)
+        def format_appointment(appt):
+            amount = appt[6] if appt[6] is not None else f"{ledger.DEFAULT_FEE:.2f}"
+            payment_status = appt[7] if appt[7] else "Pending"
+            return (appt[0], appt[1], appt[2], appt[3], appt[4], appt[5], amount, payment_status)
 
-            for appt in appointments:
-                amount = appt[6] if appt[6] else "50.00"
-                payment_status = appt[7] if appt[7] else "Pending"
-                tree.insert("", tk.END, values=(appt[0], appt[1], appt[2], appt[3], appt[4], appt[5], amount, payment_status))
+        user = self.current_user
+        PagedTreeview(screen,
+                      columns=("ID", "Child", "Vaccine", "Hospital", "Date", "Status", "Amount", "Payment Status"),
+                      headings=("Appointment ID", "Child", "Vaccine", "Hospital", "Date", "Status", "Amount", "Payment Status"),
+                      fetch_page=lambda **page: services.appointments_page(user, services.AppointmentQuery(**page)),
+                      format_row=format_appointment, runner=self.tasks, height=8).pack(pady=10, padx=10, fill=tk.X)
 
-            tk.Label(self.root, text="Enter Appointment ID to Pay", bg="white").pack()
-            self.appt_id_entry = tk.Entry(self.root)
-            self.appt_id_entry.pack()
+        tk.Label(screen, text="Enter Appointment ID to Pay or Cancel", bg="white").pack()
+        self.appt_id_entry = tk.Entry(screen)
+        self.appt_id_entry.pack()
 
-            tk.Button(self.root, text="Pay Now", command=self.make_payment, bg="#4CAF50", fg="white").pack(pady=10)
-            tk.Button(self.root, text="Back", command=self.show_parent_dashboard, bg="#4a90e2", fg="white").pack()
-            conn.close()
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Failed to load appointments: {str(e)}")
+        tk.Button(screen, text="Pay Now", command=self.make_payment, bg="#4CAF50", fg="white").pack(pady=10)
+        tk.Button(screen, text="Cancel Appointment", command=self.cancel_appointment, bg="#4a90e2", fg="white").pack(pady=(0, 10))
+        tk.Button(screen, text="Back", command=self.show_parent_dashboard, bg="#4a90e2", fg="white").pack()
 
     def make_payment(self):
         appt_id = self.appt_id_entry.get()
         try:
-            appt_id = int(appt_id)
-            conn = sqlite3.connect("vaccination_system.db")
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM payments WHERE vaccine_record_id = ?", (appt_id,))
-            payment = cursor.fetchone()
+            appt_id = services.parse_id(appt_id, "Invalid Appointment ID")
+            result = services.make_payment(services.PaymentRequest(self.current_user.id, appt_id))
 
-            if payment:
+            if result.already_paid:
                 messagebox.showinfo("Info", "Payment already made")
             else:
-                amount = 50.00
-                date_paid = datetime.now().strftime("%Y-%m-%d")
-                cursor.execute("INSERT INTO payments (vaccine_record_id, amount, status, date_paid) VALUES (?, ?, ?, ?)",
-                               (appt_id, amount, "Paid", date_paid))
-                conn.commit()
-                messagebox.showinfo("Success", f"Payment of ${amount} successful")
-            conn.close()
+                messagebox.showinfo("Success", f"Payment of ${result.amount} successful")
             self.view_appointments()
-        except ValueError:
-            messagebox.showerror("Error", "Invalid Appointment ID")
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Failed to process payment: {str(e)}")
+        except ServiceError as e:
+            messagebox.showerror(e.title, e.message)
+
+    def cancel_appointment(self):
+        appt_id = self.appt_id_entry.get()
+        try:
+            appt_id = services.parse_id(appt_id, "Invalid Appointment ID")
+            if not messagebox.askyesno("Confirm", f"Cancel appointment {appt_id}?"):
+                return
+            services.cancel_appointment(services.CancelRequest(self.current_user.id, appt_id))
+            messagebox.showinfo("Success", "Appointment cancelled")
+            self.view_appointments()
+        except ServiceError as e:
+            messagebox.showerror(e.title, e.message)
 
     def view_reminders(self):
-        self.clear_screen()
-        self.set_background("assets/vaccine2.jpg")
-        tk.Label(self.root, text="Reminders", font=("Arial", 14), bg="white").pack(pady=10)
+        screen = self.open_screen()
+        tk.Label(screen, text="Reminders", font=("Arial", 14), bg="white").pack(pady=10)
 
-        try:
-            conn = sqlite3.connect("vaccination_system.db")
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, name, dob FROM children WHERE parent_id = ?", (self.current_user[0],))
-            children = cursor.fetchall()
-
-            reminders = []
-            today = datetime.now()
-            for child in children:
-                child_id, name, dob = child
-                dob_date = datetime.strptime(dob, "%Y-%m-%d")
-                age_months = (today - dob_date).days // 30
-                cursor.execute("SELECT id, name, age_months FROM vaccines")
-                vaccines = cursor.fetchall()
-                for vaccine in vaccines:
-                    v_id, v_name, v_age = vaccine
-                    cursor.execute("SELECT * FROM vaccine_records WHERE child_id = ? AND vaccine_id = ?", (child_id, v_id))
-                    if not cursor.fetchone() and age_months >= v_age:
-                        reminders.append(f"{name} is due for {v_name} (Recommended at {v_age} months)")
+        reminder_frame = tk.Frame(screen, bg="white")
+        reminder_frame.pack()
+        tk.Button(screen, text="Back", command=self.show_parent_dashboard, bg="#4a90e2", fg="white").pack(pady=10)
 
+        def show_reminders(reminders):
             if reminders:
                 for reminder in reminders:
-                    tk.Label(self.root, text=reminder, fg="red", bg="white").pack()
+                    tk.Label(reminder_frame, text=reminder.message(), fg="red", bg="white").pack()
             else:
-                tk.Label(self.root, text="No reminders at this time", bg="white").pack()
+                tk.Label(reminder_frame, text="No reminders at this time", bg="white").pack()
 
-            tk.Button(self.root, text="Back", command=self.show_parent_dashboard, bg="#4a90e2", fg="white").pack(pady=10)
-            conn.close()
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Failed to load reminders: {str(e)}")
+        self.run_task(services.reminders_for_parent, self.current_user.id, on_success=show_reminders,
+                      error_message="Failed to load reminders")
 
     def show_hospital_dashboard(self):
-        self.clear_screen()
-        self.set_background("assets/vaccine2.jpg")
-        tk.Label(self.root, text=f"Welcome, {self.current_user[1]} (Hospital)", font=("Arial", 14), bg="white").pack(pady=10)
-
-        tk.Button(self.root, text="View Appointments", command=self.hospital_view_appointments, bg="#4CAF50", fg="white").pack(pady=5)
-        tk.Button(self.root, text="Add Health Worker", command=self.add_health_worker, bg="#4CAF50", fg="white").pack(pady=5)
-        tk.Button(self.root, text="Logout", command=self.show_login_screen, bg="#4a90e2", fg="white").pack(pady=5)
-
-    def hospital_view_appointments(self):
-        self.clear_screen()
-        self.set_background("assets/vaccine2.jpg")
-        tk.Label(self.root, text="Hospital Appointments", font=("Arial", 14), bg="white").pack(pady=10)
-
+        screen = self.open_screen("hospital_dashboard")
+        if screen.reused:
+            return
+        tk.Label(screen, text=f"Welcome, {self.current_user.name} (Hospital)", font=("Arial", 14), bg="white").pack(pady=10)
+
+        tk.Button(screen, text="View Appointments", command=self.hospital_view_appointments, bg="#4CAF50", fg="white").pack(pady=5)
+        tk.Button(screen, text="Manage Slots", command=self.manage_slots, bg="#4CAF50", fg="white").pack(pady=5)
+        tk.Button(screen, text="Coverage", command=self.view_coverage, bg="#4CAF50", fg="white").pack(pady=5)
+        tk.Button(screen, text="Due This Week", command=self.view_due_doses, bg="#4CAF50", fg="white").pack(pady=5)
+        tk.Button(screen, text="Find Child", command=self.find_child, bg="#4CAF50", fg="white").pack(pady=5)
+        tk.Button(screen, text="Add Health Worker", command=self.add_health_worker, bg="#4CAF50", fg="white").pack(pady=5)
+        tk.Button(screen, text="Logout", command=self.logout, bg="#4a90e2", fg="white").pack(pady=5)
+
+    def manage_slots(self):
+        screen = self.open_screen()
+        tk.Label(screen, text="Appointment Slots", font=("Arial", 14), bg="white").pack(pady=10)
+
+        form = tk.Frame(screen, bg="white")
+        form.pack()
+        self.slot_entries = {}
+        for row, (label, key, default) in enumerate([("Date (YYYY-MM-DD)", "date", ""), ("Opens (HH:MM)", "open", "09:00"),
+                                                     ("Closes (HH:MM)", "close", "17:00"), ("Minutes per slot", "minutes", "30"),
+                                                     ("Children per slot", "capacity", "4")]):
+            tk.Label(form, text=label, bg="white").grid(row=row, column=0, sticky=tk.W)
+            entry = tk.Entry(form)
+            entry.insert(0, default)
+            entry.grid(row=row, column=1)
+            self.slot_entries[key] = entry
         try:
-            conn = sqlite3.connect("vaccination_system.db")
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT vr.id, c.name, v.name, vr.date_administered, vr.status
-                FROM vaccine_records vr
-                JOIN children c ON vr.child_id = c.id
-                JOIN vaccines v ON vr.vaccine_id = v.id
-                WHERE vr.hospital_id = ?
-            """, (self.current_user[0],))
-            appointments = cursor.fetchall()
-
-            tree = ttk.Treeview(self.root, columns=("ID", "Child", "Vaccine", "Date", "Status"), show="headings")
-            tree.heading("ID", text="Appointment ID")
-            tree.heading("Child", text="Child")
-            tree.heading("Vaccine", text="Vaccine")
-            tree.heading("Date", text="Date")
-            tree.heading("Status", text="Status")
-            tree.pack(pady=10)
-
-            for appt in appointments:
-                tree.insert("", tk.END, values=appt)
+            workers = services.list_health_workers(self.current_user.id)
+        except ServiceError as e:
+            messagebox.showerror(e.title, e.message)
+            workers = ()
+        self.slot_workers = {f"{w.name} (ID: {w.id})": w.id for w in workers}
+        self.slot_worker_var = tk.StringVar(value="Any")
+        tk.Label(form, text="Health worker", bg="white").grid(row=len(self.slot_entries), column=0, sticky=tk.W)
+        tk.OptionMenu(form, self.slot_worker_var, "Any", *self.slot_workers).grid(row=len(self.slot_entries), column=1)
+
+        tk.Button(screen, text="Create Slots", command=self.save_slots, bg="#4CAF50", fg="white").pack(pady=10)
+
+        tree = ttk.Treeview(screen, columns=("Date", "Time", "Booked", "Capacity"), show="headings", height=8)
+        for column in ("Date", "Time", "Booked", "Capacity"):
+            tree.heading(column, text=column)
+            tree.column(column, width=110)
+        tree.pack(pady=10)
+        tk.Button(screen, text="Back", command=self.show_hospital_dashboard, bg="#4a90e2", fg="white").pack()
+
+        def show_slots(slots):
+            for slot in slots:
+                tree.insert("", tk.END, values=(slot.slot_date, slot.start_time, slot.booked, slot.capacity))
+
+        self.run_task(services.upcoming_slots, self.current_user.id, on_success=show_slots,
+                      error_message="Failed to load slots")
+
+    def save_slots(self):
+        values = {key: entry.get().strip() for key, entry in self.slot_entries.items()}
+        try:
+            minutes = services.parse_id(values["minutes"], "Minutes and capacity must be whole numbers")
+            capacity = services.parse_id(values["capacity"], "Minutes and capacity must be whole numbers")
+            created = services.create_slots(services.CreateSlotsRequest(
+                self.current_user.id, values["date"], values["open"], values["close"], minutes, capacity,
+                self.slot_workers.get(self.slot_worker_var.get())))
+            messagebox.showinfo("Success", f"{created} slots created")
+            self.manage_slots()
+        except ServiceError as e:
+            messagebox.showerror(e.title, e.message)
 
-            tk.Button(self.root, text="Back", command=self.show_hospital_dashboard, bg="#4a90e2", fg="white").pack(pady=10)
-            conn.close()
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Failed to load appointments: {str(e)}")
+    def hospital_view_appointments(self):
+        screen = self.open_screen()
+        tk.Label(screen, text="Hospital Appointments", font=("Arial", 14), bg="white").pack(pady=10)
+
+        user = self.current_user
+        PagedTreeview(screen,
+                      columns=("ID", "Child", "Vaccine", "Date", "Status"),
+                      headings=("Appointment ID", "Child", "Vaccine", "Date", "Status"),
+                      fetch_page=lambda **page: services.appointments_page(user, services.AppointmentQuery(**page)),
+                      runner=self.tasks).pack(pady=10, padx=10, fill=tk.X)
+
+        tk.Button(screen, text="Back", command=self.show_hospital_dashboard, bg="#4a90e2", fg="white").pack(pady=10)
+
+    def view_coverage(self):
+        screen = self.open_screen()
+        tk.Label(screen, text="Vaccination Coverage", font=("Arial", 14), bg="white").pack(pady=10)
+
+        columns = ("Vaccine", "Scheduled", "Administered", "Cancelled", "Paid", "Missed", "Children Overdue")
+        tree = ttk.Treeview(screen, columns=columns, show="headings", height=12)
+        for column in columns:
+            tree.heading(column, text=column)
+            tree.column(column, width=140 if column == "Vaccine" else 95)
+        tree.pack(pady=10, padx=10)
+        tk.Label(screen, text="Missed: scheduled appointments whose date has passed. "
+                              "Children Overdue: not booked at any hospital.", bg="white").pack()
+        tk.Button(screen, text="Back", command=self.show_hospital_dashboard, bg="#4a90e2", fg="white").pack(pady=10)
+
+        def show_coverage(rows):
+            for row in rows:
+                tree.insert("", tk.END, values=(row.vaccine_name, row.scheduled, row.administered, row.cancelled,
+                                                row.paid, row.overdue_appointments, row.overdue_children))
+
+        self.run_task(services.hospital_coverage, self.current_user, on_success=show_coverage,
+                      error_message="Failed to load coverage")
+
+    def find_child(self):
+        screen = self.open_screen()
+        tk.Label(screen, text="Find Child", font=("Arial", 14), bg="white").pack(pady=10)
+        tk.Label(screen, text=f"Child or parent name or contact ({search.REGISTRY_MIN_PREFIX}+ letters), or Child ID",
+                 bg="white").pack()
+        entry = tk.Entry(screen, width=40)
+        entry.pack()
+
+        columns = ("Child ID", "Name", "DOB", "Parent", "Contact")
+        tree = ttk.Treeview(screen, columns=columns, show="headings", height=14)
+        for column in columns:
+            tree.heading(column, text=column)
+            tree.column(column, width=120)
+        tree.pack(pady=10, padx=10)
+
+        def show_matches(matches):
+            tree.delete(*tree.get_children())
+            for match in matches:
+                tree.insert("", tk.END, values=(match.child_id, match.child_name, match.dob, match.parent_name or "",
+                                                match.contact or ""))
+
+        self.bind_search(entry, show_matches)
+        back = self.show_hospital_dashboard if self.user_role == "Hospital" else self.show_health_worker_dashboard
+        tk.Button(screen, text="Back", command=back, bg="#4a90e2", fg="white").pack(pady=10)
+        entry.focus_set()
+
+    def view_due_doses(self):
+        screen = self.open_screen()
+        start = datetime.now().date()
+        end = start + timedelta(days=6)
+        tk.Label(screen, text=f"Doses Due {start.isoformat()} to {end.isoformat()}", font=("Arial", 14), bg="white").pack(pady=10)
+
+        columns = ("Due", "Child ID", "Child", "Vaccine", "Catch-up Until")
+        tree = ttk.Treeview(screen, columns=columns, show="headings", height=14)
+        for column in columns:
+            tree.heading(column, text=column)
+            tree.column(column, width=120)
+        tree.pack(pady=10, padx=10)
+        tk.Button(screen, text="Back", command=self.show_hospital_dashboard, bg="#4a90e2", fg="white").pack(pady=10)
+
+        def show_doses(doses):
+            for dose in doses:
+                tree.insert("", tk.END, values=(dose.due_date, dose.child_id, dose.child_name, dose.vaccine_name,
+                                                dose.expires or ""))
+
+        self.run_task(services.doses_due, self.current_user, start.isoformat(), end.isoformat(), on_success=show_doses,
+                      error_message="Failed to load due doses")
 
     def add_health_worker(self):
-        self.clear_screen()
-        self.set_background("assets/vaccine2.jpg")
-        tk.Label(self.root, text="Add Health Worker", font=("Arial", 14), bg="white").pack(pady=10)
+        screen = self.open_screen("add_health_worker")
+        if screen.reused:
+            clear_entries(self.hw_name_entry, self.hw_username_entry, self.hw_password_entry)
+            return
+        tk.Label(screen, text="Add Health Worker", font=("Arial", 14), bg="white").pack(pady=10)
 
-        tk.Label(self.root, text="Health Worker Name", bg="white").pack()
-        self.hw_name_entry = tk.Entry(self.root)
+        tk.Label(screen, text="Health Worker Name", bg="white").pack()
+        self.hw_name_entry = tk.Entry(screen)
         self.hw_name_entry.pack()
 
-        tk.Label(self.root, text="Username", bg="white").pack()
-        self.hw_username_entry = tk.Entry(self.root)
+        tk.Label(screen, text="Username", bg="white").pack()
+        self.hw_username_entry = tk.Entry(screen)
         self.hw_username_entry.pack()
 
-        tk.Label(self.root, text="Password", bg="white").pack()
-        self.hw_password_entry = tk.Entry(self.root, show="*")
+        tk.Label(screen, text="Password", bg="white").pack()
+        self.hw_password_entry = tk.Entry(screen, show="*")
         self.hw_password_entry.pack()
 
-        tk.Button(self.root, text="Add Health Worker", command=self.save_health_worker, bg="#4CAF50", fg="white").pack(pady=10)
-        tk.Button(self.root, text="Back", command=self.show_hospital_dashboard, bg="#4a90e2", fg="white").pack()
+        tk.Button(screen, text="Add Health Worker", command=self.save_health_worker, bg="#4CAF50", fg="white").pack(pady=10)
+        tk.Button(screen, text="Back", command=self.show_hospital_dashboard, bg="#4a90e2", fg="white").pack()
 
     def save_health_worker(self):
         name = self.hw_name_entry.get()
         username = self.hw_username_entry.get()
         password = self.hw_password_entry.get()
-        hospital_id = self.current_user[0]
 
         try:
-            conn = sqlite3.connect("vaccination_system.db")
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO health_workers (hospital_id, name, username, password) VALUES (?, ?, ?, ?)",
-                           (hospital_id, name, username, password))
-            conn.commit()
-            conn.close()
+            services.add_health_worker(services.AddHealthWorkerRequest(self.current_user.id, name, username, password))
             messagebox.showinfo("Success", "Health Worker added successfully")
             self.show_hospital_dashboard()
-        except sqlite3.IntegrityError:
-            messagebox.showerror("Error", "Username already exists")
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"An error occurred: {str(e)}")
-if __name__ == "__main__":
+        except ServiceError as e:
+            messagebox.showerror(e.title, e.message)
+
+    def show_health_worker_dashboard(self):
+        screen = self.open_screen()
+        tk.Label(screen, text=f"Welcome, {self.current_user.name} (Health Worker)", font=("Arial", 14), bg="white").pack(pady=10)
+        tk.Label(screen, text="Scan or type an appointment ID and press Enter", bg="white").pack()
+        scan_entry = tk.Entry(screen, font=("Arial", 14), width=20)
+        scan_entry.pack(pady=5)
+        status_label = tk.Label(screen, text="", bg="white")
+        status_label.pack()
+
+        columns = ("ID", "Time", "Child", "Date of Birth", "Vaccine")
+        tree = ttk.Treeview(screen, columns=columns, show="headings", height=12)
+        for column in columns:
+            tree.heading(column, text=column)
+            tree.column(column, width=110)
+        tree.tag_configure("pending", background="#d4edda")
+        tree.pack(pady=10, padx=10)
+
+        user = self.current_user
+        pending = []
+        flush_job = [None]
+
+        def show_status(text, color="black"):
+            status_label.config(text=text, fg=color)
+
+        def show_queue(doses):
+            tree.delete(*tree.get_children())
+            for dose in doses:
+                record_id, child, dob, vaccine, start_time = dose
+                tree.insert("", tk.END, iid=str(record_id), values=(record_id, start_time or "", child, dob, vaccine),
+                            tags=("pending",) if record_id in pending else ())
+            show_status(f"{len(doses)} doses scheduled today")
+
+        def load_queue():
+            self.run_task(services.dose_queue, user, on_success=show_queue, error_message="Failed to load today's doses")
+
+        def flush():
+            # Every scanned dose since the last save goes in one UPDATE
+            if flush_job[0] is not None:
+                self.root.after_cancel(flush_job[0])
+                flush_job[0] = None
+            if not pending:
+                return
+            batch = tuple(pending)
+            try:
+                updated = services.administer_doses(user, batch)
+            except ServiceError as e:
+                messagebox.showerror(e.title, e.message)
+                return
+            del pending[:len(batch)]
+            if not tree.winfo_exists():
+                return
+            for record_id in batch:
+                if tree.exists(str(record_id)):
+                    tree.delete(str(record_id))
+            skipped = len(batch) - updated
+            show_status(f"Saved {updated} doses" + (f", {skipped} were already recorded" if skipped else ""),
+                        "red" if skipped else "green")
+
+        def scan(event=None):
+            value = scan_entry.get().strip()
+            scan_entry.delete(0, tk.END)
+            if not value:
+                flush()
+                return
+            try:
+                record_id = services.parse_id(value, f"Not an appointment ID: {value}")
+            except ServiceError as e:
+                show_status(e.message, "red")
+                return
+            if not tree.exists(str(record_id)):
+                show_status(f"Appointment {record_id} is not in today's queue", "red")
+                return
+            if record_id not in pending:
+                pending.append(record_id)
+                tree.item(str(record_id), tags=("pending",))
+            tree.see(str(record_id))
+            show_status(f"{len(pending)} doses waiting to be saved")
+            if len(pending) >= DOSE_FLUSH_SIZE:
+                flush()
+            else:
+                if flush_job[0] is not None:
+                    self.root.after_cancel(flush_job[0])
+                flush_job[0] = self.root.after(DOSE_FLUSH_MS, flush)
+
+        def mark_selected():
+            for iid in tree.selection():
+                if int(iid) not in pending:
+                    pending.append(int(iid))
+            flush()
+
+        def leave():
+            flush()
+            self.logout()
+
+        scan_entry.bind("<Return>", scan)
+        buttons = tk.Frame(screen, bg="white")
+        buttons.pack()
+        tk.Button(buttons, text="Mark Selected Administered", command=mark_selected, bg="#4CAF50", fg="white").pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Save Now", command=flush, bg="#4CAF50", fg="white").pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Refresh", command=lambda: (flush(), load_queue()), bg="#4a90e2", fg="white").pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Find Child", command=lambda: (flush(), self.find_child()), bg="#4a90e2", fg="white").pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Logout", command=leave, bg="#4a90e2", fg="white").pack(side=tk.LEFT, padx=5)
+        scan_entry.focus_set()
+        load_queue()
+
+# Opt-in (CVMS_PROFILE=1): times every handler plus the widget and image phases
+profiling.instrument(VaccinationSystemApp)
+profiling.instrument(PagedTreeview, ["add_rows", "reload", "load_next_page"], kind="widget")
+profiling.instrument(ImageCache, ["scaled", "photo"], kind="image")
+
+
+def main():
     root = tk.Tk()
-app = VaccinationSystemApp(root)
-root.mainloop()
\ No newline at end of file
+    app = VaccinationSystemApp(root)
+    root.mainloop()
+    app.tasks.shutdown()
+    db.close_all()
+
+
+if __name__ == "__main__":
+    main()
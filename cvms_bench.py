@@ -0,0 +1,345 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import closing, contextmanager
+from datetime import datetime
+
+import credentials
+import cvms_datagen
+import db
+import ledger
+import migrations
+import profiling
+import reference
+import search
+import services
+
+ITERATIONS = 200
+# Tries at finding a child without a given vaccine before book_appointment gives up
+BOOKING_ATTEMPTS = 100
+# Each login runs the password KDF, so it gets far fewer rounds
+LOGIN_ITERATIONS = 20
+# Each startup run launches a fresh interpreter
+STARTUP_ITERATIONS = 10
+TOLERANCE = 1.25
+# Runs in the child: times the import, the schema check and, given a display, the first paint
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import cvms
+imported = time.perf_counter()
+cvms.db.configure(sys.argv[1])
+cvms.initialize_database()
+checked = time.perf_counter()
+timings = {"startup_import": imported - started, "startup_schema": checked - imported}
+try:
+    root = cvms.tk.Tk()
+except cvms.tk.TclError:
+    pass
+else:
+    app = cvms.VaccinationSystemApp(root)
+    root.update()
+    timings["startup_first_screen"] = time.perf_counter() - checked
+    app.tasks.shutdown()
+    root.destroy()
+cvms.db.close_all()
+print(json.dumps(timings))
+"""
+
+
+class Context:
+    """Ids sampled from the database under test, plus the rows the write cases created."""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.max_parent = db.query_one("SELECT MAX(id) FROM parents")[0] or 0
+        self.max_child = db.query_one("SELECT MAX(id) FROM children")[0] or 0
+        self.hospital_ids = [row[0] for row in db.query_all("SELECT id FROM hospitals")]
+        self.vaccine_ids = [row[0] for row in db.query_all("SELECT id FROM vaccines")]
+        self.booked = []
+        self.generated = self._generated()
+
+    def _sample(self, sql, max_id):
+        # Ids can have gaps, so take the first row at or after a random id
+        if not max_id:
+            return None
+        return db.query_one(f"{sql} WHERE id >= ? ORDER BY id LIMIT 1", (self.rng.randint(1, max_id),))
+
+    def _generated(self):
+        # Only cvms_datagen databases share a known password; anything else skips the login case
+        user = self.parent()
+        if user is None:
+            return False
+        try:
+            services.login(services.LoginRequest("Parent", user.username, cvms_datagen.PASSWORD))
+        except services.AuthenticationError:
+            return False
+        return True
+
+    def parent(self):
+        row = self._sample("SELECT id, username, name FROM parents", self.max_parent)
+        return services.User(row[0], "Parent", row[1], row[2]) if row else None
+
+    def child(self):
+        return self._sample("SELECT id, parent_id FROM children", self.max_child)
+
+    def hospital(self):
+        if not self.hospital_ids:
+            return None
+        hospital_id = self.rng.choice(self.hospital_ids)
+        return services.User(hospital_id, "Hospital", f"hospital{hospital_id}", f"Hospital {hospital_id}",
+                             hospital_id=hospital_id)
+
+
+# Cases return a zero-argument callable (setup is not timed) that returns the number of rows it handled,
+# or None when the database has nothing to run the case on
+def login_case(ctx):
+    if not ctx.generated:
+        return None
+    username = ctx.parent().username
+    credentials.sessions.invalidate()
+    return lambda: services.login(services.LoginRequest("Parent", username, cvms_datagen.PASSWORD)) and 1
+
+
+def parent_appointments_case(ctx):
+    user = ctx.parent()
+    if user is None:
+        return None
+    return lambda: len(services.appointments_page(user, services.AppointmentQuery()))
+
+
+def hospital_appointments_case(ctx):
+    # First page and the one after it, as scrolling to the bottom of the list does
+    user = ctx.hospital()
+    if user is None:
+        return None
+
+    def run():
+        first = services.appointments_page(user, services.AppointmentQuery())
+        if not first:
+            return 0
+        after = (first[-1][3], first[-1][0])
+        return len(first) + len(services.appointments_page(user, services.AppointmentQuery(after=after)))
+    return run
+
+
+def reminders_case(ctx):
+    user = ctx.parent()
+    if user is None:
+        return None
+    return lambda: len(services.reminders_for_parent(user.id))
+
+
+def search_case(ctx):
+    # Type-ahead as the front desk sees it: a parent's name, then the shortest prefix of it staff can search on
+    user = ctx.hospital()
+    if user is None or not ctx.max_parent:
+        return None
+    text = f"parent {ctx.rng.randint(1, ctx.max_parent)}"
+    return lambda: len(services.search_children(user, text)) + len(services.search_children(user, text[:search.REGISTRY_MIN_PREFIX]))
+
+
+def book_appointment_case(ctx):
+    # Sample until the child does not have that vaccine yet, so the timed call is a real booking
+    if not (ctx.max_child and ctx.vaccine_ids and ctx.hospital_ids):
+        return None
+    for _ in range(BOOKING_ATTEMPTS):
+        (child_id, parent_id), vaccine_id = ctx.child(), ctx.rng.choice(ctx.vaccine_ids)
+        if db.query_one("SELECT 1 FROM vaccine_records WHERE child_id = ? AND vaccine_id = ?",
+                        (child_id, vaccine_id)) is None:
+            break
+    else:
+        return lambda: 0
+    request = services.BookingRequest(parent_id, child_id, vaccine_id, ctx.rng.choice(ctx.hospital_ids))
+
+    def run():
+        try:
+            booking = services.book_appointment(request)
+        except services.ConflictError:
+            return 0
+        ctx.booked.append((parent_id, booking.record_id))
+        return 1
+    return run
+
+
+def make_payment_case(ctx):
+    if not ctx.booked:
+        return lambda: 0
+    parent_id, record_id = ctx.booked[ctx.rng.randrange(len(ctx.booked))]
+    request = services.PaymentRequest(parent_id, record_id)
+    return lambda: 1 if not services.make_payment(request).already_paid else 0
+
+
+# Ordered: make_payment pays for the appointments book_appointment created
+CASES = {
+    "login": login_case,
+    "view_appointments": parent_appointments_case,
+    "hospital_view_appointments": hospital_appointments_case,
+    "view_reminders": reminders_case,
+    "search_children": search_case,
+    "book_appointment": book_appointment_case,
+    "make_payment": make_payment_case,
+}
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank, so small samples still return an observed latency
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(timings, rows):
+    timings.sort()
+    total = sum(timings)
+    return {
+        "iterations": len(timings),
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "p99_ms": round(percentile(timings, 99) * 1000, 3),
+        "rows": rows,
+        "rows_per_sec": round(rows / total, 1) if total else 0.0,
+    }
+
+
+def _reset_caches():
+    credentials.sessions.invalidate()
+    reference.cache.invalidate()
+    ledger.prices.invalidate()
+
+
+@contextmanager
+def scratch_copy(path):
+    """A throwaway copy of the database at path, so the write cases (and their change log
+    and slot counts) never touch the original."""
+    scratch = tempfile.mkdtemp(prefix="cvms-bench-")
+    try:
+        copy = os.path.join(scratch, os.path.basename(path))
+        with closing(sqlite3.connect(path)) as source, closing(sqlite3.connect(copy)) as target:
+            source.backup(target)
+        yield copy
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def run_benchmarks(path, iterations=ITERATIONS, seed=0, cases=None):
+    # Writes to path: main() hands it a scratch copy
+    db.configure(path)
+    results = {}
+    try:
+        migrations.migrate()
+        _reset_caches()
+        ctx = Context(seed)
+        for name in [name for name in CASES if cases is None or name in cases]:
+            count = min(iterations, LOGIN_ITERATIONS) if name == "login" else iterations
+            timings, rows = [], 0
+            for _ in range(count):
+                run = CASES[name](ctx)
+                if run is None:
+                    print(f"Skipping {name}: not applicable to this database", file=sys.stderr)
+                    break
+                started = time.perf_counter()
+                rows += run()
+                timings.append(time.perf_counter() - started)
+            if timings:
+                results[name] = summarize(timings, rows)
+    finally:
+        db.close_all()
+    return results
+
+
+def run_startup(path, iterations=STARTUP_ITERATIONS):
+    """Launch the app cold `iterations` times; startup_process is the whole launch as the user waits for it."""
+    timings = {}
+    for _ in range(iterations):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, os.path.abspath(path)], check=True,
+                                capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        elapsed = time.perf_counter() - started
+        for name, seconds in json.loads(output.splitlines()[-1]).items():
+            timings.setdefault(name, []).append(seconds)
+        timings.setdefault("startup_process", []).append(elapsed)
+    return {name: summarize(values, len(values)) for name, values in timings.items()}
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Yield (label, case, baseline p95, current p95, regressed) for every case in both runs."""
+    for label, cases in results.items():
+        for name, stats in cases.items():
+            before = baseline.get(label, {}).get(name)
+            if before is None:
+                continue
+            regressed = stats["p95_ms"] > before["p95_ms"] * tolerance
+            yield label, name, before["p95_ms"], stats["p95_ms"], regressed
+
+
+def scale_database(data_dir, children, seed):
+    path = os.path.join(data_dir, f"cvms-{children}.db")
+    if not os.path.exists(path):
+        print(f"Generating {children} children into {path}", file=sys.stderr)
+        os.makedirs(data_dir, exist_ok=True)
+        cvms_datagen.generate(path, children, seed=seed)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the queries behind each screen.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--db", help="benchmark this existing database")
+    target.add_argument("--scales", type=int, nargs="+", metavar="CHILDREN",
+                        help="benchmark generated databases of these sizes, e.g. 1000 100000")
+    parser.add_argument("--data-dir", default="bench-data", help="where generated databases are kept")
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    parser.add_argument("--case", action="append", choices=sorted(CASES), help="run only these cases")
+    parser.add_argument("--seed", type=int, default=cvms_datagen.SEED)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="allowed p95 slowdown against the baseline (default: %(default)s)")
+    parser.add_argument("--profile", metavar="FILE", help="also write per-query timings to this metrics file")
+    parser.add_argument("--startup", action="store_true",
+                        help="also time cold application launches (the first paint needs a display)")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        profiling.enable(metrics_path=args.profile)
+
+    if args.db and not os.path.exists(args.db):
+        parser.error(f"{args.db} does not exist")
+    targets = {os.path.basename(args.db): args.db} if args.db else {
+        str(n): scale_database(args.data_dir, n, args.seed) for n in args.scales}
+    results = {}
+    print(f"{'scale':<16}{'case':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rows/s':>12}")
+    for label, path in targets.items():
+        with scratch_copy(path) as copy:
+            results[label] = run_benchmarks(copy, args.iterations, args.seed, args.case)
+            if args.startup:
+                results[label].update(run_startup(copy, min(args.iterations, STARTUP_ITERATIONS)))
+        for name, stats in results[label].items():
+            print(f"{label[:15]:<16}{name:<28}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+                  f"{stats['p99_ms']:>10.2f}{stats['rows_per_sec']:>12,.0f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"run_at": datetime.now().isoformat(timespec="seconds"), "iterations": args.iterations,
+                       "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = 0
+        for label, name, before, after, regressed in compare(results, baseline, args.tolerance):
+            regressions += regressed
+            print(f"{'REGRESSION' if regressed else 'ok':<12}{label:<12}{name:<28}{before:>10.2f} -> {after:.2f} ms p95")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
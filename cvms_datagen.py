@@ -0,0 +1,153 @@
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from itertools import islice
+
+import coverage_summary
+import credentials
+import db
+import dose_schedule
+import migrations
+import search
+
+BATCH_SIZE = 50000
+SEED = 1234
+PASSWORD = "password"
+CHILDREN_PER_PARENT = 2
+CHILDREN_PER_HOSPITAL = 2000
+WORKERS_PER_HOSPITAL = 3
+# Standard schedule ages in months; the first two match the seeded DTP and Measles
+SCHEDULE = [("DTP", 2), ("Measles", 9), ("BCG", 0), ("Polio", 4), ("Hepatitis B", 6), ("MMR", 12),
+            ("Varicella", 15), ("Hepatitis A", 18), ("Typhoid", 24), ("DTP Booster", 48)]
+BOOKED_SHARE = 0.8
+PAID_SHARE = 0.7
+
+
+def _batches(rows, size=BATCH_SIZE):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _insert(conn, sql, rows):
+    count = 0
+    for batch in _batches(rows):
+        with conn:
+            conn.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+
+def _births(seed, children, hospitals, today):
+    # Children are born over the last five years; each gets a home hospital
+    rng = random.Random(seed)
+    for _ in range(children):
+        yield today - timedelta(days=rng.randrange(5 * 365)), rng.randrange(1, hospitals + 1)
+
+
+def generate(path, children, hospitals=None, seed=SEED, today=None):
+    """Build a fresh database at path with `children` children and matching parents,
+    hospitals, health workers, vaccine records and payments.
+
+    The same arguments always produce the same rows (password salts aside). Every
+    account's password is PASSWORD, hashed once, so users do not pay the KDF per row.
+    """
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    rng = random.Random(seed + 1)
+    today = today or date(2026, 1, 1)
+    hospitals = hospitals or max(1, children // CHILDREN_PER_HOSPITAL)
+    parents = max(1, children // CHILDREN_PER_PARENT)
+    password_hash = credentials.hash_password(PASSWORD)
+
+    db.configure(path)
+    conn = db.connection()
+    migrations.migrate(conn)
+    # Bulk load only: nothing else is using this file yet
+    conn.execute("PRAGMA synchronous = OFF")
+    counts = {}
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO vaccines (name, age_months) VALUES (?, ?)", SCHEDULE)
+    vaccines = conn.execute("SELECT id, age_months FROM vaccines ORDER BY id").fetchall()
+
+    counts["parents"] = _insert(conn, "INSERT INTO parents (id, username, password, name, contact) VALUES (?, ?, ?, ?, ?)",
+                                ((i, f"parent{i}", password_hash, f"Parent {i}", f"555-{i:07d}")
+                                 for i in range(1, parents + 1)))
+    counts["hospitals"] = _insert(conn, "INSERT INTO hospitals (id, name, username, password) VALUES (?, ?, ?, ?)",
+                                  ((i, f"Hospital {i}", f"hospital{i}", password_hash) for i in range(1, hospitals + 1)))
+    counts["health_workers"] = _insert(
+        conn, "INSERT INTO health_workers (id, hospital_id, name, username, password) VALUES (?, ?, ?, ?, ?)",
+        ((i, (i - 1) // WORKERS_PER_HOSPITAL + 1, f"Worker {i}", f"worker{i}", password_hash)
+         for i in range(1, hospitals * WORKERS_PER_HOSPITAL + 1)))
+
+    counts["children"] = _insert(conn, "INSERT INTO children (id, parent_id, name, dob) VALUES (?, ?, ?, ?)",
+                                 ((i, (i - 1) // CHILDREN_PER_PARENT % parents + 1, f"Child {i}", dob.isoformat())
+                                  for i, (dob, _) in enumerate(_births(seed, children, hospitals, today), 1)))
+
+    def records():
+        # Replays the same birth sequence rather than holding millions of children in memory
+        record_id = 0
+        for child_id, (dob, hospital_id) in enumerate(_births(seed, children, hospitals, today), 1):
+            for vaccine_id, age_months in vaccines:
+                if rng.random() >= BOOKED_SHARE:
+                    continue
+                due = dob + timedelta(days=int((age_months or 0) * 30.4))
+                when = due + timedelta(days=rng.randrange(-7, 30))
+                if when > today:
+                    status, worker_id = "Scheduled", None
+                elif rng.random() < 0.05:
+                    status, worker_id = "Cancelled", None
+                else:
+                    status = "Administered"
+                    worker_id = (hospital_id - 1) * WORKERS_PER_HOSPITAL + rng.randrange(WORKERS_PER_HOSPITAL) + 1
+                record_id += 1
+                yield record_id, child_id, vaccine_id, hospital_id, worker_id, when.isoformat(), status
+
+    counts["vaccine_records"] = _insert(conn, """
+        INSERT INTO vaccine_records (id, child_id, vaccine_id, hospital_id, health_worker_id, date_administered, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, records())
+    # Payments are derived in SQL; the multiplicative hash keeps the choice deterministic
+    with conn:
+        counts["payments"] = conn.execute("""
+            INSERT INTO payments (vaccine_record_id, amount, status, date_paid)
+            SELECT id, 50.0, CASE status WHEN 'Administered' THEN 'Settled' ELSE 'Paid' END, MIN(date_administered, ?)
+            FROM vaccine_records
+            WHERE status != 'Cancelled' AND (id * 2654435761) % 100 < ?
+        """, (today.isoformat(), int(PAID_SHARE * 100))).rowcount
+    # Settle the trigger-fed summaries now so the first benchmarked read does not pay for them
+    dose_schedule.flush()
+    coverage_summary.roll_over()
+    with conn:
+        search.optimize(conn)
+    conn.execute("ANALYZE")
+    db.close_all()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic vaccination database for benchmarking.")
+    parser.add_argument("path", help="database file to create (must not exist)")
+    parser.add_argument("--children", type=int, default=10000)
+    parser.add_argument("--hospitals", type=int, help=f"default: one per {CHILDREN_PER_HOSPITAL} children")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        counts = generate(args.path, args.children, args.hospitals, args.seed)
+    except FileExistsError:
+        parser.error(f"{args.path} already exists")
+    print(", ".join(f"{count} {table}" for table, count in counts.items()), file=sys.stderr)
+    print(f"Generated {args.path} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
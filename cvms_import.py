@@ -0,0 +1,228 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+
+import db
+import migrations
+
+BATCH_SIZE = 5000
+DEFAULT_STATUS = "Administered"
+STATUSES = ("Scheduled", "Administered", "Cancelled")
+
+
+class RejectedRow(Exception):
+    pass
+
+
+def read_rows(path, fmt):
+    # JSON lines are decoded per row by parse_row, so one bad line is rejected, not fatal
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield line.rstrip("\r\n")
+
+
+def parse_row(row):
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except ValueError as e:
+            raise RejectedRow(f"invalid JSON ({e})")
+    if not isinstance(row, dict):
+        raise RejectedRow("expected a JSON object")
+    return row
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def valid_date(value, field):
+    # Same rule as the Add Child form
+    try:
+        datetime.strptime(value or "", "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise RejectedRow(f"invalid {field} (use YYYY-MM-DD)")
+    return value
+
+
+def text(row, field):
+    value = row.get(field)
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise RejectedRow(f"invalid {field}")
+    return value.strip()
+
+
+def row_id(row, field):
+    # JSON rows may give ids as numbers, CSV rows always as text
+    value = row.get(field)
+    if value in (None, ""):
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise RejectedRow(f"invalid {field}")
+    try:
+        return int(value)
+    except ValueError:
+        raise RejectedRow(f"invalid {field}")
+
+
+def lookup_id(row, id_field, key_field, keys, ids):
+    record_id = row_id(row, id_field)
+    if record_id is not None:
+        if record_id not in ids:
+            raise RejectedRow(f"unknown {id_field} {record_id}")
+        return record_id
+    key = text(row, key_field)
+    if key not in keys:
+        raise RejectedRow(f"unknown {key_field} {key!r}")
+    return keys[key]
+
+
+def lookup_table(conn, sql):
+    keys = dict(conn.execute(sql))
+    return keys, set(keys.values())
+
+
+class Importer:
+    def __init__(self, conn, kind, source):
+        self.conn = conn
+        self.kind = kind
+        self.source = os.path.abspath(source)
+        # Reference tables are resolved in memory so each batch is one executemany
+        self.parents = lookup_table(conn, "SELECT username, id FROM parents")
+        self.hospitals = lookup_table(conn, "SELECT username, id FROM hospitals")
+        self.vaccines = lookup_table(conn, "SELECT name, id FROM vaccines")
+        self.children = {}
+        if kind == "records":
+            self.children = {(parent_id, name, dob): child_id for child_id, parent_id, name, dob
+                             in conn.execute("SELECT id, parent_id, name, dob FROM children")}
+        self.child_ids = set(self.children.values())
+
+    def rows_done(self):
+        row = self.conn.execute("SELECT rows_done FROM import_progress WHERE source = ?", (self.source,)).fetchone()
+        return row[0] if row else 0
+
+    def reset(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM import_progress WHERE source = ?", (self.source,))
+
+    def child_params(self, row):
+        parent_id = lookup_id(row, "parent_id", "parent_username", *self.parents)
+        name = text(row, "name")
+        if not name:
+            raise RejectedRow("missing name")
+        return parent_id, name, valid_date(row.get("dob"), "dob")
+
+    def record_params(self, row):
+        child_id = row_id(row, "child_id")
+        if child_id is not None:
+            if child_id not in self.child_ids:
+                raise RejectedRow(f"unknown child_id {child_id}")
+        else:
+            parent_id, name, dob = self.child_params(row)
+            child_id = self.children.get((parent_id, name, dob))
+            if child_id is None:
+                raise RejectedRow(f"unknown child {name!r} born {dob}")
+        vaccine_id = lookup_id(row, "vaccine_id", "vaccine", *self.vaccines)
+        hospital_id = lookup_id(row, "hospital_id", "hospital_username", *self.hospitals)
+        date_administered = valid_date(row.get("date_administered"), "date_administered")
+        status = text(row, "status") or DEFAULT_STATUS
+        if status not in STATUSES:
+            raise RejectedRow(f"unknown status {status!r}")
+        return child_id, vaccine_id, hospital_id, date_administered, status
+
+    def write_batch(self, params, rows_done):
+        if self.kind == "children":
+            sql = "INSERT INTO children (parent_id, name, dob) VALUES (?, ?, ?)"
+        else:
+            # Doses already on file are skipped, not rejected
+            sql = ("INSERT OR IGNORE INTO vaccine_records (child_id, vaccine_id, hospital_id, date_administered, status) "
+                   "VALUES (?, ?, ?, ?, ?)")
+        with self.conn:
+            # rowcount, unlike total_changes, leaves out the rows the table's triggers write
+            inserted = self.conn.executemany(sql, params).rowcount
+            self.conn.execute("""
+                INSERT INTO import_progress (source, rows_done, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(source) DO UPDATE SET rows_done = excluded.rows_done, updated_at = excluded.updated_at
+            """, (self.source, rows_done, datetime.now().isoformat(timespec="seconds")))
+        return inserted
+
+    def run(self, rows, batch_size, rejects, progress=sys.stderr):
+        to_params = self.child_params if self.kind == "children" else self.record_params
+        skip = self.rows_done()
+        if skip:
+            print(f"Resuming after {skip} rows already imported", file=progress)
+            rows = islice(rows, skip, None)
+
+        done, inserted, rejected = skip, 0, 0
+        started = time.perf_counter()
+        for chunk in chunks(rows, batch_size):
+            params = []
+            for row in chunk:
+                try:
+                    row = parse_row(row)
+                    params.append(to_params(row))
+                except RejectedRow as e:
+                    rejected += 1
+                    rejects.write(json.dumps({"row": row, "error": str(e)}) + "\n")
+            done += len(chunk)
+            inserted += self.write_batch(params, done)
+            rejects.flush()
+            rate = (done - skip) / max(time.perf_counter() - started, 1e-9)
+            print(f"{done} rows read, {inserted} inserted, {rejected} rejected ({rate:,.0f} rows/s)", file=progress)
+        return done, inserted, rejected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import children or historical vaccine records.")
+    parser.add_argument("kind", choices=("children", "records"))
+    parser.add_argument("path", help="CSV or JSON Lines file")
+    parser.add_argument("--format", choices=("csv", "jsonl"),
+                        help="input format (default: from the file extension)")
+    parser.add_argument("--db", default=db.DB_PATH, help="database file")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--rejects", help="file for rejected rows (default: <path>.rejects.jsonl)")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint for this file")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("jsonl" if args.path.endswith((".jsonl", ".json")) else "csv")
+    db.configure(args.db)
+    conn = db.connection()
+    migrations.migrate(conn)
+
+    importer = Importer(conn, args.kind, args.path)
+    if args.restart:
+        importer.reset()
+    rejects_path = args.rejects or args.path + ".rejects.jsonl"
+    try:
+        with open(rejects_path, "a", encoding="utf-8") as rejects:
+            done, inserted, rejected = importer.run(read_rows(args.path, fmt), args.batch_size, rejects)
+    except (OSError, ValueError, csv.Error, sqlite3.Error) as e:
+        print(f"Import failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close_all()
+    print(f"Done: {done} rows, {inserted} inserted, {rejected} rejected")
+    if rejected:
+        print(f"Rejected rows written to {rejects_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
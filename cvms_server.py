@@ -0,0 +1,325 @@
+import argparse
+import json
+import secrets
+import sys
+import threading
+import time
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import db
+import migrations
+import repository
+import services
+from services import ServiceError, ValidationError
+
+SESSION_TTL_SECONDS = 8 * 60 * 60
+MAX_BODY_BYTES = 64 * 1024
+
+
+class Sessions:
+    def __init__(self, ttl=SESSION_TTL_SECONDS):
+        self.ttl = ttl
+        self.tokens = {}
+        self.lock = threading.Lock()
+
+    def create(self, user):
+        token = secrets.token_urlsafe(32)
+        with self.lock:
+            self.tokens[token] = (user, time.monotonic() + self.ttl)
+        return token
+
+    def get(self, token):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.tokens.get(token)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self.tokens[token]
+                return None
+            return entry[0]
+
+    def drop(self, token):
+        with self.lock:
+            self.tokens.pop(token, None)
+
+
+def _require(body, *names, kind=str):
+    missing = [name for name in names if body.get(name) in (None, "")]
+    if missing:
+        raise ValidationError(f"Missing field(s): {', '.join(missing)}")
+    # JSON lets a client send any type; only kind reaches the services
+    wrong = [name for name in names if not isinstance(body[name], kind) or isinstance(body[name], bool)]
+    if wrong:
+        raise ValidationError(f"Wrong type for field(s): {', '.join(wrong)}")
+    return [body[name] for name in names]
+
+
+def _optional(body, name):
+    value = body.get(name)
+    if value is not None and not isinstance(value, str):
+        raise ValidationError(f"Wrong type for field(s): {name}")
+    return value
+
+
+def _limit(query, default, cap):
+    limit = services.parse_id(query.get("limit", default), "Invalid limit")
+    # SQLite reads a negative LIMIT as no limit at all
+    if limit <= 0:
+        raise ValidationError("Invalid limit")
+    return min(limit, cap)
+
+
+def _require_role(user, *roles):
+    if user is None:
+        raise services.AuthenticationError("Login required")
+    if user.role not in roles:
+        raise services.PermissionDenied("Not allowed")
+    return user
+
+
+# Route handlers take (user, body, query) and return something json.dumps can encode
+def login(user, body, query):
+    role, username, password = _require(body, "role", "username", "password")
+    logged_in = services.login(services.LoginRequest(role, username, password))
+    return {"token": server_sessions.create(logged_in), "user": asdict(logged_in)}
+
+
+def register(user, body, query):
+    role, username, password, name = _require(body, "role", "username", "password", "name")
+    user_id = services.register(services.RegisterRequest(role, username, password, name, _optional(body, "contact")))
+    return {"id": user_id}
+
+
+def list_children(user, body, query):
+    _require_role(user, "Parent")
+    return [{"id": c[0], "name": c[1], "dob": c[2]} for c in services.list_children(user.id)]
+
+
+def search_children(user, body, query):
+    _require_role(user, "Parent", "Hospital", "HealthWorker")
+    return [asdict(match) for match in services.search_children(user, query.get("q", ""), _limit(query, 20, 100))]
+
+
+def add_child(user, body, query):
+    _require_role(user, "Parent")
+    name, dob = _require(body, "name", "dob")
+    return {"id": services.add_child(services.AddChildRequest(user.id, name, dob))}
+
+
+def booking_options(user, body, query):
+    _require_role(user, "Parent", "Hospital", "HealthWorker")
+    vaccines, hospitals = services.booking_options()
+    return {"vaccines": [asdict(v) for v in vaccines], "hospitals": [asdict(h) for h in hospitals]}
+
+
+def list_health_workers(user, body, query):
+    _require_role(user, "Hospital")
+    return [asdict(w) for w in services.list_health_workers(user.id)]
+
+
+def book_appointment(user, body, query):
+    _require_role(user, "Parent")
+    child_id, vaccine_id, hospital_id = (services.parse_id(value, f"Invalid {name}") for name, value in
+                                         zip(("child_id", "vaccine_id", "hospital_id"),
+                                             _require(body, "child_id", "vaccine_id", "hospital_id", kind=(str, int))))
+    return asdict(services.book_appointment(services.BookingRequest(user.id, child_id, vaccine_id, hospital_id)))
+
+
+def list_appointments(user, body, query):
+    _require_role(user, "Parent", "Hospital", "HealthWorker")
+    after = None
+    if query.get("after_id"):
+        after_id = services.parse_id(query["after_id"], "Invalid after_id")
+        if query.get("sort", "Date") == "ID":
+            after = (after_id, after_id)
+        elif query.get("after_value") is None:
+            # A NULL keyset value would compare as unknown and silently end the listing
+            raise ValidationError("after_value required")
+        else:
+            after = (query["after_value"], after_id)
+    request = services.AppointmentQuery(
+        sort=query.get("sort", "Date"),
+        descending=query.get("descending", "true").lower() != "false",
+        after=after,
+        limit=_limit(query, repository.PAGE_SIZE, 1000),
+        status=query.get("status"),
+        date_from=query.get("from"),
+        date_to=query.get("to"),
+    )
+    return services.appointments_page(user, request)
+
+
+def cancel_appointment(user, body, query):
+    _require_role(user, "Parent")
+    (record_id,) = _require(body, "vaccine_record_id", kind=(str, int))
+    record_id = services.parse_id(record_id, "Invalid Appointment ID")
+    return {"cancelled": services.cancel_appointment(services.CancelRequest(user.id, record_id))}
+
+
+def make_payment(user, body, query):
+    _require_role(user, "Parent")
+    (record_id,) = _require(body, "vaccine_record_id", kind=(str, int))
+    record_id = services.parse_id(record_id, "Invalid Appointment ID")
+    key = _optional(body, "idempotency_key")
+    return asdict(services.make_payment(services.PaymentRequest(user.id, record_id, key)))
+
+
+def list_reminders(user, body, query):
+    _require_role(user, "Parent")
+    return [{**asdict(r), "due_date": r.due_date.isoformat(), "message": r.message()}
+            for r in services.reminders_for_parent(user.id)]
+
+
+def dose_queue(user, body, query):
+    _require_role(user, "HealthWorker")
+    return [{"id": d[0], "child": d[1], "dob": d[2], "vaccine": d[3], "start_time": d[4]}
+            for d in services.dose_queue(user)]
+
+
+def administer_doses(user, body, query):
+    _require_role(user, "HealthWorker")
+    (record_ids,) = _require(body, "record_ids", kind=list)
+    record_ids = tuple(services.parse_id(value, "Invalid record id") for value in record_ids)
+    updated = services.administer_doses(user, record_ids)
+    return {"administered": updated}
+
+
+def hospital_coverage(user, body, query):
+    _require_role(user, "Hospital", "HealthWorker")
+    return [asdict(row) for row in services.hospital_coverage(user)]
+
+
+def doses_due(user, body, query):
+    _require_role(user, "Hospital", "HealthWorker")
+    start, end = _require(query, "from", "to")
+    after = None
+    if query.get("after_date"):
+        after = (query["after_date"], services.parse_id(query.get("after_child"), "Invalid after_child"),
+                 services.parse_id(query.get("after_vaccine"), "Invalid after_vaccine"))
+    return [asdict(dose) for dose in services.doses_due(user, start, end, after, _limit(query, 500, 1000))]
+
+
+def add_health_worker(user, body, query):
+    _require_role(user, "Hospital")
+    name, username, password = _require(body, "name", "username", "password")
+    return {"id": services.add_health_worker(services.AddHealthWorkerRequest(user.id, name, username, password))}
+
+
+ROUTES = {
+    ("POST", "/login"): login,
+    ("POST", "/register"): register,
+    ("GET", "/children"): list_children,
+    ("POST", "/children"): add_child,
+    ("GET", "/children/search"): search_children,
+    ("GET", "/booking-options"): booking_options,
+    ("GET", "/appointments"): list_appointments,
+    ("POST", "/appointments"): book_appointment,
+    ("POST", "/appointments/cancel"): cancel_appointment,
+    ("POST", "/payments"): make_payment,
+    ("GET", "/reminders"): list_reminders,
+    ("GET", "/health-workers"): list_health_workers,
+    ("POST", "/health-workers"): add_health_worker,
+    ("GET", "/coverage"): hospital_coverage,
+    ("GET", "/doses"): dose_queue,
+    ("GET", "/due"): doses_due,
+    ("POST", "/doses"): administer_doses,
+}
+
+server_sessions = Sessions()
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "CVMS/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        route = ROUTES.get((method, url.path.rstrip("/") or "/"))
+        if route is None:
+            self.send_json(404, {"error": "Not found"})
+            return
+        try:
+            body = self.read_body() if method == "POST" else {}
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            result = route(self.current_user(), body, query)
+        except ServiceError as e:
+            self.send_json(e.status, {"error": e.message})
+            return
+        finally:
+            # Request threads are short-lived; hand their connection back to the pool
+            db.get_pool().release()
+        self.send_json(200, result)
+
+    def read_body(self):
+        length = services.parse_id(self.headers.get("Content-Length") or 0, "Invalid Content-Length")
+        if length < 0:
+            raise ValidationError("Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise ValidationError("Request body too large")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise ValidationError("Invalid JSON body")
+        if not isinstance(body, dict):
+            raise ValidationError("Expected a JSON object")
+        return body
+
+    def current_user(self):
+        header = self.headers.get("Authorization", "")
+        if header.startswith("Bearer "):
+            return server_sessions.get(header[len("Bearer "):])
+        return None
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(host="127.0.0.1", port=8765, quiet=False):
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    server.quiet = quiet
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the vaccination services as local HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default=db.DB_PATH, help="database file")
+    parser.add_argument("--quiet", action="store_true", help="do not log each request")
+    args = parser.parse_args(argv)
+
+    db.configure(args.db)
+    migrations.migrate(db.connection())
+    server = make_server(args.host, args.port, args.quiet)
+    print(f"Serving on http://{args.host}:{server.server_address[1]}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        db.close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import socketserver
+import sqlite3
+import struct
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import db
+import migrations
+import replication
+from replication import SyncError
+
+# One above the HTTP API's default (cvms_server.py), so both can run on one machine
+DEFAULT_PORT = 8766
+MAX_FRAME = 64 * 1024 * 1024
+# Full passes simulate() allows for sites to stop changing each other once writes stop
+SETTLE_PASSES = 10
+
+
+# Batch files and the socket protocol share one framing: a 4-byte length, then the bytes
+def write_frame(stream, data):
+    stream.write(struct.pack(">I", len(data)))
+    stream.write(data)
+
+
+def read_frame(stream):
+    header = stream.read(4)
+    if not header:
+        return None
+    if len(header) < 4:
+        raise SyncError("Truncated frame")
+    (size,) = struct.unpack(">I", header)
+    if size > MAX_FRAME:
+        raise SyncError(f"Frame of {size} bytes is too large")
+    data = stream.read(size)
+    if len(data) < size:
+        raise SyncError("Truncated frame")
+    return data
+
+
+def open_database(path):
+    conn = db.ConnectionPool(path).connect()
+    migrations.migrate(conn)
+    return conn
+
+
+def batches(conn, peer, after, limit=replication.BATCH_SIZE):
+    """Encoded batches for peer from its resume token until the log is exhausted."""
+    while True:
+        batch = replication.export_batch(conn, peer, after, limit)
+        if batch["to"] == after:
+            return
+        yield batch
+        after = batch["to"]
+
+
+# File transport: carry the file over however you like, then import it at the peer
+def export_file(conn, peer, after, path, limit=replication.BATCH_SIZE):
+    count = changes = 0
+    with open(path, "wb") as f:
+        for batch in batches(conn, peer, after, limit):
+            write_frame(f, replication.encode(batch))
+            count += 1
+            changes += len(batch["changes"])
+    return count, changes
+
+
+def import_file(conn, path):
+    # Each batch commits on its own, so an interrupted import resumes where it stopped
+    results = []
+    with open(path, "rb") as f:
+        while (frame := read_frame(f)) is not None:
+            results.append(replication.apply_batch(conn, replication.decode(frame)))
+    return results
+
+
+# Socket transport: a local stand-in for the link between a camp and the central site
+class SyncHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        conn = self.server.conn
+        while (frame := read_frame(self.rfile)) is not None:
+            request = json.loads(frame)
+            batch = None
+            try:
+                if request["op"] == "hello":
+                    reply = {"site": replication.site_id(conn), "token": replication.token(conn, request["site"])}
+                elif request["op"] == "push":
+                    result = replication.apply_batch(conn, replication.decode(read_frame(self.rfile)))
+                    reply = {"to": result.to, "applied": result.applied}
+                elif request["op"] == "pull":
+                    batch = replication.export_batch(conn, request["site"], request["after"], request["limit"])
+                    reply = {}
+                else:
+                    reply = {"error": f"Unknown operation {request['op']}"}
+            except (SyncError, sqlite3.Error, KeyError) as e:
+                reply, batch = {"error": str(e)}, None
+            write_frame(self.wfile, json.dumps(reply).encode("utf-8"))
+            if batch is not None:
+                write_frame(self.wfile, replication.encode(batch))
+            self.wfile.flush()
+
+
+def serve(path, host="127.0.0.1", port=DEFAULT_PORT):
+    with socketserver.TCPServer((host, port), SyncHandler) as server:
+        server.conn = open_database(path)
+        print(f"Site {replication.site_id(server.conn)} serving {path} on {host}:{port}", file=sys.stderr)
+        server.serve_forever()
+
+
+def sync_with(conn, address, limit=replication.BATCH_SIZE):
+    """Push local changes to the peer at address, then pull its changes; returns (peer, pushed, pulled)."""
+    with socket.create_connection(address) as sock, sock.makefile("rwb") as stream:
+        def call(request, payload=None):
+            write_frame(stream, json.dumps(request).encode("utf-8"))
+            if payload is not None:
+                write_frame(stream, payload)
+            stream.flush()
+            reply = json.loads(read_frame(stream))
+            if "error" in reply:
+                raise SyncError(f"Peer refused: {reply['error']}")
+            return reply
+
+        me = replication.site_id(conn)
+        hello = call({"op": "hello", "site": me})
+        peer, pushed, pulled = hello["site"], 0, 0
+        for batch in batches(conn, peer, hello["token"], limit):
+            pushed += call({"op": "push"}, replication.encode(batch))["applied"]
+        while True:
+            after = replication.token(conn, peer)
+            call({"op": "pull", "site": me, "after": after, "limit": limit})
+            batch = replication.decode(read_frame(stream))
+            if batch["to"] == after:
+                return peer, pushed, pulled
+            pulled += replication.apply_batch(conn, batch).applied
+
+
+def _fingerprint(conn):
+    # Row contents per table with foreign keys replaced by the referenced row's contents,
+    # so databases that number their rows differently still compare equal
+    rows = {}
+    for table, (foreign_keys, _) in replication.TABLES.items():
+        cursor = conn.execute(f"SELECT * FROM {table}")
+        columns = [column[0] for column in cursor.description]
+        rows[table] = {}
+        for values in cursor.fetchall():
+            record = dict(zip(columns, values))
+            row_id = record.pop("id")
+            rows[table][row_id] = tuple((name, rows[foreign_keys[name]].get(value) if name in foreign_keys else value)
+                                        for name, value in sorted(record.items()))
+    return {table: Counter(contents.values()) for table, contents in rows.items()}
+
+
+def _random_writes(conn, rng, site, step, writes):
+    # The kinds of writes the app makes, plus deletes and usernames taken at two sites at once
+    children = [row[0] for row in conn.execute("SELECT id FROM children")]
+    vaccines = [row[0] for row in conn.execute("SELECT id FROM vaccines")]
+    hospital_id = conn.execute("SELECT MIN(id) FROM hospitals").fetchone()[0]
+    for n in range(writes):
+        kind = rng.random()
+        with conn:
+            if kind < 0.15:
+                username = f"shared{step}" if rng.random() < 0.3 else f"p{site}-{step}-{n}"
+                cursor = conn.execute("INSERT OR IGNORE INTO parents (username, password, name, contact) VALUES (?, '', ?, ?)",
+                                      (username, f"Parent {site}/{step}", f"555-{rng.randrange(10 ** 6):06d}"))
+                if cursor.rowcount:
+                    conn.execute("INSERT INTO children (parent_id, name, dob) VALUES (?, ?, '2025-06-01')",
+                                 (cursor.lastrowid, f"Child {site}/{step}/{n}"))
+            elif kind < 0.45:
+                conn.execute("""
+                    INSERT OR IGNORE INTO vaccine_records (child_id, vaccine_id, hospital_id, date_administered, status)
+                    VALUES (?, ?, ?, '2026-02-01', 'Scheduled')
+                """, (rng.choice(children), rng.choice(vaccines), hospital_id))
+            elif kind < 0.65:
+                conn.execute("UPDATE vaccine_records SET status = ? WHERE id = (SELECT id FROM vaccine_records ORDER BY random() LIMIT 1)",
+                             (rng.choice(("Administered", "Cancelled", "Scheduled")),))
+            elif kind < 0.8:
+                conn.execute("UPDATE children SET name = ? WHERE id = ?", (f"Renamed {site}/{step}/{n}", rng.choice(children)))
+            elif kind < 0.95:
+                conn.execute("""
+                    INSERT OR IGNORE INTO payments (vaccine_record_id, amount, status, date_paid)
+                    SELECT id, 50.0, 'Paid', '2026-02-01' FROM vaccine_records ORDER BY random() LIMIT 1
+                """)
+            else:
+                record = conn.execute("SELECT id FROM vaccine_records ORDER BY random() LIMIT 1").fetchone()
+                if record is not None:
+                    conn.execute("DELETE FROM payments WHERE vaccine_record_id = ?", record)
+                    conn.execute("DELETE FROM vaccine_records WHERE id = ?", record)
+
+
+def _exchange(source, target, limit):
+    shipped = 0
+    for batch in batches(source, replication.site_id(target), replication.token(target, replication.site_id(source)), limit):
+        data = replication.encode(batch)
+        shipped += len(data)
+        replication.apply_batch(target, replication.decode(data))
+    return shipped
+
+
+def simulate(sites=3, rounds=15, writes=40, children=500, seed=0, limit=200, independent=1):
+    """Random writes at every site with syncs between random pairs; checks all sites converge.
+
+    Site 0 is generated; the last `independent` sites are generated separately (their own
+    rows, their own site ids) and the rest start as clones of site 0.
+    """
+    import cvms_datagen
+
+    scratch = tempfile.mkdtemp(prefix="cvms-sync-")
+    paths = [os.path.join(scratch, f"site{site}.db") for site in range(sites)]
+    clones = sites - 1 - min(independent, sites - 1)
+    conns = []
+    for site, path in enumerate(paths):
+        if 0 < site <= clones:
+            # Outreach sites start as a copy of the central file, then only ever exchange deltas
+            replication.clone(conns[0], path)
+        else:
+            cvms_datagen.generate(path, children, seed=seed + site)
+        conns.append(open_database(path))
+
+    rng = random.Random(seed)
+    shipped = syncs = 0
+    started = time.perf_counter()
+    for step in range(rounds):
+        for site, conn in enumerate(conns):
+            _random_writes(conn, rng, site, step, writes)
+        for _ in range(sites):
+            a, b = rng.sample(range(sites), 2)
+            shipped += _exchange(conns[a], conns[b], limit)
+            syncs += 1
+    # Settle: keep syncing every pair until a full pass changes nothing
+    settled = False
+    for _ in range(SETTLE_PASSES):
+        before = [conn.execute("SELECT IFNULL(MAX(seq), 0) FROM changes").fetchone()[0] for conn in conns]
+        for a in range(sites):
+            for b in range(sites):
+                if a != b:
+                    shipped += _exchange(conns[a], conns[b], limit)
+                    syncs += 1
+        if before == [conn.execute("SELECT IFNULL(MAX(seq), 0) FROM changes").fetchone()[0] for conn in conns]:
+            settled = True
+            break
+    elapsed = time.perf_counter() - started
+
+    fingerprints = [_fingerprint(conn) for conn in conns]
+    diverged = [site for site in range(1, sites) if not settled or fingerprints[site] != fingerprints[0]]
+    database_size = os.path.getsize(paths[0])
+    rows = sum(sum(counts.values()) for counts in fingerprints[0].values())
+    for conn in conns:
+        conn.close()
+    shutil.rmtree(scratch, ignore_errors=True)
+
+    print(f"{sites} sites x {rounds} rounds x {writes} writes, {syncs} syncs in {elapsed:.2f}s: "
+          f"{shipped:,} bytes shipped in total (one database file is {database_size:,}), {rows} rows each")
+    print("PASS" if not diverged else f"FAIL: sites {diverged} differ from site 0"
+                                      f"{'' if settled else ' (still changing after the settle passes)'}")
+    return not diverged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replicate between vaccination databases.")
+    parser.add_argument("--db", default=db.DB_PATH, help="database file")
+    parser.add_argument("--limit", type=int, default=replication.BATCH_SIZE, help="rows per batch")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("site", help="show this database's site id")
+    copy = commands.add_parser("clone", help="copy this database to a new file that syncs as a new site")
+    copy.add_argument("file")
+    copy.add_argument("--site", type=int, help="site id for the copy (default: a random unused one)")
+    token = commands.add_parser("token", help="print the resume token to hand to a peer exporting for us")
+    token.add_argument("peer", type=int)
+    export = commands.add_parser("export", help="write the changes a peer has not seen to a batch file")
+    export.add_argument("peer", type=int)
+    export.add_argument("file")
+    export.add_argument("--after", type=int, default=0, help="the peer's resume token")
+    load = commands.add_parser("import", help="apply a batch file from a peer")
+    load.add_argument("file")
+    server = commands.add_parser("serve", help="accept sync connections")
+    server.add_argument("--host", default="127.0.0.1")
+    server.add_argument("--port", type=int, default=DEFAULT_PORT)
+    client = commands.add_parser("sync", help="two-way sync with a serving peer")
+    client.add_argument("address", help="HOST:PORT")
+    commands.add_parser("compact", help="drop change log entries superseded by later writes")
+    sim = commands.add_parser("simulate", help="multi-site convergence check on scratch databases")
+    sim.add_argument("--sites", type=int, default=3)
+    sim.add_argument("--rounds", type=int, default=15)
+    sim.add_argument("--writes", type=int, default=40, help="writes per site per round")
+    sim.add_argument("--independent", type=int, default=1,
+                     help="sites installed separately rather than cloned from site 0")
+    sim.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == "simulate":
+        return 0 if simulate(args.sites, args.rounds, args.writes, seed=args.seed, limit=args.limit,
+                             independent=args.independent) else 1
+    if args.command == "serve":
+        serve(args.db, args.host, args.port)
+        return 0
+    try:
+        conn = open_database(args.db)
+        if args.command == "site":
+            print(replication.site_id(conn))
+        elif args.command == "clone":
+            print(f"Cloned to {args.file} as site {replication.clone(conn, args.file, args.site)}")
+        elif args.command == "token":
+            print(replication.token(conn, args.peer))
+        elif args.command == "export":
+            count, changes = export_file(conn, args.peer, args.after, args.file, args.limit)
+            print(f"Wrote {changes} changes in {count} batches to {args.file}")
+        elif args.command == "import":
+            for result in import_file(conn, args.file):
+                print(f"Site {result.source} changes {result.after}-{result.to}: "
+                      f"{result.applied} applied, {result.skipped} already current")
+        elif args.command == "sync":
+            host, _, port = args.address.rpartition(":")
+            peer, pushed, pulled = sync_with(conn, (host, int(port)), args.limit)
+            print(f"Synced with site {peer}: {pushed} changes pushed, {pulled} pulled")
+        else:
+            print(f"Removed {replication.compact(conn)} superseded log entries")
+    except (SyncError, sqlite3.Error, OSError) as e:
+        print(f"Sync failed: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
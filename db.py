@@ -0,0 +1,141 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import profiling
+
+DB_PATH = "vaccination_system.db"
+
+# Applied to every connection the pool opens
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+STATEMENT_CACHE_SIZE = 256
+POOL_SIZE = 4
+
+
+class ConnectionPool:
+    """Hands out one long-lived, pre-configured connection per thread.
+
+    Connections released by finished threads are parked (up to ``size``)
+    and reused by the next thread that asks, so the schema is parsed and
+    the pragmas applied only once per connection.
+    """
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._idle = []
+        self._open = set()
+
+    def _create(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE, factory=profiling.connection_factory())
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._create()
+                with self._lock:
+                    self._open.add(conn)
+            self._local.conn = conn
+        return conn
+
+    def release(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+            self._open.discard(conn)
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            conns, self._open, self._idle = self._open, set(), []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def configure(path=DB_PATH, size=POOL_SIZE):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = ConnectionPool(path, size)
+    return _pool
+
+
+def connection():
+    return get_pool().connect()
+
+
+@contextmanager
+def transaction():
+    conn = connection()
+    with conn:
+        yield conn.cursor()
+
+
+@contextmanager
+def immediate():
+    # Takes the write lock up front, so read-then-update sequences cannot interleave
+    conn = connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def query_all(sql, params=()):
+    return connection().execute(sql, params).fetchall()
+
+
+def query_one(sql, params=()):
+    return connection().execute(sql, params).fetchone()
+
+
+def execute(sql, params=()):
+    with transaction() as cursor:
+        cursor.execute(sql, params)
+        return cursor.lastrowid
+
+
+def close_all():
+    if _pool is not None:
+        _pool.close_all()
@@ -0,0 +1,221 @@
+import argparse
+import sqlite3
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import Optional
+
+import db
+from reminders import OVERDUE_AFTER_DAYS, Reminder, add_months
+
+# Triggers from migration 10 put every child whose schedule may have changed into
+# due_doses_dirty; flush() recomputes just those children before due_doses is read.
+FLUSH_BATCH_SIZE = 500
+
+
+@dataclass(frozen=True)
+class Dose:
+    vaccine_id: int
+    series: str
+    dose_number: int
+    age_months: int
+    min_interval_days: int
+    catch_up_months: Optional[int]
+
+
+@dataclass(frozen=True)
+class DueDose:
+    child_id: int
+    child_name: str
+    parent_id: int
+    vaccine_id: int
+    vaccine_name: str
+    dose_number: int
+    due_date: str
+    expires: Optional[str]
+
+
+DUE_DOSE_COLUMNS = """
+    d.child_id, c.name, c.parent_id, d.vaccine_id, v.name, v.dose_number, d.due_date, d.expires
+"""
+DUE_BY_PARENT_SQL = """
+    SELECT d.child_id, c.name, d.vaccine_id, v.name, v.age_months, d.due_date
+    FROM children c
+    JOIN due_doses d ON d.child_id = c.id
+    JOIN vaccines v ON v.id = d.vaccine_id
+    WHERE c.parent_id = ? AND d.due_date <= ? AND (d.expires IS NULL OR d.expires >= ?)
+    ORDER BY c.id, d.due_date, d.vaccine_id
+"""
+
+
+def load_schedule(cursor):
+    # Vaccines without a series are single-dose series of their own
+    cursor.execute("""
+        SELECT id, IFNULL(series, '#' || id), dose_number, IFNULL(age_months, 0), min_interval_days, catch_up_months
+        FROM vaccines ORDER BY 2, dose_number, id
+    """)
+    return [Dose(*row) for row in cursor.fetchall()]
+
+
+def _parse(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def due_dates(dob, given, booked, schedule):
+    """Yield (vaccine_id, due_date, expires) for the next outstanding dose of each series.
+
+    given maps vaccine_id to the date that dose was administered; booked holds the
+    vaccine ids with an appointment still scheduled. A dose is due at its recommended
+    age, but never sooner than min_interval_days after the previous dose in its series
+    was given. A booked dose needs no reminder, so its series yields nothing until it
+    is given. Doses whose catch-up window closed before they fell due are passed over.
+    """
+    for _, doses in groupby(schedule, key=lambda dose: dose.series):
+        previous = None
+        for dose in doses:
+            if dose.vaccine_id in given:
+                previous = _parse(given[dose.vaccine_id]) or previous
+                continue
+            due = add_months(dob, dose.age_months)
+            if previous is not None:
+                due = max(due, previous + timedelta(days=dose.min_interval_days))
+            expires = add_months(dob, dose.catch_up_months) if dose.catch_up_months is not None else None
+            if expires is not None and expires < due:
+                continue
+            if dose.vaccine_id not in booked:
+                yield dose.vaccine_id, due.isoformat(), expires.isoformat() if expires else None
+            break
+
+
+def _refresh(cursor, child_ids, schedule):
+    marks = ", ".join("?" * len(child_ids))
+    cursor.execute(f"DELETE FROM due_doses WHERE child_id IN ({marks})", child_ids)
+    cursor.execute(f"SELECT id, dob FROM children WHERE id IN ({marks})", child_ids)
+    births = cursor.fetchall()
+    # Cancelled records count for nothing: the dose is outstanding again
+    cursor.execute(f"""
+        SELECT child_id, vaccine_id, date_administered, status FROM vaccine_records
+        WHERE child_id IN ({marks}) AND status IN ('Administered', 'Scheduled')
+    """, child_ids)
+    given, booked = {}, {}
+    for child_id, vaccine_id, day, status in cursor.fetchall():
+        if status == "Administered":
+            given.setdefault(child_id, {})[vaccine_id] = day
+        else:
+            booked.setdefault(child_id, set()).add(vaccine_id)
+    rows = []
+    for child_id, dob in births:
+        dob = _parse(dob)
+        if dob is not None:
+            rows.extend((child_id, *due) for due in due_dates(dob, given.get(child_id, {}), booked.get(child_id, ()),
+                                                              schedule))
+    cursor.executemany("INSERT INTO due_doses (child_id, vaccine_id, due_date, expires) VALUES (?, ?, ?, ?)", rows)
+
+
+def flush(batch_size=FLUSH_BATCH_SIZE):
+    """Recompute the due doses of every child marked dirty; returns how many children were refreshed."""
+    if db.query_one("SELECT 1 FROM due_doses_dirty LIMIT 1") is None:
+        return 0
+    refreshed = 0
+    with db.immediate() as cursor:
+        schedule = load_schedule(cursor)
+        while True:
+            cursor.execute("SELECT child_id FROM due_doses_dirty LIMIT ?", (batch_size,))
+            child_ids = [row[0] for row in cursor.fetchall()]
+            if not child_ids:
+                return refreshed
+            _refresh(cursor, child_ids, schedule)
+            cursor.execute(f"DELETE FROM due_doses_dirty WHERE child_id IN ({', '.join('?' * len(child_ids))})",
+                           child_ids)
+            refreshed += len(child_ids)
+
+
+def rebuild(conn, batch_size=FLUSH_BATCH_SIZE):
+    # Migration step: compute every child's schedule, batch by batch in id order
+    cursor = conn.cursor()
+    schedule = load_schedule(cursor)
+    cursor.execute("DELETE FROM due_doses")
+    cursor.execute("DELETE FROM due_doses_dirty")
+    last_id = 0
+    while True:
+        cursor.execute("SELECT id FROM children WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size))
+        child_ids = [row[0] for row in cursor.fetchall()]
+        if not child_ids:
+            return
+        _refresh(cursor, child_ids, schedule)
+        last_id = child_ids[-1]
+
+
+def due_between(start, end, after=None, limit=500):
+    """Doses falling due from start to end inclusive and still within their catch-up window.
+
+    Ordered by (due_date, child_id, vaccine_id); pass the last row's triple as after for the next page.
+    """
+    flush()
+    sql = f"""
+        SELECT {DUE_DOSE_COLUMNS}
+        FROM due_doses d
+        JOIN children c ON c.id = d.child_id
+        JOIN vaccines v ON v.id = d.vaccine_id
+        WHERE d.due_date BETWEEN ? AND ? AND (d.expires IS NULL OR d.expires >= ?)
+    """
+    params = [start, end, start]
+    if after is not None:
+        sql += " AND (d.due_date, d.child_id, d.vaccine_id) > (?, ?, ?)"
+        params.extend(after)
+    sql += " ORDER BY d.due_date, d.child_id, d.vaccine_id LIMIT ?"
+    params.append(limit)
+    return [DueDose(*row) for row in db.query_all(sql, params)]
+
+
+def reminders_for_parent(parent_id, today=None):
+    """Doses already due for the parent's children, flagged overdue after OVERDUE_AFTER_DAYS."""
+    flush()
+    today = today or datetime.now().date()
+    reminders = []
+    for child_id, child_name, vaccine_id, vaccine_name, age_months, due in db.query_all(
+            DUE_BY_PARENT_SQL, (parent_id, today.isoformat(), today.isoformat())):
+        due_date = _parse(due)
+        overdue = (today - due_date).days >= OVERDUE_AFTER_DAYS
+        reminders.append(Reminder(child_id, child_name, vaccine_id, vaccine_name, age_months, due_date, overdue))
+    return reminders
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the precomputed due_doses index.")
+    parser.add_argument("command", choices=("flush", "rebuild", "due"),
+                        help="flush: refresh children changed since the last read; rebuild: recompute all; "
+                             "due: list doses due in the next --days days")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--db", default=db.DB_PATH, help="database file")
+    args = parser.parse_args(argv)
+
+    import migrations
+
+    db.configure(args.db)
+    try:
+        migrations.migrate()
+        if args.command == "flush":
+            print(f"Refreshed {flush()} children")
+        elif args.command == "rebuild":
+            with db.immediate() as cursor:
+                rebuild(cursor.connection)
+            print("Rebuilt")
+        else:
+            today = datetime.now().date()
+            for dose in due_between(today.isoformat(), (today + timedelta(days=args.days)).isoformat(), limit=10 ** 9):
+                print(f"{dose.due_date}  {dose.child_name} (child {dose.child_id}): {dose.vaccine_name}")
+    except sqlite3.Error as e:
+        print(f"Schedule maintenance failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+
+
+def _pil():
+    # PIL costs more to import than the rest of the app together, and it is not
+    # needed until the first background is drawn (on a worker thread, off startup)
+    from PIL import Image, ImageTk
+    return Image, ImageTk
+
+
+class ImageCache:
+    """Decodes each image file once and keeps resampled copies per size.
+
+    ``scaled()`` does the PIL work and may run on any thread; ``photo()``
+    wraps a scaled copy in a PhotoImage and must run on the Tk thread.
+    Only the most recent ``max_sizes`` (path, size) entries are kept, so
+    repeated window resizes do not grow memory without bound.
+    """
+
+    def __init__(self, max_sizes=6):
+        self.max_sizes = max_sizes
+        self.sources = {}
+        self.scaled_images = OrderedDict()
+        self.photos = {}
+        self.lock = threading.Lock()
+
+    def source(self, path):
+        with self.lock:
+            img = self.sources.get(path)
+        if img is None:
+            Image, _ = _pil()
+            with Image.open(path) as opened:
+                img = opened.convert("RGB")
+            with self.lock:
+                self.sources[path] = img
+        return img
+
+    def scaled(self, path, size):
+        key = (path, size)
+        with self.lock:
+            if key in self.scaled_images:
+                self.scaled_images.move_to_end(key)
+                return self.scaled_images[key]
+        Image, _ = _pil()
+        img = self.source(path).resize(size, Image.Resampling.LANCZOS)
+        with self.lock:
+            self.scaled_images[key] = img
+            while len(self.scaled_images) > self.max_sizes:
+                self.scaled_images.popitem(last=False)
+        return img
+
+    def cached_photo(self, path, size):
+        return self.photos.get((path, size))
+
+    def photo(self, path, size):
+        key = (path, size)
+        photo = self.photos.get(key)
+        if photo is None:
+            _, ImageTk = _pil()
+            photo = ImageTk.PhotoImage(self.scaled(path, size))
+            self.photos[key] = photo
+            # PhotoImages are released here, on the Tk thread, never by a worker
+            with self.lock:
+                stale = [k for k in self.photos if k not in self.scaled_images]
+            for k in stale:
+                del self.photos[k]
+        return photo
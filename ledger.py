@@ -0,0 +1,154 @@
+import argparse
+import sqlite3
+import sys
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+
+import db
+
+DEFAULT_FEE = 50.00
+
+
+@dataclass(frozen=True)
+class Charge:
+    payment_id: int
+    vaccine_record_id: int
+    amount: float
+    created: bool
+
+
+@dataclass(frozen=True)
+class Settlement:
+    id: int
+    through_date: str
+    payment_count: int
+    total_amount: float
+
+
+class PriceTable:
+    """Per-vaccine fees, read once and refreshed only when a price is written."""
+
+    def __init__(self):
+        self.prices = None
+        self.lock = threading.Lock()
+
+    def get(self, vaccine_id):
+        prices = self.prices
+        if prices is None:
+            with self.lock:
+                if self.prices is None:
+                    self.prices = dict(db.query_all("SELECT vaccine_id, amount FROM vaccine_prices"))
+                prices = self.prices
+        return prices.get(vaccine_id, DEFAULT_FEE)
+
+    def set(self, vaccine_id, amount):
+        db.execute("""
+            INSERT INTO vaccine_prices (vaccine_id, amount) VALUES (?, ?)
+            ON CONFLICT(vaccine_id) DO UPDATE SET amount = excluded.amount
+        """, (vaccine_id, amount))
+        self.invalidate()
+
+    def invalidate(self):
+        with self.lock:
+            self.prices = None
+
+
+prices = PriceTable()
+
+# The UNIQUE indexes on vaccine_record_id and idempotency_key make a retried or
+# concurrent charge for the same appointment a no-op instead of a second row
+CHARGE_SQL = """
+    INSERT INTO payments (vaccine_record_id, amount, status, date_paid, idempotency_key)
+    VALUES (?, ?, 'Paid', ?, ?)
+    ON CONFLICT DO NOTHING
+"""
+
+
+def _today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def charge(vaccine_record_id, vaccine_id, idempotency_key=None, date_paid=None):
+    amount = prices.get(vaccine_id)
+    with db.transaction() as cursor:
+        cursor.execute(CHARGE_SQL, (vaccine_record_id, amount, date_paid or _today(), idempotency_key))
+        created = cursor.rowcount == 1
+        cursor.execute("SELECT id, amount FROM payments WHERE vaccine_record_id = ?", (vaccine_record_id,))
+        row = cursor.fetchone()
+    if row is None:
+        # The idempotency key was already used for a different appointment
+        raise sqlite3.IntegrityError("Idempotency key already used")
+    return Charge(row[0], vaccine_record_id, row[1], created)
+
+
+def record_batch(entries, date_paid=None):
+    """Load many (vaccine_record_id, vaccine_id, idempotency_key) charges in one transaction.
+
+    Returns the number of new payments; charges already on file are skipped.
+    """
+    date_paid = date_paid or _today()
+    rows = [(record_id, prices.get(vaccine_id), date_paid, key) for record_id, vaccine_id, key in entries]
+    with db.transaction() as cursor:
+        # rowcount, unlike total_changes, leaves out rows the coverage and change log triggers write
+        cursor.executemany(CHARGE_SQL, rows)
+        return cursor.rowcount
+
+
+def settle(through_date=None):
+    """Mark every unsettled payment up to through_date as settled, in one transaction."""
+    through_date = through_date or _today()
+    with db.immediate() as cursor:
+        cursor.execute("INSERT INTO settlements (settled_at, through_date) VALUES (?, ?)",
+                       (datetime.now().isoformat(timespec="seconds"), through_date))
+        settlement_id = cursor.lastrowid
+        cursor.execute("""
+            UPDATE payments SET status = 'Settled', settlement_id = ?
+            WHERE status = 'Paid' AND date_paid <= ?
+        """, (settlement_id, through_date))
+        cursor.execute("SELECT COUNT(*), COALESCE(ROUND(SUM(amount), 2), 0) FROM payments WHERE settlement_id = ?",
+                       (settlement_id,))
+        count, total = cursor.fetchone()
+        cursor.execute("UPDATE settlements SET payment_count = ?, total_amount = ? WHERE id = ?",
+                       (count, total, settlement_id))
+    return Settlement(settlement_id, through_date, count, total)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Payment ledger maintenance.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    settle_cmd = commands.add_parser("settle", help="settle all payments up to a date")
+    settle_cmd.add_argument("--through", help="last payment date to include, YYYY-MM-DD (default: today)")
+    price_cmd = commands.add_parser("set-price", help="set the fee for a vaccine")
+    price_cmd.add_argument("vaccine_id", type=int)
+    price_cmd.add_argument("amount", type=float)
+    parser.add_argument("--db", default=db.DB_PATH, help="database file")
+    args = parser.parse_args(argv)
+
+    import migrations
+
+    db.configure(args.db)
+    try:
+        migrations.migrate()
+        if args.command == "settle":
+            if args.through:
+                try:
+                    datetime.strptime(args.through, "%Y-%m-%d")
+                except ValueError:
+                    parser.error("Invalid date format (use YYYY-MM-DD)")
+            result = settle(args.through)
+            print(f"Settlement {result.id}: {result.payment_count} payments, "
+                  f"{result.total_amount:.2f} through {result.through_date}")
+        else:
+            prices.set(args.vaccine_id, args.amount)
+            print(f"Vaccine {args.vaccine_id} now costs {args.amount:.2f}")
+    except sqlite3.Error as e:
+        print(f"Ledger operation failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
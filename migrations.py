@@ -0,0 +1,596 @@
+import sqlite3
+
+import coverage_summary
+import db
+import dose_schedule
+import replication
+import search
+
+
+# Version 1: the original schema and seed data
+BASE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS parents (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE,
+        password TEXT,
+        name TEXT,
+        contact TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS children (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        parent_id INTEGER,
+        name TEXT,
+        dob TEXT,
+        FOREIGN KEY (parent_id) REFERENCES parents(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS hospitals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        username TEXT UNIQUE,
+        password TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS health_workers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        hospital_id INTEGER,
+        name TEXT,
+        username TEXT UNIQUE,
+        password TEXT,
+        FOREIGN KEY (hospital_id) REFERENCES hospitals(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS vaccines (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        age_months INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS vaccine_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        child_id INTEGER,
+        vaccine_id INTEGER,
+        hospital_id INTEGER,
+        health_worker_id INTEGER,
+        date_administered TEXT,
+        status TEXT,
+        FOREIGN KEY (child_id) REFERENCES children(id),
+        FOREIGN KEY (vaccine_id) REFERENCES vaccines(id),
+        FOREIGN KEY (hospital_id) REFERENCES hospitals(id),
+        FOREIGN KEY (health_worker_id) REFERENCES health_workers(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS payments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        vaccine_record_id INTEGER,
+        amount REAL,
+        status TEXT,
+        date_paid TEXT,
+        FOREIGN KEY (vaccine_record_id) REFERENCES vaccine_records(id)
+    )
+    """,
+    "INSERT INTO vaccines (name, age_months) SELECT 'DTP', 2 WHERE NOT EXISTS (SELECT 1 FROM vaccines WHERE name = 'DTP')",
+    "INSERT INTO vaccines (name, age_months) SELECT 'Measles', 9 WHERE NOT EXISTS (SELECT 1 FROM vaccines WHERE name = 'Measles')",
+]
+
+# Version 2: drop the duplicate vaccine seeds older builds inserted on every start,
+# merge each child's duplicate records of one vaccine, then index the lookup and join
+# columns. A merge keeps the administered record if there is one (else the oldest);
+# the others move to vaccine_records_archive with the payments that were moved off them.
+HOT_PATH_INDEXES = [
+    """
+    UPDATE vaccine_records SET vaccine_id = (
+        SELECT MIN(v2.id) FROM vaccines v1 JOIN vaccines v2 ON v2.name = v1.name
+        WHERE v1.id = vaccine_records.vaccine_id
+    )
+    WHERE vaccine_id IN (SELECT id FROM vaccines)
+    """,
+    "DELETE FROM vaccines WHERE id NOT IN (SELECT MIN(id) FROM vaccines GROUP BY name)",
+    """
+    CREATE TABLE IF NOT EXISTS vaccine_records_archive (
+        id INTEGER PRIMARY KEY,
+        child_id INTEGER,
+        vaccine_id INTEGER,
+        hospital_id INTEGER,
+        health_worker_id INTEGER,
+        date_administered TEXT,
+        status TEXT,
+        kept_id INTEGER NOT NULL,
+        payment_ids TEXT,
+        archived_at TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TEMP TABLE record_merges AS
+    SELECT id AS old_id, FIRST_VALUE(id) OVER (
+        PARTITION BY child_id, vaccine_id ORDER BY status IS 'Administered' DESC, id
+    ) AS kept_id
+    FROM vaccine_records WHERE child_id IS NOT NULL AND vaccine_id IS NOT NULL
+    """,
+    "DELETE FROM temp.record_merges WHERE old_id = kept_id",
+    """
+    INSERT INTO vaccine_records_archive (id, child_id, vaccine_id, hospital_id, health_worker_id, date_administered,
+                                         status, kept_id, payment_ids, archived_at)
+    SELECT r.id, r.child_id, r.vaccine_id, r.hospital_id, r.health_worker_id, r.date_administered, r.status, m.kept_id,
+           (SELECT group_concat(p.id) FROM payments p WHERE p.vaccine_record_id = r.id), datetime('now')
+    FROM vaccine_records r JOIN temp.record_merges m ON m.old_id = r.id
+    """,
+    """
+    UPDATE payments SET vaccine_record_id = (SELECT kept_id FROM temp.record_merges WHERE old_id = payments.vaccine_record_id)
+    WHERE vaccine_record_id IN (SELECT old_id FROM temp.record_merges)
+    """,
+    "DELETE FROM vaccine_records WHERE id IN (SELECT old_id FROM temp.record_merges)",
+    "DROP TABLE temp.record_merges",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_vaccines_name ON vaccines (name)",
+    "CREATE INDEX IF NOT EXISTS idx_children_parent ON children (parent_id, name, dob)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_vaccine_records_child_vaccine ON vaccine_records (child_id, vaccine_id)",
+    "CREATE INDEX IF NOT EXISTS idx_vaccine_records_hospital ON vaccine_records (hospital_id, date_administered, status)",
+    "CREATE INDEX IF NOT EXISTS idx_payments_record ON payments (vaccine_record_id, amount, status)",
+]
+
+# Version 3: keyset pagination over a hospital's appointments, sorted by date or status.
+# Index keys end in the rowid, so (hospital_id, date_administered) also orders ties by vr.id
+APPOINTMENT_PAGING_INDEXES = [
+    "DROP INDEX IF EXISTS idx_vaccine_records_hospital",
+    "CREATE INDEX IF NOT EXISTS idx_vaccine_records_hospital_date ON vaccine_records (hospital_id, date_administered)",
+    "CREATE INDEX IF NOT EXISTS idx_vaccine_records_hospital_status ON vaccine_records (hospital_id, status, date_administered)",
+]
+
+# Version 4: bulk import checkpoints, committed in the same transaction as each batch
+IMPORT_PROGRESS = [
+    """
+    CREATE TABLE IF NOT EXISTS import_progress (
+        source TEXT PRIMARY KEY,
+        rows_done INTEGER NOT NULL,
+        updated_at TEXT
+    )
+    """,
+]
+
+# Version 5: overdue reporting turns each vaccine's schedule into a dob cutoff
+REPORTING_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_children_dob ON children (dob)",
+    "CREATE INDEX IF NOT EXISTS idx_payments_date ON payments (date_paid, status, amount)",
+]
+
+# Version 6: passwords used to be stored in plaintext. Hashing every account here froze
+# the first launch for minutes, so they are upgraded on login and by a background
+# thread the app starts (credentials.hash_plaintext_passwords) instead.
+HASH_PASSWORDS = []
+
+# Version 7: bookable slot inventory per hospital and health worker. The partial index
+# only holds slots with room left, so "next available" is a range scan over open slots.
+APPOINTMENT_SLOTS = [
+    """
+    CREATE TABLE IF NOT EXISTS appointment_slots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        hospital_id INTEGER NOT NULL,
+        health_worker_id INTEGER,
+        slot_date TEXT NOT NULL,
+        start_time TEXT NOT NULL,
+        capacity INTEGER NOT NULL CHECK (capacity > 0),
+        booked INTEGER NOT NULL DEFAULT 0 CHECK (booked >= 0 AND booked <= capacity),
+        FOREIGN KEY (hospital_id) REFERENCES hospitals(id),
+        FOREIGN KEY (health_worker_id) REFERENCES health_workers(id)
+    )
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_slots_unique ON appointment_slots (hospital_id, slot_date, start_time, COALESCE(health_worker_id, 0))",
+    "CREATE INDEX IF NOT EXISTS idx_slots_open ON appointment_slots (slot_date, start_time, hospital_id) WHERE booked < capacity",
+    "CREATE INDEX IF NOT EXISTS idx_slots_open_hospital ON appointment_slots (hospital_id, slot_date, start_time) WHERE booked < capacity",
+    "ALTER TABLE vaccine_records ADD COLUMN slot_id INTEGER REFERENCES appointment_slots(id)",
+    "CREATE INDEX IF NOT EXISTS idx_vaccine_records_slot ON vaccine_records (slot_id)",
+]
+
+# Version 8: one payment per appointment, idempotency keys, per-vaccine prices and settlement batches
+PAYMENT_LEDGER = [
+    # Extra payments for one appointment are set aside, not lost
+    """
+    CREATE TABLE IF NOT EXISTS payments_archive (
+        id INTEGER PRIMARY KEY,
+        vaccine_record_id INTEGER,
+        amount REAL,
+        status TEXT,
+        date_paid TEXT,
+        kept_id INTEGER NOT NULL,
+        archived_at TEXT NOT NULL
+    )
+    """,
+    """
+    INSERT INTO payments_archive (id, vaccine_record_id, amount, status, date_paid, kept_id, archived_at)
+    SELECT p.id, p.vaccine_record_id, p.amount, p.status, p.date_paid, k.kept_id, datetime('now')
+    FROM payments p JOIN (SELECT vaccine_record_id, MIN(id) AS kept_id FROM payments GROUP BY vaccine_record_id) k
+         ON k.vaccine_record_id = p.vaccine_record_id
+    WHERE p.id != k.kept_id
+    """,
+    "DELETE FROM payments WHERE id IN (SELECT id FROM payments_archive)",
+    "DROP INDEX IF EXISTS idx_payments_record",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_record ON payments (vaccine_record_id)",
+    "ALTER TABLE payments ADD COLUMN idempotency_key TEXT",
+    "ALTER TABLE payments ADD COLUMN settlement_id INTEGER REFERENCES settlements(id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_idempotency ON payments (idempotency_key) WHERE idempotency_key IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_payments_unsettled ON payments (date_paid) WHERE status = 'Paid'",
+    "CREATE INDEX IF NOT EXISTS idx_payments_settlement ON payments (settlement_id, amount)",
+    """
+    CREATE TABLE IF NOT EXISTS vaccine_prices (
+        vaccine_id INTEGER PRIMARY KEY REFERENCES vaccines(id),
+        amount REAL NOT NULL CHECK (amount >= 0)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS settlements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        settled_at TEXT NOT NULL,
+        through_date TEXT NOT NULL,
+        payment_count INTEGER NOT NULL DEFAULT 0,
+        total_amount REAL NOT NULL DEFAULT 0
+    )
+    """,
+]
+
+
+
+# Version 9: coverage counters kept current by triggers (see coverage_summary.py).
+# hospital_coverage.overdue counts scheduled appointments dated before coverage_clock.as_of.
+def _record_delta(row, op):
+    # Adds (op "+") or removes (op "-") one vaccine_records row's share of hospital_coverage
+    return f"""
+        INSERT INTO hospital_coverage (hospital_id, vaccine_id) VALUES ({row}.hospital_id, {row}.vaccine_id)
+        ON CONFLICT DO NOTHING;
+        UPDATE hospital_coverage SET
+            scheduled = scheduled {op} ({row}.status IS 'Scheduled'),
+            administered = administered {op} ({row}.status IS 'Administered'),
+            cancelled = cancelled {op} ({row}.status IS 'Cancelled'),
+            overdue = overdue {op} IFNULL({row}.status IS 'Scheduled'
+                                         AND {row}.date_administered < (SELECT as_of FROM coverage_clock), 0),
+            paid = paid {op} EXISTS (SELECT 1 FROM payments p WHERE p.vaccine_record_id = {row}.id
+                                     AND p.status IN ('Paid', 'Settled'))
+        WHERE hospital_id = {row}.hospital_id AND vaccine_id = {row}.vaccine_id;
+    """
+
+
+def _payment_delta(row, op):
+    return f"""
+        UPDATE hospital_coverage SET paid = paid {op} 1
+        WHERE {row}.status IN ('Paid', 'Settled') AND (hospital_id, vaccine_id) =
+            (SELECT hospital_id, vaccine_id FROM vaccine_records WHERE id = {row}.vaccine_record_id);
+    """
+
+
+COVERAGE_SUMMARY = [
+    """
+    CREATE TABLE IF NOT EXISTS coverage_clock (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        as_of TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS hospital_coverage (
+        hospital_id INTEGER NOT NULL,
+        vaccine_id INTEGER NOT NULL,
+        scheduled INTEGER NOT NULL DEFAULT 0,
+        administered INTEGER NOT NULL DEFAULT 0,
+        cancelled INTEGER NOT NULL DEFAULT 0,
+        paid INTEGER NOT NULL DEFAULT 0,
+        overdue INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hospital_id, vaccine_id)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_vaccine_records_scheduled_date ON vaccine_records (date_administered) WHERE status = 'Scheduled'",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS coverage_record_insert AFTER INSERT ON vaccine_records BEGIN
+        {_record_delta("NEW", "+")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS coverage_record_delete AFTER DELETE ON vaccine_records BEGIN
+        {_record_delta("OLD", "-")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS coverage_record_update
+    AFTER UPDATE OF hospital_id, vaccine_id, status, date_administered ON vaccine_records BEGIN
+        {_record_delta("OLD", "-")}
+        {_record_delta("NEW", "+")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS coverage_payment_insert AFTER INSERT ON payments BEGIN
+        {_payment_delta("NEW", "+")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS coverage_payment_delete AFTER DELETE ON payments BEGIN
+        {_payment_delta("OLD", "-")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS coverage_payment_update AFTER UPDATE OF status, vaccine_record_id ON payments BEGIN
+        {_payment_delta("OLD", "-")}
+        {_payment_delta("NEW", "+")}
+    END
+    """,
+    coverage_summary.rebuild_hospitals,
+]
+
+# Version 10: multi-dose series. Each dose is a vaccines row (so it can be booked and
+# recorded like before) grouped by series; due_doses holds every child's outstanding
+# doses and is refreshed from due_doses_dirty, which the triggers below fill.
+# vaccine_coverage.overdue counts the due_doses rows due on or before coverage_clock.due_by
+# whose catch-up window is still open on as_of.
+def _dose(name, series, dose_number, age_months, min_interval_days=0, catch_up_months=None):
+    return ("""
+        INSERT INTO vaccines (name, age_months, series, dose_number, min_interval_days, catch_up_months)
+        SELECT ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM vaccines WHERE name = ?)
+    """, (name, age_months, series, dose_number, min_interval_days, catch_up_months, name))
+
+
+def _due_delta(row, op):
+    return f"""
+        INSERT INTO vaccine_coverage (vaccine_id, overdue)
+        SELECT {row}.vaccine_id, {op}1 FROM coverage_clock
+        WHERE {row}.due_date <= due_by AND ({row}.expires IS NULL OR {row}.expires >= as_of)
+        ON CONFLICT(vaccine_id) DO UPDATE SET overdue = overdue {op} 1;
+    """
+
+
+def _seed(*doses):
+    def step(conn):
+        for sql, params in doses:
+            conn.execute(sql, params)
+    return step
+
+
+DOSE_SCHEDULE = [
+    "ALTER TABLE vaccines ADD COLUMN series TEXT",
+    "ALTER TABLE vaccines ADD COLUMN dose_number INTEGER NOT NULL DEFAULT 1",
+    "ALTER TABLE vaccines ADD COLUMN min_interval_days INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE vaccines ADD COLUMN catch_up_months INTEGER",
+    "UPDATE vaccines SET series = name WHERE series IS NULL",
+    "UPDATE vaccines SET catch_up_months = 84 WHERE name = 'DTP'",
+    _seed(
+        _dose("DTP 2", "DTP", 2, 4, 28, 84),
+        _dose("DTP 3", "DTP", 3, 6, 28, 84),
+        _dose("Measles 2", "Measles", 2, 15, 28),
+    ),
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_vaccines_series_dose ON vaccines (series, dose_number)",
+    """
+    CREATE TABLE IF NOT EXISTS due_doses (
+        child_id INTEGER NOT NULL,
+        vaccine_id INTEGER NOT NULL,
+        due_date TEXT NOT NULL,
+        expires TEXT,
+        PRIMARY KEY (child_id, vaccine_id)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_due_doses_due ON due_doses (due_date, child_id, vaccine_id)",
+    "CREATE INDEX IF NOT EXISTS idx_due_doses_expires ON due_doses (expires)",
+    "CREATE TABLE IF NOT EXISTS due_doses_dirty (child_id INTEGER PRIMARY KEY)",
+    """
+    CREATE TRIGGER IF NOT EXISTS due_child_insert AFTER INSERT ON children BEGIN
+        INSERT INTO due_doses_dirty (child_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS due_child_update AFTER UPDATE OF dob ON children BEGIN
+        INSERT INTO due_doses_dirty (child_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS due_child_delete AFTER DELETE ON children BEGIN
+        DELETE FROM due_doses WHERE child_id = OLD.id;
+        DELETE FROM due_doses_dirty WHERE child_id = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS due_record_insert AFTER INSERT ON vaccine_records BEGIN
+        INSERT INTO due_doses_dirty (child_id) VALUES (NEW.child_id) ON CONFLICT DO NOTHING;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS due_record_update AFTER UPDATE OF child_id, vaccine_id, date_administered, status ON vaccine_records BEGIN
+        INSERT INTO due_doses_dirty (child_id) VALUES (OLD.child_id), (NEW.child_id) ON CONFLICT DO NOTHING;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS due_record_delete AFTER DELETE ON vaccine_records BEGIN
+        INSERT INTO due_doses_dirty (child_id) VALUES (OLD.child_id) ON CONFLICT DO NOTHING;
+    END
+    """,
+    # A schedule change can move anyone's due dates; rare enough to just mark everyone
+    """
+    CREATE TRIGGER IF NOT EXISTS due_schedule_insert AFTER INSERT ON vaccines BEGIN
+        INSERT INTO due_doses_dirty (child_id) SELECT id FROM children WHERE true ON CONFLICT DO NOTHING;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS due_schedule_update
+    AFTER UPDATE OF series, dose_number, age_months, min_interval_days, catch_up_months ON vaccines BEGIN
+        INSERT INTO due_doses_dirty (child_id) SELECT id FROM children WHERE true ON CONFLICT DO NOTHING;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS due_schedule_delete AFTER DELETE ON vaccines BEGIN
+        DELETE FROM due_doses WHERE vaccine_id = OLD.id;
+        INSERT INTO due_doses_dirty (child_id) SELECT id FROM children WHERE true ON CONFLICT DO NOTHING;
+    END
+    """,
+    "ALTER TABLE coverage_clock ADD COLUMN due_by TEXT NOT NULL DEFAULT ''",
+    """
+    CREATE TABLE IF NOT EXISTS vaccine_coverage (
+        vaccine_id INTEGER PRIMARY KEY,
+        overdue INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS coverage_due_insert AFTER INSERT ON due_doses BEGIN
+        {_due_delta("NEW", "+")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS coverage_due_delete AFTER DELETE ON due_doses BEGIN
+        {_due_delta("OLD", "-")}
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS coverage_vaccine_delete AFTER DELETE ON vaccines BEGIN
+        DELETE FROM vaccine_coverage WHERE vaccine_id = OLD.id;
+    END
+    """,
+    dose_schedule.rebuild,
+    coverage_summary.rebuild,
+]
+
+# Version 11: full-text and prefix search over children and their parents (see search.py)
+CHILD_SEARCH = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS child_search USING fts5 (
+        child_name, parent_name, contact,
+        tokenize = '{search.TOKENIZE}', prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_child_insert AFTER INSERT ON children BEGIN
+        INSERT INTO child_search (rowid, child_name, parent_name, contact)
+        SELECT NEW.id, NEW.name, p.name, p.contact FROM (SELECT 1) LEFT JOIN parents p ON p.id = NEW.parent_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_child_update AFTER UPDATE OF id, name, parent_id ON children BEGIN
+        DELETE FROM child_search WHERE rowid = OLD.id;
+        INSERT INTO child_search (rowid, child_name, parent_name, contact)
+        SELECT NEW.id, NEW.name, p.name, p.contact FROM (SELECT 1) LEFT JOIN parents p ON p.id = NEW.parent_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_child_delete AFTER DELETE ON children BEGIN
+        DELETE FROM child_search WHERE rowid = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_parent_update AFTER UPDATE OF name, contact ON parents BEGIN
+        UPDATE child_search SET parent_name = NEW.name, contact = NEW.contact
+        WHERE rowid IN (SELECT id FROM children WHERE parent_id = NEW.id);
+    END
+    """,
+    search.rebuild,
+]
+
+# Version 12: change log and sync bookkeeping for multi-site replication (see replication.py)
+CHANGE_LOG = [
+    """
+    CREATE TABLE IF NOT EXISTS sync_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        site_id INTEGER NOT NULL DEFAULT 0,
+        clock INTEGER NOT NULL DEFAULT 0,
+        applying_version INTEGER,
+        applying_site INTEGER
+    )
+    """,
+    "INSERT OR IGNORE INTO sync_state (id) VALUES (1)",
+    """
+    CREATE TABLE IF NOT EXISTS changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        tbl TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        site INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_changes_row ON changes (tbl, row_id, seq)",
+    """
+    CREATE TABLE IF NOT EXISTS sync_keys (
+        tbl TEXT NOT NULL,
+        origin_site INTEGER NOT NULL,
+        origin_id INTEGER NOT NULL,
+        row_id INTEGER NOT NULL,
+        alias INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (tbl, origin_site, origin_id)
+    ) WITHOUT ROWID
+    """,
+    # Covers to_global's lookup; without alias in it the planner prefers a scan of the primary key
+    "CREATE INDEX IF NOT EXISTS idx_sync_keys_row ON sync_keys (tbl, row_id, alias)",
+    """
+    CREATE TABLE IF NOT EXISTS sync_bases (
+        tbl TEXT PRIMARY KEY,
+        site INTEGER NOT NULL,
+        max_id INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sync_tombstones (
+        tbl TEXT NOT NULL,
+        origin_site INTEGER NOT NULL,
+        origin_id INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        site INTEGER NOT NULL,
+        PRIMARY KEY (tbl, origin_site, origin_id)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sync_peers (
+        site INTEGER PRIMARY KEY,
+        received_seq INTEGER NOT NULL DEFAULT 0,
+        synced_at TEXT
+    )
+    """,
+    replication.start_log,
+    *[trigger for table in replication.TABLES for trigger in replication.log_triggers(table)],
+]
+
+# Ordered (version, description, statements); append new entries to ship schema changes
+MIGRATIONS = [
+    (1, "base schema", BASE_SCHEMA),
+    (2, "hot path indexes", HOT_PATH_INDEXES),
+    (3, "appointment paging indexes", APPOINTMENT_PAGING_INDEXES),
+    (4, "import progress", IMPORT_PROGRESS),
+    (5, "reporting indexes", REPORTING_INDEXES),
+    (6, "hash passwords", HASH_PASSWORDS),
+    (7, "appointment slots", APPOINTMENT_SLOTS),
+    (8, "payment ledger", PAYMENT_LEDGER),
+    (9, "coverage summary", COVERAGE_SUMMARY),
+    (10, "dose schedule", DOSE_SCHEDULE),
+    (11, "child search", CHILD_SEARCH),
+    (12, "change log", CHANGE_LOG),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def is_current(conn=None):
+    return schema_version(conn or db.connection()) >= LATEST_VERSION
+
+
+def migrate(conn=None):
+    conn = conn or db.connection()
+    current = schema_version(conn)
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        applied.append((version, description))
+    return applied
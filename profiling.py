@@ -0,0 +1,244 @@
+import atexit
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# Off unless CVMS_PROFILE is set (or enable() is called before the first connection
+# opens); when off, connections are plain sqlite3 ones and nothing is wrapped
+SLOW_QUERY_MS = 50.0
+SLOW_QUERY_LOG_SIZE = 50
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+log = logging.getLogger("cvms.profiling")
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.statements = 0
+        self.slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+    def reset(self):
+        with self.lock:
+            self.timings = {}
+            self.statements = 0
+            self.slow_queries.clear()
+
+    def record(self, kind, name, seconds):
+        with self.lock:
+            entry = self.timings.get((kind, name))
+            if entry is None:
+                self.timings[(kind, name)] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+
+    def count_statement(self, _sql):
+        # Trace callback: sees every statement SQLite runs, including those inside triggers
+        with self.lock:
+            self.statements += 1
+
+    def slow_query(self, sql, ms, plan):
+        with self.lock:
+            self.slow_queries.append({"sql": sql, "ms": round(ms, 3), "plan": plan,
+                                      "at": datetime.now().isoformat(timespec="seconds")})
+
+    def snapshot(self):
+        """Rows of (kind, name, count, total ms, avg ms, max ms), slowest total first."""
+        with self.lock:
+            rows = [(kind, name, count, total * 1000, total * 1000 / count, worst * 1000)
+                    for (kind, name), (count, total, worst) in self.timings.items()]
+            return sorted(rows, key=lambda row: row[3], reverse=True)
+
+    def to_dict(self):
+        with self.lock:
+            statements, slow = self.statements, list(self.slow_queries)
+        return {
+            "written_at": datetime.now().isoformat(timespec="seconds"),
+            "statements": statements,
+            "timings": [dict(zip(("kind", "name", "count", "total_ms", "avg_ms", "max_ms"), row))
+                        for row in self.snapshot()],
+            "slow_queries": slow,
+        }
+
+
+metrics = Metrics()
+_enabled = False
+_slow_ms = SLOW_QUERY_MS
+_metrics_path = None
+
+
+def enable(slow_ms=None, metrics_path=None):
+    global _enabled, _slow_ms, _metrics_path
+    _enabled = True
+    if slow_ms is not None:
+        _slow_ms = slow_ms
+    if metrics_path and _metrics_path is None:
+        atexit.register(lambda: write_metrics(_metrics_path))
+    _metrics_path = metrics_path or _metrics_path
+
+
+def enabled():
+    return _enabled
+
+
+def write_metrics(path=None):
+    path = path or _metrics_path
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(metrics.to_dict(), f, indent=2)
+    return path
+
+
+def _first_line(sql):
+    return " ".join(sql.split())[:200]
+
+
+def _explain(conn, sql, params):
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    try:
+        rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error:
+        return []
+    return [row[-1] for row in rows]
+
+
+def _finish(conn, sql, params, started):
+    elapsed = time.perf_counter() - started
+    name = _first_line(sql)
+    metrics.record("query", name, elapsed)
+    ms = elapsed * 1000
+    if ms >= _slow_ms:
+        plan = _explain(conn, sql, params) if params is not None else []
+        metrics.slow_query(name, ms, plan)
+        log.warning("slow query (%.1f ms): %s\n  %s", ms, name, "\n  ".join(plan))
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    # Fetch time is charged to the statement that produced the rows
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._sql = sql
+            _finish(self.connection, sql, parameters, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._sql = sql
+            _finish(self.connection, sql, None, started)
+
+    def _fetch(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            sql = getattr(self, "_sql", None)
+            if sql is not None:
+                metrics.record("query", _first_line(sql), time.perf_counter() - started)
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, size or self.arraysize)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(metrics.count_statement)
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    # Connection.execute builds its cursor in C, bypassing cursor(), so route it explicitly
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_factory():
+    return ProfiledConnection if _enabled else sqlite3.Connection
+
+
+def timed(kind, name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.record(kind, name, time.perf_counter() - started)
+    return wrapper
+
+
+def instrument(cls, names=None, kind="handler"):
+    """Time the given methods of cls (default: every public one). Does nothing unless enabled."""
+    if not _enabled:
+        return cls
+    if names is None:
+        names = [name for name, value in vars(cls).items() if callable(value) and not name.startswith("_")]
+    for name in names:
+        setattr(cls, name, timed(kind, f"{cls.__name__}.{name}", getattr(cls, name)))
+    return cls
+
+
+def show_panel(root, refresh_ms=1000):
+    # Imported here so the CLIs can use this module without a display
+    import tkinter as tk
+    from tkinter import ttk
+
+    panel = tk.Toplevel(root)
+    panel.title("Profiling")
+    columns = ("Kind", "Name", "Count", "Total ms", "Avg ms", "Max ms")
+    tree = ttk.Treeview(panel, columns=columns, show="headings", height=20)
+    for column in columns:
+        tree.heading(column, text=column)
+        tree.column(column, width=400 if column == "Name" else 80, anchor=tk.W if column in ("Kind", "Name") else tk.E)
+    tree.pack(fill=tk.BOTH, expand=True)
+    summary = tk.Label(panel, anchor=tk.W)
+    summary.pack(fill=tk.X)
+
+    def refresh():
+        if not panel.winfo_exists():
+            return
+        tree.delete(*tree.get_children())
+        for kind, name, count, total, avg, worst in metrics.snapshot():
+            tree.insert("", tk.END, values=(kind, name, count, f"{total:.1f}", f"{avg:.2f}", f"{worst:.2f}"))
+        summary.config(text=f"{metrics.statements} statements run, {len(metrics.slow_queries)} slow queries "
+                            f"(>= {_slow_ms:g} ms)")
+        root.after(refresh_ms, refresh)
+
+    def save():
+        path = write_metrics() or write_metrics("cvms-metrics.json")
+        summary.config(text=f"Metrics written to {path}")
+
+    buttons = tk.Frame(panel)
+    buttons.pack(fill=tk.X)
+    tk.Button(buttons, text="Reset", command=metrics.reset).pack(side=tk.LEFT, padx=5, pady=5)
+    tk.Button(buttons, text="Save Metrics", command=save).pack(side=tk.LEFT, padx=5, pady=5)
+    refresh()
+    return panel
+
+
+if os.environ.get("CVMS_PROFILE"):
+    enable(float(os.environ.get("CVMS_PROFILE_SLOW_MS", SLOW_QUERY_MS)), os.environ.get("CVMS_METRICS"))
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import repository
+
+REFERENCE_TTL_SECONDS = 10 * 60
+REFERENCE_CACHE_SIZE = 128
+
+
+@dataclass(frozen=True)
+class Vaccine:
+    id: int
+    name: str
+    age_months: Optional[int]
+
+
+@dataclass(frozen=True)
+class Hospital:
+    id: int
+    name: str
+
+
+@dataclass(frozen=True)
+class HealthWorker:
+    id: int
+    hospital_id: int
+    name: str
+    username: str
+
+
+class ReferenceCache:
+    """Process-wide cache for lookup tables that rarely change.
+
+    Entries expire after ``ttl`` seconds and the least recently used one is
+    dropped once ``max_size`` is reached. Writers call ``invalidate()`` after
+    committing; a load that was already running when that happened is not
+    stored, so a stale result never outlives the write.
+    """
+
+    def __init__(self, ttl=REFERENCE_TTL_SECONDS, max_size=REFERENCE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.entries.pop(key, None)
+            self.misses += 1
+            generation = self.generation
+        # Loaded outside the lock so a slow query does not block other lookups
+        value = load()
+        with self.lock:
+            if generation == self.generation:
+                self.entries[key] = (value, time.monotonic() + self.ttl)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self, *keys):
+        with self.lock:
+            self.generation += 1
+            if not keys:
+                self.entries.clear()
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+
+cache = ReferenceCache()
+
+
+def vaccines():
+    return cache.get("vaccines", lambda: tuple(Vaccine(*row) for row in repository.list_vaccines()))
+
+
+def hospitals():
+    return cache.get("hospitals", lambda: tuple(Hospital(*row) for row in repository.list_hospitals()))
+
+
+def health_workers(hospital_id):
+    return cache.get(("health_workers", hospital_id),
+                     lambda: tuple(HealthWorker(*row) for row in repository.list_health_workers(hospital_id)))
+
+
+# Write-through hooks, called by the services after the write has committed
+def hospital_added():
+    cache.invalidate("hospitals")
+
+
+def health_worker_added(hospital_id):
+    cache.invalidate(("health_workers", hospital_id))
@@ -0,0 +1,30 @@
+import calendar
+from dataclasses import dataclass
+from datetime import date
+
+# A dose becomes overdue this many days after its recommended date
+OVERDUE_AFTER_DAYS = 30
+
+
+@dataclass(frozen=True)
+class Reminder:
+    child_id: int
+    child_name: str
+    vaccine_id: int
+    vaccine_name: str
+    age_months: int
+    due_date: date
+    overdue: bool
+
+    def message(self):
+        text = f"{self.child_name} is due for {self.vaccine_name} (Recommended at {self.age_months} months)"
+        if self.overdue:
+            text += f" - overdue since {self.due_date.isoformat()}"
+        return text
+
+
+def add_months(day, months):
+    month_index = day.month - 1 + months
+    year = day.year + month_index // 12
+    month = month_index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
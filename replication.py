@@ -0,0 +1,377 @@
+import json
+import os
+import secrets
+import sqlite3
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+
+# Change data capture for multi-site sync. Migration 12's triggers append a row to
+# `changes` for every write to a replicated table, stamped with a Lamport version and
+# the site that made the write. A batch carries the current state of every row touched
+# in a range of the log; the receiver keeps, per row, whichever write has the greatest
+# (version, site), so every site converges whatever order batches arrive in.
+#
+# Row ids are per database, so batches name rows by a global key [origin site, id on
+# that site]. sync_keys maps the keys of rows that arrived from elsewhere to local ids;
+# rows made here, or present when this database was cloned (sync_bases), need no entry.
+# Every database draws its own random site id when migration 12 runs, so separately
+# installed sites never share one; a copy of a site's file is made with clone().
+FORMAT = 1
+BATCH_SIZE = 2000
+MAX_SITE_ID = 2 ** 31 - 1
+
+# Replicated tables in dependency order, each with its foreign keys and the unique
+# (natural) keys a row from another site is merged on instead of inserted twice; a
+# trailing "?" marks a key column in which NULL counts as a value. vaccine_prices
+# stays per site.
+TABLES = {
+    "parents": ({}, [("username",)]),
+    "hospitals": ({}, [("username",)]),
+    "health_workers": ({"hospital_id": "hospitals"}, [("username",)]),
+    "vaccines": ({}, [("name",), ("series", "dose_number")]),
+    "children": ({"parent_id": "parents"}, []),
+    "settlements": ({}, []),
+    "appointment_slots": ({"hospital_id": "hospitals", "health_worker_id": "health_workers"},
+                          [("hospital_id", "slot_date", "start_time", "health_worker_id?")]),
+    "vaccine_records": ({"child_id": "children", "vaccine_id": "vaccines", "hospital_id": "hospitals",
+                         "health_worker_id": "health_workers", "slot_id": "appointment_slots"},
+                        [("child_id", "vaccine_id")]),
+    "payments": ({"vaccine_record_id": "vaccine_records", "settlement_id": "settlements"},
+                 [("vaccine_record_id",), ("idempotency_key",)]),
+}
+TABLE_ORDER = {table: position for position, table in enumerate(TABLES)}
+# Rows that predate the change log lose to any logged write
+UNVERSIONED = (-1, -1)
+
+
+class SyncError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class SyncResult:
+    source: int
+    after: int
+    to: int
+    applied: int
+    skipped: int
+
+
+def log_triggers(table):
+    """The three CDC triggers for one table (migration step SQL)."""
+    triggers = []
+    for event, row, op in (("INSERT", "NEW", "I"), ("UPDATE", "NEW", "U"), ("DELETE", "OLD", "D")):
+        triggers.append(f"""
+        CREATE TRIGGER IF NOT EXISTS cdc_{table}_{event.lower()} AFTER {event} ON {table} BEGIN
+            UPDATE sync_state SET clock = clock + 1 WHERE applying_site IS NULL;
+            INSERT INTO changes (tbl, row_id, op, version, site)
+            SELECT '{table}', {row}.id, '{op}', IFNULL(applying_version, clock), IFNULL(applying_site, site_id)
+            FROM sync_state;
+        END
+        """)
+    return triggers
+
+
+def encode(batch):
+    return zlib.compress(json.dumps(batch, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def decode(data):
+    try:
+        batch = json.loads(zlib.decompress(data).decode("utf-8"))
+    except (zlib.error, ValueError) as e:
+        raise SyncError(f"Unreadable batch: {e}")
+    if batch.get("format") != FORMAT:
+        raise SyncError(f"Unsupported batch format {batch.get('format')}")
+    return batch
+
+
+def site_id(conn):
+    return conn.execute("SELECT site_id FROM sync_state").fetchone()[0]
+
+
+def known_sites(conn):
+    """Every site id this database has heard of, its own included."""
+    return {row[0] for row in conn.execute("""
+        SELECT site_id FROM sync_state UNION SELECT site FROM sync_peers UNION SELECT DISTINCT site FROM changes
+        UNION SELECT DISTINCT origin_site FROM sync_keys UNION SELECT site FROM sync_bases
+        UNION SELECT DISTINCT origin_site FROM sync_tombstones
+    """)}
+
+
+def new_site_id(taken=()):
+    while True:
+        site = secrets.randbelow(MAX_SITE_ID) + 1
+        if site not in taken:
+            return site
+
+
+def start_log(conn):
+    """Migration step: draw this database's site id and log each existing row as an insert by it.
+
+    Without the backfill, rows written before the change log existed would never reach
+    another site. They all get version 1; any later write outranks them.
+    """
+    conn.execute("UPDATE sync_state SET site_id = ? WHERE site_id = 0", (new_site_id(),))
+    site = site_id(conn)
+    for table in TABLES:
+        conn.execute(f"INSERT INTO changes (tbl, row_id, op, version, site) SELECT ?, id, 'I', 1, ? FROM {table} ORDER BY id",
+                     (table, site))
+    conn.execute("UPDATE sync_state SET clock = MAX(clock, 1)")
+
+
+def token(conn, source):
+    """How far into source's change log this database has applied (the resume token)."""
+    row = conn.execute("SELECT received_seq FROM sync_peers WHERE site = ?", (source,)).fetchone()
+    return row[0] if row else 0
+
+
+class KeyMap:
+    """Translates between local row ids and global [site, id] keys for one connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.site = site_id(conn)
+        self.bases = {tbl: (site, max_id) for tbl, site, max_id
+                      in conn.execute("SELECT tbl, site, max_id FROM sync_bases")}
+
+    def to_global(self, table, row_id):
+        row = self.conn.execute("SELECT origin_site, origin_id FROM sync_keys WHERE tbl = ? AND row_id = ? AND alias = 0",
+                                (table, row_id)).fetchone()
+        if row is not None:
+            return list(row)
+        base = self.bases.get(table)
+        if base is not None and row_id <= base[1]:
+            return [base[0], row_id]
+        return [self.site, row_id]
+
+    def to_local(self, table, key):
+        origin_site, origin_id = key
+        row = self.conn.execute("SELECT row_id FROM sync_keys WHERE tbl = ? AND origin_site = ? AND origin_id = ?",
+                                (table, origin_site, origin_id)).fetchone()
+        if row is not None:
+            return row[0]
+        base = self.bases.get(table)
+        if base is not None and origin_site == base[0] and origin_id <= base[1]:
+            return origin_id
+        if origin_site == self.site and (base is None or origin_id > base[1]):
+            return origin_id
+        return None
+
+    def remember(self, table, key, row_id, alias=False):
+        self.conn.execute("""
+            INSERT INTO sync_keys (tbl, origin_site, origin_id, row_id, alias) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT DO NOTHING
+        """, (table, key[0], key[1], row_id, alias))
+
+
+def clone(conn, path, new_site=None):
+    """Copy the database behind conn to a new file at path that syncs as a site of its own.
+
+    The copy starts with every row and the whole log, so from then on the two only
+    exchange what changes. Returns the copy's site id: new_site, or a random unused one.
+    """
+    taken = known_sites(conn)
+    if new_site is None:
+        new_site = new_site_id(taken)
+    elif not 0 < new_site <= MAX_SITE_ID or new_site in taken:
+        raise SyncError(f"Site id {new_site} is invalid or already known to this database")
+    if os.path.exists(path):
+        raise SyncError(f"{path} already exists")
+    target = sqlite3.connect(path)
+    try:
+        conn.backup(target)
+        with target:
+            _take_site_id(target, new_site)
+    finally:
+        target.close()
+    return new_site
+
+
+def _take_site_id(conn, new_site):
+    # Only ever run on a copy nobody has written to yet (see clone). Rows already present
+    # keep the global keys they had under the old id: the first time through that is a
+    # per-table id watermark, after that explicit sync_keys. The copy already holds the
+    # old site's whole log, so its token for it starts there.
+    old_site = site_id(conn)
+    for table in TABLES:
+        max_id = conn.execute(f"SELECT IFNULL(MAX(id), 0) FROM {table}").fetchone()[0]
+        base = conn.execute("SELECT max_id FROM sync_bases WHERE tbl = ?", (table,)).fetchone()
+        if base is None:
+            conn.execute("INSERT INTO sync_bases (tbl, site, max_id) VALUES (?, ?, ?)", (table, old_site, max_id))
+        else:
+            conn.execute(f"""
+                INSERT INTO sync_keys (tbl, origin_site, origin_id, row_id, alias)
+                SELECT ?, ?, id, id, 0 FROM {table}
+                WHERE id > ? AND NOT EXISTS (SELECT 1 FROM sync_keys k WHERE k.tbl = ? AND k.row_id = {table}.id)
+            """, (table, old_site, base[0], table))
+    conn.execute("UPDATE sync_state SET site_id = ?", (new_site,))
+    conn.execute("""
+        INSERT INTO sync_peers (site, received_seq) SELECT ?, IFNULL(MAX(seq), 0) FROM changes WHERE true
+        ON CONFLICT DO UPDATE SET received_seq = MAX(received_seq, excluded.received_seq)
+    """, (old_site,))
+
+
+def export_batch(conn, peer, after=0, limit=BATCH_SIZE):
+    """The next batch for peer: current state of rows touched in changes (after, to].
+
+    Rows that peer created and wrote last are left out, so a round trip does not
+    echo a site's own changes back to it. Rows it merely wrote last still go: a row
+    merged on a natural key is known to peer under its other key only after this.
+    """
+    keys = KeyMap(conn)
+    last = conn.execute("SELECT seq FROM changes WHERE seq > ? ORDER BY seq LIMIT 1 OFFSET ?",
+                        (after, limit - 1)).fetchone()
+    to = last[0] if last else max(after, conn.execute("SELECT IFNULL(MAX(seq), 0) FROM changes").fetchone()[0])
+    touched = conn.execute("""
+        SELECT t.tbl, t.row_id, t.first_seq, c.version, c.site
+        FROM (SELECT tbl, row_id, MIN(seq) AS first_seq FROM changes WHERE seq > ? AND seq <= ? GROUP BY tbl, row_id) t
+        JOIN changes c ON c.seq = (SELECT MAX(seq) FROM changes WHERE tbl = t.tbl AND row_id = t.row_id)
+    """, (after, to)).fetchall()
+    # Referenced rows first (table order), then log order within a table
+    touched.sort(key=lambda row: (TABLE_ORDER.get(row[0], len(TABLE_ORDER)), row[2]))
+    changes = []
+    for table, row_id, _, version, site in touched:
+        if table not in TABLES:
+            continue
+        key = keys.to_global(table, row_id)
+        if site == peer and key[0] == peer:
+            continue
+        foreign_keys = TABLES[table][0]
+        cursor = conn.execute(f"SELECT * FROM {table} WHERE id = ?", (row_id,))
+        values = cursor.fetchone()
+        row = None
+        if values is not None:
+            row = {column[0]: value for column, value in zip(cursor.description, values) if column[0] != "id"}
+            for column, target in foreign_keys.items():
+                if row.get(column) is not None:
+                    row[column] = keys.to_global(target, row[column])
+        changes.append([table, key, version, site, row])
+    return {"format": FORMAT, "source": keys.site, "after": after, "to": to, "changes": changes}
+
+
+def _natural_match(conn, table, row):
+    for key in TABLES[table][1]:
+        columns = [column.rstrip("?") for column in key]
+        values = [row.get(column) for column in columns]
+        if any(value is None for name, value in zip(key, values) if not name.endswith("?")):
+            continue
+        match = conn.execute(f"SELECT id FROM {table} WHERE " + " AND ".join(f"{c} IS ?" for c in columns),
+                             values).fetchone()
+        if match is not None:
+            return match[0]
+    return None
+
+
+def _current_version(conn, table, row_id):
+    row = conn.execute("SELECT version, site FROM changes WHERE tbl = ? AND row_id = ? ORDER BY seq DESC LIMIT 1",
+                       (table, row_id)).fetchone()
+    return tuple(row) if row else UNVERSIONED
+
+
+def _apply_change(conn, keys, table, key, version, site, row):
+    if table not in TABLES:
+        raise SyncError(f"Unknown table {table}")
+    if row is not None:
+        row = dict(row)
+        for column, target in TABLES[table][0].items():
+            if row.get(column) is not None:
+                local = keys.to_local(target, row[column])
+                if local is None:
+                    raise SyncError(f"{table} {key} refers to {target} {row[column]}, which has not arrived")
+                row[column] = local
+    local_id = keys.to_local(table, key)
+    if local_id is None:
+        tombstone = conn.execute("SELECT version, site FROM sync_tombstones WHERE tbl = ? AND origin_site = ? AND origin_id = ?",
+                                 (table, key[0], key[1])).fetchone()
+        if tombstone is not None and (version, site) <= tuple(tombstone):
+            return False
+        if row is None:
+            # Deleted before it ever got here; remember it so a stale copy relayed later stays deleted
+            conn.execute("""
+                INSERT INTO sync_tombstones (tbl, origin_site, origin_id, version, site) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT DO UPDATE SET version = excluded.version, site = excluded.site
+            """, (table, key[0], key[1], version, site))
+            return True
+        local_id = _natural_match(conn, table, row)
+        if local_id is not None:
+            # The same thing was created on both sides: one row, answering to both keys
+            keys.remember(table, key, local_id, alias=True)
+    if local_id is not None and (version, site) <= _current_version(conn, table, local_id):
+        return False
+
+    conn.execute("UPDATE sync_state SET applying_version = ?, applying_site = ?", (version, site))
+    if row is None:
+        conn.execute(f"DELETE FROM {table} WHERE id = ?", (local_id,))
+    elif local_id is None:
+        columns = list(row)
+        cursor = conn.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                              [row[c] for c in columns])
+        keys.remember(table, key, cursor.lastrowid)
+    elif conn.execute(f"SELECT 1 FROM {table} WHERE id = ?", (local_id,)).fetchone() is None:
+        # Deleted here by an older write; the newer one brings it back under the same id
+        columns = ["id", *row]
+        conn.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                     [local_id, *row.values()])
+    else:
+        conn.execute(f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in row)} WHERE id = ?",
+                     [*row.values(), local_id])
+    return True
+
+
+def apply_batch(conn, batch):
+    """Apply a decoded batch in one transaction and advance the resume token for its source.
+
+    Batches already applied are skipped; one that starts past the token would leave a
+    gap in the log and is refused.
+    """
+    source = batch["source"]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if source == site_id(conn):
+            raise SyncError(f"Batch comes from this site ({source})")
+        received = token(conn, source)
+        if batch["after"] > received:
+            raise SyncError(f"Batch starts at change {batch['after']} of site {source}, "
+                            f"but only {received} have been applied")
+        applied = skipped = 0
+        if batch["to"] > received:
+            keys = KeyMap(conn)
+            for table, key, version, site, row in batch["changes"]:
+                try:
+                    changed = _apply_change(conn, keys, table, key, version, site, row)
+                except sqlite3.IntegrityError as e:
+                    raise SyncError(f"{table} {key} conflicts with a local row: {e}")
+                applied += changed
+                skipped += not changed
+            top = max((change[2] for change in batch["changes"]), default=0)
+            conn.execute("UPDATE sync_state SET clock = MAX(clock, ?), applying_version = NULL, applying_site = NULL",
+                         (top,))
+            conn.execute("""
+                INSERT INTO sync_peers (site, received_seq, synced_at) VALUES (?, ?, ?)
+                ON CONFLICT DO UPDATE SET received_seq = excluded.received_seq, synced_at = excluded.synced_at
+            """, (source, batch["to"], datetime.now().isoformat(timespec="seconds")))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return SyncResult(source, batch["after"], max(received, batch["to"]), applied, skipped)
+
+
+def compact(conn):
+    """Drop log entries superseded by a later write to the same row; returns how many.
+
+    Exports only ever read a row's latest entry, so peers lose nothing, but a
+    peer far enough behind receives the row's current state rather than each step.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        removed = conn.execute("""
+            DELETE FROM changes WHERE seq < (SELECT MAX(seq) FROM changes c WHERE c.tbl = changes.tbl AND c.row_id = changes.row_id)
+        """).rowcount
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return removed
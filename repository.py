@@ -0,0 +1,194 @@
+import db
+
+USER_TABLES = {"Parent": "parents", "Hospital": "hospitals", "HealthWorker": "health_workers"}
+# Position of the password column in each table's SELECT * row
+PASSWORD_COLUMNS = {"Parent": 2, "Hospital": 3, "HealthWorker": 4}
+
+
+# Users; password arguments are credentials.hash_password() values
+def find_user(role, username):
+    table = USER_TABLES[role]
+    return db.query_one(f"SELECT * FROM {table} WHERE username = ?", (username,))
+
+
+def update_password(role, user_id, password_hash):
+    table = USER_TABLES[role]
+    db.execute(f"UPDATE {table} SET password = ? WHERE id = ?", (password_hash, user_id))
+
+
+def plaintext_passwords(role, after_id, limit):
+    # Rows written before passwords were hashed; see credentials.is_hashed
+    table = USER_TABLES[role]
+    return db.query_all(f"""
+        SELECT id, password FROM {table}
+        WHERE id > ? AND password IS NOT NULL AND password NOT GLOB 'scrypt$*' AND password NOT GLOB 'pbkdf2_sha256$*'
+        ORDER BY id LIMIT ?
+    """, (after_id, limit))
+
+
+def replace_plaintext_passwords(role, updates):
+    # (password_hash, user_id, plaintext); a password changed in the meantime is left alone
+    table = USER_TABLES[role]
+    with db.transaction() as cursor:
+        cursor.executemany(f"UPDATE {table} SET password = ? WHERE id = ? AND password = ?", updates)
+
+
+def add_parent(username, password_hash, name, contact):
+    return db.execute("INSERT INTO parents (username, password, name, contact) VALUES (?, ?, ?, ?)",
+                      (username, password_hash, name, contact))
+
+
+def add_hospital(username, password_hash, name):
+    return db.execute("INSERT INTO hospitals (username, password, name) VALUES (?, ?, ?)",
+                      (username, password_hash, name))
+
+
+def add_health_worker(hospital_id, name, username, password_hash):
+    return db.execute("INSERT INTO health_workers (hospital_id, name, username, password) VALUES (?, ?, ?, ?)",
+                      (hospital_id, name, username, password_hash))
+
+
+# Children
+def add_child(parent_id, name, dob):
+    return db.execute("INSERT INTO children (parent_id, name, dob) VALUES (?, ?, ?)",
+                      (parent_id, name, dob))
+
+
+def children_for_parent(parent_id):
+    return db.query_all("SELECT id, name, dob FROM children WHERE parent_id = ?", (parent_id,))
+
+
+def child_belongs_to(child_id, parent_id):
+    return db.query_one("SELECT 1 FROM children WHERE id = ? AND parent_id = ?", (child_id, parent_id)) is not None
+
+
+# Reference data; read through reference.py, which caches these
+def list_vaccines():
+    return db.query_all("SELECT id, name, age_months FROM vaccines ORDER BY age_months, id")
+
+
+def list_hospitals():
+    return db.query_all("SELECT id, name FROM hospitals ORDER BY name, id")
+
+
+def list_health_workers(hospital_id):
+    return db.query_all("SELECT id, hospital_id, name, username FROM health_workers WHERE hospital_id = ? ORDER BY name, id",
+                        (hospital_id,))
+
+
+# Appointments
+def schedule_record(cursor, child_id, vaccine_id, hospital_id, appointment_date, health_worker_id=None, slot_id=None):
+    # A child has one record per vaccine; booking again after a cancellation reuses it
+    cursor.execute("SELECT id FROM vaccine_records WHERE child_id = ? AND vaccine_id = ? AND status = 'Cancelled'",
+                   (child_id, vaccine_id))
+    row = cursor.fetchone()
+    if row is not None:
+        cursor.execute("""
+            UPDATE vaccine_records SET hospital_id = ?, health_worker_id = ?, date_administered = ?, status = ?, slot_id = ?
+            WHERE id = ?
+        """, (hospital_id, health_worker_id, appointment_date, "Scheduled", slot_id, row[0]))
+        return row[0]
+    cursor.execute("""
+        INSERT INTO vaccine_records (child_id, vaccine_id, hospital_id, health_worker_id, date_administered, status, slot_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (child_id, vaccine_id, hospital_id, health_worker_id, appointment_date, "Scheduled", slot_id))
+    return cursor.lastrowid
+
+
+def book_appointment(child_id, vaccine_id, hospital_id, appointment_date):
+    with db.immediate() as cursor:
+        return schedule_record(cursor, child_id, vaccine_id, hospital_id, appointment_date)
+
+
+# Keyset pagination: sortable columns map to indexed SQL expressions; ties break on vr.id
+APPOINTMENT_SORT_COLUMNS = {
+    "ID": "vr.id",
+    "Date": "vr.date_administered",
+    "Status": "vr.status",
+}
+PAGE_SIZE = 200
+
+
+def _appointment_page_clauses(sort, descending, after, status, date_from, date_to):
+    column = APPOINTMENT_SORT_COLUMNS[sort]
+    where, params = [], []
+    if status:
+        where.append("vr.status = ?")
+        params.append(status)
+    if date_from:
+        where.append("vr.date_administered >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("vr.date_administered <= ?")
+        params.append(date_to)
+    if after is not None:
+        where.append(f"({column}, vr.id) {'<' if descending else '>'} (?, ?)")
+        params.extend(after)
+    direction = "DESC" if descending else "ASC"
+    clause = "".join(f" AND {w}" for w in where)
+    return clause, params, f" ORDER BY {column} {direction}, vr.id {direction}"
+
+
+def appointments_for_parent(parent_id, sort="ID", descending=False, after=None, limit=PAGE_SIZE,
+                            status=None, date_from=None, date_to=None):
+    clause, params, order = _appointment_page_clauses(sort, descending, after, status, date_from, date_to)
+    return db.query_all("""
+        SELECT vr.id, c.name, v.name, h.name, vr.date_administered, vr.status, COALESCE(p.amount, vp.amount), p.status
+        FROM vaccine_records vr
+        JOIN children c ON vr.child_id = c.id
+        JOIN vaccines v ON vr.vaccine_id = v.id
+        JOIN hospitals h ON vr.hospital_id = h.id
+        LEFT JOIN payments p ON vr.id = p.vaccine_record_id
+        LEFT JOIN vaccine_prices vp ON vp.vaccine_id = vr.vaccine_id
+        WHERE c.parent_id = ?""" + clause + order + " LIMIT ?", (parent_id, *params, limit))
+
+
+def appointments_for_hospital(hospital_id, sort="ID", descending=False, after=None, limit=PAGE_SIZE,
+                              status=None, date_from=None, date_to=None):
+    clause, params, order = _appointment_page_clauses(sort, descending, after, status, date_from, date_to)
+    return db.query_all("""
+        SELECT vr.id, c.name, v.name, vr.date_administered, vr.status
+        FROM vaccine_records vr
+        JOIN children c ON vr.child_id = c.id
+        JOIN vaccines v ON vr.vaccine_id = v.id
+        WHERE vr.hospital_id = ?""" + clause + order + " LIMIT ?", (hospital_id, *params, limit))
+
+
+# Dose administration: equality on (hospital_id, status, date_administered) is a
+# single range of idx_vaccine_records_hospital_status
+DOSE_BATCH_SIZE = 500
+
+
+def dose_queue(hospital_id, day):
+    return db.query_all("""
+        SELECT vr.id, c.name, c.dob, v.name, s.start_time
+        FROM vaccine_records vr
+        JOIN children c ON vr.child_id = c.id
+        JOIN vaccines v ON vr.vaccine_id = v.id
+        LEFT JOIN appointment_slots s ON vr.slot_id = s.id
+        WHERE vr.hospital_id = ? AND vr.status = 'Scheduled' AND vr.date_administered = ?
+        ORDER BY s.start_time, vr.id
+    """, (hospital_id, day))
+
+
+def administer_doses(record_ids, hospital_id, health_worker_id, day):
+    # One UPDATE per batch; records that are not scheduled at this hospital are left alone
+    updated = 0
+    with db.transaction() as cursor:
+        for start in range(0, len(record_ids), DOSE_BATCH_SIZE):
+            batch = record_ids[start:start + DOSE_BATCH_SIZE]
+            cursor.execute(f"""
+                UPDATE vaccine_records SET status = 'Administered', health_worker_id = ?, date_administered = ?
+                WHERE id IN ({", ".join("?" * len(batch))}) AND hospital_id = ? AND status = 'Scheduled'
+            """, (health_worker_id, day, *batch, hospital_id))
+            updated += cursor.rowcount
+    return updated
+
+
+def record_vaccine_for_parent(record_id, parent_id):
+    row = db.query_one("""
+        SELECT vr.vaccine_id FROM vaccine_records vr JOIN children c ON c.id = vr.child_id
+        WHERE vr.id = ? AND c.parent_id = ?
+    """, (record_id, parent_id))
+    return row[0] if row else None
+
@@ -0,0 +1,189 @@
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+import db
+import repository
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Slot:
+    id: int
+    hospital_id: int
+    health_worker_id: Optional[int]
+    slot_date: str
+    start_time: str
+    capacity: int
+    booked: int
+
+
+SLOT_COLUMNS = "id, hospital_id, health_worker_id, slot_date, start_time, capacity, booked"
+
+
+def _now():
+    now = datetime.now()
+    return now.strftime("%Y-%m-%d"), now.strftime("%H:%M")
+
+
+def slot_times(open_time="09:00", close_time="17:00", minutes=30):
+    current = datetime.strptime(open_time, "%H:%M")
+    close = datetime.strptime(close_time, "%H:%M")
+    while current < close:
+        yield current.strftime("%H:%M")
+        current += timedelta(minutes=minutes)
+
+
+def create_slots(hospital_id, slot_date, start_times, capacity, health_worker_id=None):
+    # Existing slots for the same time are left alone, so re-running a day's setup is safe
+    rows = [(hospital_id, health_worker_id, slot_date, start, capacity) for start in start_times]
+    with db.transaction() as cursor:
+        cursor.executemany("""
+            INSERT OR IGNORE INTO appointment_slots (hospital_id, health_worker_id, slot_date, start_time, capacity)
+            VALUES (?, ?, ?, ?, ?)
+        """, rows)
+        return cursor.rowcount
+
+
+def has_slots(hospital_id):
+    return db.query_one("SELECT 1 FROM appointment_slots WHERE hospital_id = ? LIMIT 1", (hospital_id,)) is not None
+
+
+def next_available(hospital_id=None, after=None, limit=5):
+    slot_date, start_time = after or _now()
+    sql = f"SELECT {SLOT_COLUMNS} FROM appointment_slots WHERE booked < capacity AND (slot_date, start_time) >= (?, ?)"
+    params = [slot_date, start_time]
+    if hospital_id is not None:
+        sql += " AND hospital_id = ?"
+        params.append(hospital_id)
+    sql += " ORDER BY slot_date, start_time, id LIMIT ?"
+    params.append(limit)
+    return [Slot(*row) for row in db.query_all(sql, params)]
+
+
+def _take(cursor, slot_id):
+    # Conditional update: only succeeds while the slot still has room
+    cursor.execute("UPDATE appointment_slots SET booked = booked + 1 WHERE id = ? AND booked < capacity", (slot_id,))
+    return cursor.rowcount == 1
+
+
+def reserve(child_id, vaccine_id, hospital_id, slot_id=None, after=None):
+    """Book a slot (the given one, or the hospital's next open one) and its vaccine record atomically.
+
+    Returns (record_id, Slot). Raises SlotUnavailable when nothing is free
+    and sqlite3.IntegrityError when the child already has this vaccine booked
+    (a cancelled booking is reused instead).
+    """
+    slot_date, start_time = after or _now()
+    with db.immediate() as cursor:
+        if slot_id is None:
+            cursor.execute(f"""
+                SELECT {SLOT_COLUMNS} FROM appointment_slots
+                WHERE hospital_id = ? AND booked < capacity AND (slot_date, start_time) >= (?, ?)
+                ORDER BY slot_date, start_time, id LIMIT 1
+            """, (hospital_id, slot_date, start_time))
+        else:
+            cursor.execute(f"SELECT {SLOT_COLUMNS} FROM appointment_slots WHERE id = ? AND hospital_id = ?",
+                           (slot_id, hospital_id))
+        row = cursor.fetchone()
+        if row is None or not _take(cursor, row[0]):
+            raise SlotUnavailable("No free appointment slots at this hospital")
+        slot = Slot(*row[:6], row[6] + 1)
+        record_id = repository.schedule_record(cursor, child_id, vaccine_id, hospital_id, slot.slot_date,
+                                               slot.health_worker_id, slot.id)
+        return record_id, slot
+
+
+def cancel(record_id):
+    """Cancel a scheduled appointment and free its slot; False if it was not scheduled."""
+    with db.immediate() as cursor:
+        cursor.execute("SELECT slot_id FROM vaccine_records WHERE id = ? AND status = 'Scheduled'", (record_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return False
+        cursor.execute("UPDATE vaccine_records SET status = 'Cancelled', slot_id = NULL WHERE id = ?", (record_id,))
+        if row[0] is not None:
+            cursor.execute("UPDATE appointment_slots SET booked = booked - 1 WHERE id = ? AND booked > 0", (row[0],))
+        return True
+
+
+def stress_test(threads=16, bookings_per_thread=50, slots=20, capacity=10):
+    """Concurrent bookings against a scratch database; checks no slot is ever overbooked."""
+    import migrations
+
+    scratch = tempfile.mkdtemp(prefix="cvms-stress-")
+    pool = db.configure(os.path.join(scratch, "stress.db"), size=threads)
+    migrations.migrate()
+    hospital_id = db.execute("INSERT INTO hospitals (name, username, password) VALUES ('Stress', 'stress', '')")
+    vaccine_ids = [row[0] for row in db.query_all("SELECT id FROM vaccines")]
+    day = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    create_slots(hospital_id, day, [f"{9 + i // 2:02d}:{30 * (i % 2):02d}" for i in range(slots)], capacity)
+    children = threads * bookings_per_thread
+    with db.transaction() as cursor:
+        cursor.executemany("INSERT INTO children (parent_id, name, dob) VALUES (0, ?, '2025-01-01')",
+                           [(f"child {i}",) for i in range(children)])
+    first_child = db.query_one("SELECT MIN(id) FROM children")[0]
+
+    outcomes = {"booked": 0, "full": 0, "errors": 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        barrier.wait()
+        for n in range(bookings_per_thread):
+            child_id = first_child + index * bookings_per_thread + n
+            try:
+                reserve(child_id, vaccine_ids[n % len(vaccine_ids)], hospital_id, after=(day, "00:00"))
+                key = "booked"
+            except SlotUnavailable:
+                key = "full"
+            except sqlite3.Error:
+                key = "errors"
+            with lock:
+                outcomes[key] += 1
+        pool.release()
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    overbooked = db.query_one("SELECT COUNT(*) FROM appointment_slots WHERE booked > capacity")[0]
+    mismatched = db.query_one("""
+        SELECT COUNT(*) FROM appointment_slots s
+        WHERE s.booked != (SELECT COUNT(*) FROM vaccine_records vr WHERE vr.slot_id = s.id)
+    """)[0]
+    records = db.query_one("SELECT COUNT(*) FROM vaccine_records")[0]
+    db.close_all()
+
+    expected = min(children, slots * capacity)
+    print(f"{threads} threads x {bookings_per_thread} bookings in {elapsed:.2f}s "
+          f"({children / elapsed:,.0f} attempts/s): {outcomes}")
+    ok = (overbooked == 0 and mismatched == 0 and outcomes["errors"] == 0
+          and outcomes["booked"] == records == expected)
+    print("PASS" if ok else f"FAIL: overbooked={overbooked} mismatched={mismatched} records={records} "
+                            f"expected={expected}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrency stress test for slot reservation.")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--bookings", type=int, default=50, help="booking attempts per thread")
+    parser.add_argument("--slots", type=int, default=20)
+    parser.add_argument("--capacity", type=int, default=10)
+    args = parser.parse_args()
+    sys.exit(0 if stress_test(args.threads, args.bookings, args.slots, args.capacity) else 1)
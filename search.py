@@ -0,0 +1,138 @@
+import argparse
+import re
+import sqlite3
+import sys
+from dataclasses import dataclass
+from typing import Optional
+
+import db
+
+# child_search is an FTS5 index with one row per child (rowid = children.id) holding
+# the child's name and the parent's name and contact; migration 11's triggers keep it
+# in step with both tables. The prefix indexes make 2- and 3-character type-ahead
+# lookups index probes instead of a term scan.
+SEARCH_LIMIT = 20
+MIN_PREFIX = 2
+# Every match is ranked, and bm25 costs a little per matching row; a two-letter prefix
+# can match most of the registry, so registry-wide searches wait for a longer word
+REGISTRY_MIN_PREFIX = 3
+TOKENIZE = "unicode61 remove_diacritics 2"
+# Anything the unicode61 tokenizer would treat as a separator
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+@dataclass(frozen=True)
+class ChildMatch:
+    child_id: int
+    child_name: str
+    dob: str
+    parent_id: int
+    parent_name: Optional[str]
+    contact: Optional[str]
+
+
+MATCH_COLUMNS = "c.id, c.name, c.dob, c.parent_id, p.name, p.contact"
+INDEX_ROWS_SQL = """
+    SELECT c.id, c.name, p.name, p.contact FROM children c LEFT JOIN parents p ON p.id = c.parent_id
+"""
+
+
+def rebuild(conn):
+    # Migration step and repair tool: refill the index from the base tables
+    conn.execute("DELETE FROM child_search")
+    conn.execute(f"INSERT INTO child_search (rowid, child_name, parent_name, contact) {INDEX_ROWS_SQL}")
+
+
+def optimize(conn):
+    # Merges the index's b-trees into one; worth running after a bulk import
+    conn.execute("INSERT INTO child_search (child_search) VALUES ('optimize')")
+
+
+def match_expression(text, min_prefix=MIN_PREFIX):
+    """Turn typed text into an FTS5 query: every word must match as a prefix.
+
+    Words are quoted, so the user cannot write FTS5 syntax by accident. Returns None
+    when no word has at least min_prefix characters.
+    """
+    words = [word for word in _SEPARATORS.split(text.lower()) if word]
+    if not words or max(len(word) for word in words) < min_prefix:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def children(text, parent_id=None, limit=SEARCH_LIMIT):
+    """Children whose name, parent's name or parent's contact match every word of text, best first.
+
+    A bare number also matches the child with that ID, so the old lookup by ID keeps working.
+    Pass parent_id to search only that parent's children.
+    """
+    text = text.strip()
+    matches = []
+    if text.isdigit():
+        matches = db.query_all(f"""
+            SELECT {MATCH_COLUMNS} FROM children c LEFT JOIN parents p ON p.id = c.parent_id
+            WHERE c.id = ? AND (? IS NULL OR c.parent_id = ?)
+        """, (int(text), parent_id, parent_id))
+    if parent_id is None:
+        expression, scope, params = match_expression(text, REGISTRY_MIN_PREFIX), "", ()
+    else:
+        expression, scope, params = match_expression(text), "AND rowid IN (SELECT id FROM children WHERE parent_id = ?)", (parent_id,)
+    if expression is not None:
+        found = {row[0] for row in matches}
+        matches += [row for row in db.query_all(f"""
+            SELECT {MATCH_COLUMNS}
+            FROM (
+                SELECT rowid AS id, rank FROM child_search WHERE child_search MATCH ? {scope}
+                ORDER BY rank, rowid LIMIT ?
+            ) s
+            JOIN children c ON c.id = s.id
+            LEFT JOIN parents p ON p.id = c.parent_id
+            ORDER BY s.rank, c.id
+        """, (expression, *params, limit)) if row[0] not in found]
+    return [ChildMatch(*row) for row in matches[:limit]]
+
+
+def verify(conn):
+    """Index rows that disagree with the base tables (missing, stale or orphaned)."""
+    rows = conn.execute(f"""
+        SELECT * FROM ({INDEX_ROWS_SQL}) EXCEPT SELECT rowid, child_name, parent_name, contact FROM child_search
+    """).fetchall()
+    orphans = conn.execute("SELECT rowid FROM child_search WHERE rowid NOT IN (SELECT id FROM children)").fetchall()
+    return len(rows) + len(orphans)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search children, or maintain the child search index.")
+    parser.add_argument("command", choices=("find", "rebuild", "optimize", "verify"))
+    parser.add_argument("text", nargs="?", default="", help="what to search for (find)")
+    parser.add_argument("--limit", type=int, default=SEARCH_LIMIT)
+    parser.add_argument("--db", default=db.DB_PATH, help="database file")
+    args = parser.parse_args(argv)
+
+    import migrations
+
+    db.configure(args.db)
+    try:
+        migrations.migrate()
+        if args.command == "find":
+            for match in children(args.text, limit=args.limit):
+                print(f"{match.child_id:>8}  {match.child_name:<24}{match.dob:<12}{match.parent_name or '':<24}"
+                      f"{match.contact or ''}")
+        elif args.command == "verify":
+            mismatches = verify(db.connection())
+            print(f"{mismatches} mismatches")
+            return 1 if mismatches else 0
+        else:
+            with db.immediate() as cursor:
+                (rebuild if args.command == "rebuild" else optimize)(cursor.connection)
+            print("Rebuilt" if args.command == "rebuild" else "Optimized")
+    except sqlite3.Error as e:
+        print(f"Search failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
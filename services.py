@@ -0,0 +1,423 @@
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+
+import coverage_summary
+import credentials
+import dose_schedule
+import ledger
+import reference
+import repository
+import scheduling
+import search
+
+# Errors carry the title and message the UI shows; the HTTP server maps them to status codes
+class ServiceError(Exception):
+    title = "Error"
+    status = 400
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class ValidationError(ServiceError):
+    pass
+
+
+class AuthenticationError(ServiceError):
+    status = 401
+
+
+class PermissionDenied(ServiceError):
+    status = 403
+
+
+class ConflictError(ServiceError):
+    status = 409
+
+
+class DatabaseError(ServiceError):
+    title = "Database Error"
+    status = 500
+
+
+@dataclass(frozen=True)
+class User:
+    id: int
+    role: str
+    username: str
+    name: str
+    hospital_id: Optional[int] = None
+
+    @classmethod
+    def from_row(cls, role, row):
+        if role == "Parent":
+            return cls(row[0], role, row[1], row[3])
+        if role == "Hospital":
+            return cls(row[0], role, row[2], row[1], hospital_id=row[0])
+        return cls(row[0], role, row[3], row[2], hospital_id=row[1])
+
+
+@dataclass(frozen=True)
+class LoginRequest:
+    role: str
+    username: str
+    password: str
+
+
+@dataclass(frozen=True)
+class RegisterRequest:
+    role: str
+    username: str
+    password: str
+    name: str
+    contact: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class AddChildRequest:
+    parent_id: int
+    name: str
+    dob: str
+
+
+@dataclass(frozen=True)
+class AddHealthWorkerRequest:
+    hospital_id: int
+    name: str
+    username: str
+    password: str
+
+
+@dataclass(frozen=True)
+class BookingRequest:
+    parent_id: int
+    child_id: int
+    vaccine_id: int
+    hospital_id: int
+
+
+@dataclass(frozen=True)
+class Booking:
+    record_id: int
+    appointment_date: str
+    start_time: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class CreateSlotsRequest:
+    hospital_id: int
+    slot_date: str
+    open_time: str
+    close_time: str
+    minutes: int
+    capacity: int
+    health_worker_id: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class PaymentRequest:
+    parent_id: int
+    vaccine_record_id: int
+    idempotency_key: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class CancelRequest:
+    parent_id: int
+    vaccine_record_id: int
+
+
+@dataclass(frozen=True)
+class PaymentResult:
+    vaccine_record_id: int
+    amount: float
+    already_paid: bool
+
+
+@dataclass(frozen=True)
+class AppointmentQuery:
+    sort: str = "Date"
+    descending: bool = True
+    after: Optional[Tuple] = None
+    limit: int = repository.PAGE_SIZE
+    status: Optional[str] = None
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+
+
+def _today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def _database_error(context, e):
+    return DatabaseError(f"{context}: {str(e)}")
+
+
+def parse_id(value, message):
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise ValidationError(message)
+
+
+def validate_date(value):
+    try:
+        datetime.strptime(value or "", "%Y-%m-%d")
+    except ValueError:
+        raise ValidationError("Invalid date format (use YYYY-MM-DD)")
+    return value
+
+
+# Accounts
+def login(request):
+    if request.role not in repository.USER_TABLES:
+        raise ValidationError("Invalid role")
+    try:
+        row = credentials.authenticate(request.role, request.username, request.password)
+    except sqlite3.Error as e:
+        raise _database_error("Login failed", e)
+    if row is None:
+        raise AuthenticationError("Invalid username or password")
+    return User.from_row(request.role, row)
+
+
+def register(request):
+    if request.role not in ("Parent", "Hospital"):
+        raise ValidationError("Invalid role")
+    password_hash = credentials.hash_password(request.password)
+    try:
+        if request.role == "Parent":
+            return repository.add_parent(request.username, password_hash, request.name, request.contact)
+        hospital_id = repository.add_hospital(request.username, password_hash, request.name)
+    except sqlite3.IntegrityError:
+        raise ConflictError("Username already exists")
+    except sqlite3.Error as e:
+        raise _database_error("Registration failed", e)
+    reference.hospital_added()
+    return hospital_id
+
+
+def add_health_worker(request):
+    try:
+        worker_id = repository.add_health_worker(request.hospital_id, request.name, request.username,
+                                                 credentials.hash_password(request.password))
+    except sqlite3.IntegrityError:
+        raise ConflictError("Username already exists")
+    except sqlite3.Error as e:
+        raise _database_error("An error occurred", e)
+    reference.health_worker_added(request.hospital_id)
+    return worker_id
+
+
+# Children and reference data
+def add_child(request):
+    validate_date(request.dob)
+    try:
+        child_id = repository.add_child(request.parent_id, request.name, request.dob)
+        # Precompute the new child's due doses now rather than on the next read
+        dose_schedule.flush()
+    except sqlite3.Error as e:
+        raise _database_error("Failed to add child", e)
+    return child_id
+
+
+def list_children(parent_id):
+    try:
+        return repository.children_for_parent(parent_id)
+    except sqlite3.Error as e:
+        raise _database_error("Failed to load children", e)
+
+
+def booking_options():
+    try:
+        return reference.vaccines(), reference.hospitals()
+    except sqlite3.Error as e:
+        raise _database_error("Failed to load booking options", e)
+
+
+def warm_up():
+    """Load what the first screens after login read, so they do not wait on it."""
+    try:
+        reference.vaccines()
+        reference.hospitals()
+        ledger.prices.get(None)
+        dose_schedule.flush()
+    except sqlite3.Error as e:
+        raise _database_error("Failed to warm up", e)
+
+
+def hash_plaintext_passwords():
+    try:
+        return credentials.hash_plaintext_passwords()
+    except sqlite3.Error as e:
+        raise _database_error("Failed to upgrade passwords", e)
+
+
+def list_health_workers(hospital_id):
+    try:
+        return reference.health_workers(hospital_id)
+    except sqlite3.Error as e:
+        raise _database_error("Failed to load health workers", e)
+
+
+def search_children(user, text, limit=search.SEARCH_LIMIT):
+    # Parents search their own children; hospital staff search the whole registry
+    if user.role == "Parent":
+        parent_id = user.id
+    elif user.role in ("Hospital", "HealthWorker"):
+        parent_id = None
+    else:
+        raise PermissionDenied("Not allowed")
+    try:
+        return search.children(text, parent_id, limit)
+    except sqlite3.Error as e:
+        raise _database_error("Search failed", e)
+
+
+# Appointments
+def book_appointment(request):
+    # Hospitals that publish slots get the next free one; the rest keep same-day walk-ins
+    appointment_date = _today()
+    try:
+        if not repository.child_belongs_to(request.child_id, request.parent_id):
+            raise ValidationError("Invalid Child ID")
+        if scheduling.has_slots(request.hospital_id):
+            record_id, slot = scheduling.reserve(request.child_id, request.vaccine_id, request.hospital_id)
+            return Booking(record_id, slot.slot_date, slot.start_time)
+        record_id = repository.book_appointment(request.child_id, request.vaccine_id, request.hospital_id,
+                                                appointment_date)
+    except scheduling.SlotUnavailable as e:
+        raise ConflictError(str(e))
+    except sqlite3.IntegrityError:
+        raise ConflictError("This vaccine is already booked for the child")
+    except sqlite3.Error as e:
+        raise _database_error("Failed to book appointment", e)
+    return Booking(record_id, appointment_date)
+
+
+def cancel_appointment(request):
+    try:
+        if repository.record_vaccine_for_parent(request.vaccine_record_id, request.parent_id) is None:
+            raise ValidationError("Invalid Appointment ID")
+        cancelled = scheduling.cancel(request.vaccine_record_id)
+    except sqlite3.Error as e:
+        raise _database_error("Failed to cancel appointment", e)
+    if not cancelled:
+        raise ConflictError("Only scheduled appointments can be cancelled")
+    return request.vaccine_record_id
+
+
+def create_slots(request):
+    validate_date(request.slot_date)
+    try:
+        times = list(scheduling.slot_times(request.open_time, request.close_time, request.minutes))
+    except ValueError:
+        raise ValidationError("Invalid time format (use HH:MM)")
+    if request.minutes <= 0 or request.capacity <= 0 or not times:
+        raise ValidationError("Interval and capacity must be positive and the day must not be empty")
+    try:
+        return scheduling.create_slots(request.hospital_id, request.slot_date, times, request.capacity,
+                                       request.health_worker_id)
+    except sqlite3.Error as e:
+        raise _database_error("Failed to create slots", e)
+
+
+def upcoming_slots(hospital_id, limit=50):
+    try:
+        return scheduling.next_available(hospital_id, limit=limit)
+    except sqlite3.Error as e:
+        raise _database_error("Failed to load slots", e)
+
+
+def appointments_page(user, query):
+    fetch = repository.appointments_for_parent if user.role == "Parent" else repository.appointments_for_hospital
+    if user.role == "Parent":
+        owner_id = user.id
+    elif user.hospital_id is not None:
+        owner_id = user.hospital_id
+    else:
+        raise PermissionDenied("Not allowed")
+    if query.sort not in repository.APPOINTMENT_SORT_COLUMNS:
+        raise ValidationError("Invalid sort column")
+    for value in (query.date_from, query.date_to):
+        if value:
+            validate_date(value)
+    try:
+        return fetch(owner_id, sort=query.sort, descending=query.descending, after=query.after, limit=query.limit,
+                     status=query.status, date_from=query.date_from, date_to=query.date_to)
+    except sqlite3.Error as e:
+        raise _database_error("Failed to load appointments", e)
+
+
+def _require_health_worker(user):
+    if user.role != "HealthWorker" or user.hospital_id is None:
+        raise PermissionDenied("Only health workers can administer doses")
+
+
+# Dose administration
+def dose_queue(user):
+    _require_health_worker(user)
+    try:
+        return repository.dose_queue(user.hospital_id, _today())
+    except sqlite3.Error as e:
+        raise _database_error("Failed to load today's doses", e)
+
+
+def administer_doses(user, record_ids):
+    """Mark scheduled doses as given; returns how many were still scheduled at the worker's hospital."""
+    _require_health_worker(user)
+    record_ids = sorted(set(record_ids))
+    if not record_ids:
+        return 0
+    try:
+        return repository.administer_doses(record_ids, user.hospital_id, user.id, _today())
+    except sqlite3.Error as e:
+        raise _database_error("Failed to record doses", e)
+
+
+# Coverage
+def hospital_coverage(user):
+    if user.role not in ("Hospital", "HealthWorker") or user.hospital_id is None:
+        raise PermissionDenied("Not allowed")
+    try:
+        # Only writes on the first read of a new day or after schedules changed
+        coverage_summary.roll_over()
+        return coverage_summary.hospital_summary(user.hospital_id)
+    except sqlite3.Error as e:
+        raise _database_error("Failed to load coverage", e)
+
+
+# Payments
+def make_payment(request):
+    try:
+        vaccine_id = repository.record_vaccine_for_parent(request.vaccine_record_id, request.parent_id)
+        if vaccine_id is None:
+            raise ValidationError("Invalid Appointment ID")
+        charge = ledger.charge(request.vaccine_record_id, vaccine_id, request.idempotency_key)
+    except sqlite3.IntegrityError:
+        raise ConflictError("Payment reference already used for another appointment")
+    except sqlite3.Error as e:
+        raise _database_error("Failed to process payment", e)
+    return PaymentResult(request.vaccine_record_id, charge.amount, not charge.created)
+
+
+# Reminders and due doses
+def reminders_for_parent(parent_id):
+    try:
+        return dose_schedule.reminders_for_parent(parent_id)
+    except sqlite3.Error as e:
+        raise _database_error("Failed to load reminders", e)
+
+
+def doses_due(user, start, end, after=None, limit=500):
+    if user.role not in ("Hospital", "HealthWorker"):
+        raise PermissionDenied("Not allowed")
+    validate_date(start)
+    validate_date(end)
+    try:
+        return dose_schedule.due_between(start, end, after, limit)
+    except sqlite3.Error as e:
+        raise _database_error("Failed to load due doses", e)
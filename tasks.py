@@ -0,0 +1,84 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_INTERVAL_MS = 15
+
+
+class Task:
+    def __init__(self, future, generation):
+        self.future = future
+        self.generation = generation
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        self.future.cancel()
+
+
+class TaskRunner:
+    """Runs blocking work on a thread pool and hands results back to Tk.
+
+    Callbacks always run on the Tk thread: workers push finished tasks onto
+    a queue that the UI drains with ``after()``. ``cancel_all()`` drops the
+    callbacks of everything submitted so far, which is what screen changes
+    want - results for a screen that is gone are discarded.
+    """
+
+    def __init__(self, root, max_workers=4):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cvms-worker")
+        self.results = queue.Queue()
+        self.generation = 0
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.polling = False
+
+    def submit(self, work, *args, on_success=None, on_error=None, on_done=None):
+        with self.lock:
+            generation = self.generation
+        future = self.executor.submit(work, *args)
+        task = Task(future, generation)
+        self.pending.add(task)
+        future.add_done_callback(lambda _: self.results.put((task, on_success, on_error, on_done)))
+        self._schedule_poll()
+        return task
+
+    def cancel_all(self):
+        with self.lock:
+            self.generation += 1
+        for task in list(self.pending):
+            task.cancel()
+        self.pending.clear()
+
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _schedule_poll(self):
+        if not self.polling:
+            self.polling = True
+            self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def _poll(self):
+        self.polling = False
+        while True:
+            try:
+                task, on_success, on_error, on_done = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.discard(task)
+            if task.cancelled or task.generation != self.generation or task.future.cancelled():
+                continue
+            if on_done:
+                on_done()
+            error = task.future.exception()
+            if error is not None:
+                if on_error:
+                    on_error(error)
+                else:
+                    raise error
+            elif on_success:
+                on_success(task.future.result())
+        if self.pending:
+            self._schedule_poll()
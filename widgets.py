@@ -0,0 +1,145 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+from datetime import datetime
+
+STATUS_CHOICES = ("All", "Scheduled", "Administered", "Cancelled")
+
+
+class PagedTreeview(tk.Frame):
+    """Treeview that loads rows lazily, one keyset page at a time.
+
+    ``fetch_page(sort=, descending=, after=, limit=, status=, date_from=, date_to=)``
+    must return rows whose first value is the record id; ``after`` is the
+    (sort value, id) pair of the last row already shown. With a ``runner``
+    (tasks.TaskRunner) pages are fetched off the Tk thread.
+    """
+
+    def __init__(self, master, columns, headings, fetch_page, sortable=("ID", "Date", "Status"),
+                 sort="Date", descending=True, page_size=200, format_row=None, runner=None, height=12):
+        super().__init__(master, bg="white")
+        self.columns = columns
+        self.fetch_page = fetch_page
+        self.sortable = sortable
+        self.sort = sort
+        self.descending = descending
+        self.page_size = page_size
+        self.format_row = format_row or (lambda row: row)
+        self.runner = runner
+        self.pending = None
+        self.filters = {"status": None, "date_from": None, "date_to": None}
+        self.last_row = None
+        self.exhausted = False
+        self.loading = False
+
+        self._build_filter_bar()
+        body = tk.Frame(self)
+        body.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(body, columns=columns, show="headings", height=height)
+        scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=lambda first, last: self._on_scroll(scrollbar, first, last))
+        for column, heading in zip(columns, headings):
+            if column in sortable:
+                self.tree.heading(column, text=heading, command=lambda c=column: self.sort_by(c))
+            else:
+                self.tree.heading(column, text=heading)
+            self.tree.column(column, width=95, stretch=True)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.reload()
+
+    def _build_filter_bar(self):
+        bar = tk.Frame(self, bg="white")
+        bar.pack(fill=tk.X, pady=5)
+        tk.Label(bar, text="From (YYYY-MM-DD)", bg="white").pack(side=tk.LEFT)
+        self.date_from_entry = tk.Entry(bar, width=11)
+        self.date_from_entry.pack(side=tk.LEFT, padx=2)
+        tk.Label(bar, text="To", bg="white").pack(side=tk.LEFT)
+        self.date_to_entry = tk.Entry(bar, width=11)
+        self.date_to_entry.pack(side=tk.LEFT, padx=2)
+        tk.Label(bar, text="Status", bg="white").pack(side=tk.LEFT)
+        self.status_var = tk.StringVar(value=STATUS_CHOICES[0])
+        tk.OptionMenu(bar, self.status_var, *STATUS_CHOICES).pack(side=tk.LEFT, padx=2)
+        tk.Button(bar, text="Filter", command=self.apply_filters, bg="#4a90e2", fg="white").pack(side=tk.LEFT, padx=5)
+
+    def apply_filters(self):
+        dates = []
+        for entry in (self.date_from_entry, self.date_to_entry):
+            value = entry.get().strip()
+            if value:
+                try:
+                    datetime.strptime(value, "%Y-%m-%d")
+                except ValueError:
+                    messagebox.showerror("Error", "Invalid date format (use YYYY-MM-DD)")
+                    return
+            dates.append(value or None)
+        status = self.status_var.get()
+        self.filters = {
+            "status": None if status == STATUS_CHOICES[0] else status,
+            "date_from": dates[0],
+            "date_to": dates[1],
+        }
+        self.reload()
+
+    def sort_by(self, column):
+        if column == self.sort:
+            self.descending = not self.descending
+        else:
+            self.sort, self.descending = column, False
+        self.reload()
+
+    def reload(self):
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+        self.loading = False
+        self.tree.delete(*self.tree.get_children())
+        self.last_row = None
+        self.exhausted = False
+        self.load_next_page()
+
+    def load_next_page(self):
+        if self.exhausted or self.loading:
+            return
+        self.loading = True
+        page = dict(sort=self.sort, descending=self.descending, after=self._after_key(),
+                    limit=self.page_size, **self.filters)
+        if self.runner is not None:
+            self.pending = self.runner.submit(lambda: self.fetch_page(**page), on_success=self.add_rows,
+                                              on_error=self._show_error, on_done=self._page_done)
+            return
+        try:
+            rows = self.fetch_page(**page)
+        except Exception as e:
+            self._show_error(e)
+            return
+        finally:
+            self.loading = False
+        self.add_rows(rows)
+
+    def _page_done(self):
+        self.pending = None
+        self.loading = False
+
+    def _show_error(self, e):
+        self.exhausted = True
+        message = getattr(e, "message", None) or f"Failed to load rows: {str(e)}"
+        messagebox.showerror(getattr(e, "title", "Database Error"), message)
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.tree.insert("", tk.END, values=self.format_row(row))
+        if rows:
+            self.last_row = rows[-1]
+        if len(rows) < self.page_size:
+            self.exhausted = True
+
+    def _after_key(self):
+        if self.last_row is None:
+            return None
+        return self.last_row[self.columns.index(self.sort)], self.last_row[0]
+
+    def _on_scroll(self, scrollbar, first, last):
+        scrollbar.set(first, last)
+        # Prefetch the next page once the view reaches the last tenth of the loaded rows
+        if float(last) >= 0.9 and not self.exhausted:
+            self.after_idle(self.load_next_page)